@@ -1,9 +1,18 @@
-from typing import Optional
-
-import requests
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Union
+from urllib.parse import parse_qsl, urlsplit
 
+from ScanWatch.Transport import HTTPTransport, Transport
 from ScanWatch.exceptions import APIException
+from ScanWatch.storage.ResponseCache import ResponseCache
+from ScanWatch.utils.KeyPool import APIKeyPool
+from ScanWatch.utils.RateLimiter import RateLimiter
+from ScanWatch.utils.RequestScheduler import RequestScheduler
 from ScanWatch.utils.enums import NETWORK
+from ScanWatch.utils.metrics import get_metrics
+from ScanWatch.utils.tracing import span
+from ScanWatch.utils.urls import set_api_key
 
 
 class Client:
@@ -30,21 +39,60 @@ class Client:
             "test": "https://api-testnet.polygonscan.com/api"
         }
     }
+    CACHEABLE_ACTIONS = ('txlist', 'txlistinternal', 'tokentx', 'tokennfttx')
+    BALANCE_MULTI_SIZE = 20  # maximum number of addresses of a balancemulti call
+    BLOCK_NUMBER_TTL = 60  # seconds before the last block number is fetched again
 
-    def __init__(self, api_token: str, nt_type: NETWORK, net: str = "main"):
+    def __init__(self, api_token: Union[str, List[str], APIKeyPool], nt_type: NETWORK, net: str = "main",
+                 response_cache: Optional[ResponseCache] = None, cache_confirmations: int = 100,
+                 cache_block_step: int = 100000, rate_limiter: Optional[RateLimiter] = None,
+                 transport: Optional[Transport] = None, scheduler: Optional[RequestScheduler] = None):
         """
 
 
-        :param api_token: token for the api
-        :type api_token: str
+        :param api_token: token for the api, or several tokens of the same network to spread the calls over
+        :type api_token: Union[str, List[str], APIKeyPool]
         :param nt_type: type of the network
         :type nt_type: NETWORK
         :param net: name of the network, used to differentiate main and test nets
         :type net: str, default 'main'
+        :param response_cache: cache for the results of the historical requests, None to disable the caching
+        :type response_cache: Optional[ResponseCache]
+        :param cache_confirmations: number of confirmations after which a block is considered immutable and
+            its transactions can be cached
+        :type cache_confirmations: int, default 100
+        :param cache_block_step: the cached block ranges end on a multiple of this step, so that the same
+            requests are made (and cached) from one run to another
+        :type cache_block_step: int, default 100000
+        :param rate_limiter: limiter to respect before each call to the API, can be shared between clients
+            using the same api token
+        :type rate_limiter: Optional[RateLimiter]
+        :param transport: transport used to send the requests, default to HTTP. A RecordingTransport or a
+            ReplayTransport can be given to record the API responses and replay them offline.
+        :type transport: Optional[Transport]
+        :param scheduler: scheduler giving the turns of the calls to the API by priority and by address, it
+            replaces the rate limiter and can be shared between clients using the same api token
+        :type scheduler: Optional[RequestScheduler]
         """
-        self.api_token = api_token
+        if isinstance(api_token, list):
+            api_token = APIKeyPool(api_token)
+        if isinstance(api_token, APIKeyPool):
+            self.key_pool = api_token
+            self.api_token = api_token.api_tokens[0]  # replaced by a token of the pool for each call
+        else:
+            self.key_pool = None
+            self.api_token = api_token
         self.nt_type = nt_type
         self.net = net
+        self.response_cache = response_cache
+        self.cache_confirmations = cache_confirmations
+        self.cache_block_step = cache_block_step
+        self.rate_limiter = rate_limiter
+        self.scheduler = scheduler
+        self.transport = transport if transport is not None else HTTPTransport()
+        self._metrics_network = f"{self.nt_type.name.lower()}_{self.net}"
+        self._block_number = None
+        self._block_number_time = 0
         self.get_url_request()  # test if network parameters are valid
 
     def get_mined_blocks(self, address: str, start_block: Optional[int] = None, end_block: Optional[int] = None):
@@ -65,7 +113,8 @@ class Client:
         except APIException:
             return []
 
-    def get_erc721_transactions(self, address: str, start_block: Optional[int] = None, end_block: Optional[int] = None):
+    def get_erc721_transactions(self, address: str, start_block: Optional[int] = None, end_block: Optional[int] = None,
+                                contract_address: Optional[str] = None):
         """
         fetch erc721 transactions on an address
 
@@ -75,12 +124,15 @@ class Client:
         :type start_block: Optional[int]
         :param end_block: fetch transactions until this block
         :type end_block: Optional[int]
+        :param contract_address: only fetch the transfers of this token contract
+        :type contract_address: Optional[str]
         :return: List of transactions
         :rtype: List[Dict]
         """
-        return self._get_transactions(address, 'tokennfttx', start_block, end_block)
+        return self._get_transactions(address, 'tokennfttx', start_block, end_block, contract_address)
 
-    def get_erc20_transactions(self, address: str, start_block: Optional[int] = None, end_block: Optional[int] = None):
+    def get_erc20_transactions(self, address: str, start_block: Optional[int] = None, end_block: Optional[int] = None,
+                               contract_address: Optional[str] = None):
         """
         fetch erc20 transactions on an address
 
@@ -90,6 +142,8 @@ class Client:
         :type start_block: Optional[int]
         :param end_block: fetch transactions until this block
         :type end_block: Optional[int]
+        :param contract_address: only fetch the transfers of this token contract
+        :type contract_address: Optional[str]
         :return: List of transactions
         :rtype: List[Dict]
 
@@ -118,7 +172,7 @@ class Client:
             ]
 
         """
-        return self._get_transactions(address, 'tokentx', start_block, end_block)
+        return self._get_transactions(address, 'tokentx', start_block, end_block, contract_address)
 
     def get_normal_transactions(self, address: str, start_block: Optional[int] = None, end_block: Optional[int] = None):
         """
@@ -176,9 +230,11 @@ class Client:
         return self._get_transactions(address, 'txlistinternal', start_block, end_block)
 
     def _get_transactions(self, address: str, action: str, start_block: Optional[int] = None,
-                          end_block: Optional[int] = None):
+                          end_block: Optional[int] = None, contract_address: Optional[str] = None):
         """
         fetch transactions on an address
+        If a response cache is set, the block range is split in two: the immutable part of the range is fetched
+        through the cache and only the recent part is requested to the API.
 
         :param address: address
         :type address: str
@@ -188,27 +244,73 @@ class Client:
         :type start_block: Optional[int]
         :param end_block: fetch transactions until this block
         :type end_block: Optional[int]
+        :param contract_address: only fetch the transfers of this token contract (token actions only)
+        :type contract_address: Optional[str]
+        :return: List of transactions
+        :rtype: List[Dict]
+        """
+        if self.response_cache is None or action not in self.CACHEABLE_ACTIONS:
+            return self._get_pages(address, action, start_block, end_block, contract_address=contract_address)
+        cache_end_block = self.get_cacheable_block_number()
+        if (start_block or 0) > cache_end_block:
+            return self._get_pages(address, action, start_block, end_block, contract_address=contract_address)
+        if end_block is not None and end_block <= cache_end_block:
+            return self._get_pages(address, action, start_block, end_block, use_cache=True,
+                                   contract_address=contract_address)
+        transactions = self._get_pages(address, action, start_block, cache_end_block, use_cache=True,
+                                       contract_address=contract_address)
+        transactions.extend(self._get_pages(address, action, cache_end_block + 1, end_block,
+                                            contract_address=contract_address))
+        return transactions
+
+    def _get_pages(self, address: str, action: str, start_block: Optional[int] = None,
+                   end_block: Optional[int] = None, use_cache: bool = False, contract_address: Optional[str] = None):
+        """
+        fetch all the pages of transactions on an address for a block range
+        The APIs do not return more than 10000 results for a request, whatever the page: when a page is full, the
+        next request starts at the last block of the page instead of asking for the next page. The transactions
+        of this last block are dropped from the full page, as some of them may be on the next one.
+
+        :param address: address
+        :type address: str
+        :param action: name of the request for the api (ex 'txlist' or 'txlistinternal')
+        :type action: str
+        :param start_block: fetch transactions starting with this block
+        :type start_block: Optional[int]
+        :param end_block: fetch transactions until this block
+        :type end_block: Optional[int]
+        :param use_cache: if the pages should be read from and saved in the response cache
+        :type use_cache: bool
+        :param contract_address: only fetch the transfers of this token contract (token actions only)
+        :type contract_address: Optional[str]
         :return: List of transactions
         :rtype: List[Dict]
         """
         offset = 10000
-        page_number = 1
         transactions = []
+        extra_params = {} if contract_address is None else {'contractaddress': contract_address}
         while True:
             url = self.get_url_request(module='account',
                                        action=action,
+                                       **extra_params,
                                        sort='asc',
                                        address=address,
                                        startblock=start_block,
                                        endblock=end_block,
-                                       page=page_number,
+                                       page=1,
                                        offset=offset)
-            batch_txs = self.get_result(url)
-            transactions.extend(batch_txs)
+            batch_txs = self.get_cached_result(url) if use_cache else self.request_result(url)
+            get_metrics().increment('scanwatch_rows_fetched_total', len(batch_txs),
+                                    network=self._metrics_network, action=action)
             if len(batch_txs) < offset:
+                transactions.extend(batch_txs)
                 break
-            else:
-                page_number += 1
+            last_block = int(batch_txs[-1]['blockNumber'])
+            if int(batch_txs[0]['blockNumber']) == last_block:
+                raise ValueError(f"more than {offset} {action} results for {address} in the block {last_block}, "
+                                 f"they can not be fetched from the API")
+            transactions.extend(tx for tx in batch_txs if int(tx['blockNumber']) < last_block)
+            start_block = last_block
         return transactions
 
     def get_balance(self, address: str) -> float:
@@ -225,7 +327,81 @@ class Client:
                                    address=address,
                                    tag='latest'
                                    )
-        return float(self.get_result(url))
+        return float(self.request_result(url))
+
+    def get_balances(self, addresses: List[str], max_workers: int = 4) -> Dict[str, int]:
+        """
+        fetch the current balances of several addresses, with one call per BALANCE_MULTI_SIZE addresses. The calls
+        are made concurrently, within the rate limit of the client. Raise a ValueError if the API leaves some of the
+        addresses out of its response.
+
+        :param addresses: addresses to fetch the balances of
+        :type addresses: List[str]
+        :param max_workers: maximum number of concurrent calls
+        :type max_workers: int, default 4
+        :return: balance in wei per address
+        :rtype: Dict[str, int]
+        """
+        addresses = list(dict.fromkeys(addresses))
+        chunks = [addresses[i:i + self.BALANCE_MULTI_SIZE] for i in range(0, len(addresses), self.BALANCE_MULTI_SIZE)]
+
+        def fetch(chunk: List[str]) -> List[Dict]:
+            url = self.get_url_request(module='account',
+                                       action='balancemulti',
+                                       address=','.join(chunk),
+                                       tag='latest'
+                                       )
+            return self.request_result(url)
+
+        if len(chunks) > 1 and max_workers > 1:
+            with ThreadPoolExecutor(min(max_workers, len(chunks))) as executor:
+                results = list(executor.map(fetch, chunks))
+        else:
+            results = [fetch(chunk) for chunk in chunks]
+
+        balances = {}
+        for result in results:
+            for entry in result:
+                balances[entry['account'].lower()] = int(entry['balance'])
+        missing = [address for address in addresses if address.lower() not in balances]
+        if len(missing):
+            raise ValueError(f"the API did not return the balances of the addresses {missing}")
+        return {address: balances[address.lower()] for address in addresses}
+
+    def get_block_number(self) -> int:
+        """
+        fetch the number of the most recent block
+
+        :return: block number
+        :rtype: int
+        """
+        url = self.get_url_request(module='proxy', action='eth_blockNumber')
+        return int(self.request_result(url), 16)
+
+    def get_cacheable_block_number(self) -> int:
+        """
+        Return the last block whose transactions can be cached: it has at least the number of confirmations
+        required and is aligned on the cache block step. The block number of the chain is refreshed at most
+        every BLOCK_NUMBER_TTL seconds, see get_recent_block_number.
+
+        :return: block number
+        :rtype: int
+        """
+        final_block = self.get_recent_block_number() - self.cache_confirmations
+        return (final_block // self.cache_block_step) * self.cache_block_step - 1
+
+    def get_recent_block_number(self) -> int:
+        """
+        Return the number of a recent block: the block number of the chain is fetched again only if it is older
+        than BLOCK_NUMBER_TTL seconds, so it can lag behind the most recent block
+
+        :return: block number
+        :rtype: int
+        """
+        if self._block_number is None or time.monotonic() - self._block_number_time > self.BLOCK_NUMBER_TTL:
+            self._block_number = self.get_block_number()
+            self._block_number_time = time.monotonic()
+        return self._block_number
 
     def get_url_request(self, **kwargs) -> str:
         """
@@ -244,19 +420,120 @@ class Client:
             raise ValueError(f"unknown network with type {self.nt_type} and name {self.net}") from err
         return f"{base_url}?{string_kws}"
 
+    def get_cached_result(self, url: str):
+        """
+        return the API result of an url from the response cache, call the API and save the result if it is not
+        cached yet
+
+        :param url: url to request
+        :type url: str
+        :return: API result
+        :rtype: depend of the endpoint
+        """
+        result = self.response_cache.get(url)
+        if result is None:
+            get_metrics().increment('scanwatch_cache_requests_total', result='miss')
+            result = self.request_result(url)
+            self.response_cache.set(url, result)
+        else:
+            get_metrics().increment('scanwatch_cache_requests_total', result='hit')
+        return result
+
     @staticmethod
     def get_result(url: str):
         """
         call the API with an url, raise if the status is not ok and return the API result
+        The call does not go through the response cache, the rate limit, the key pool nor the transport of a
+        client, see request_result.
 
         :param url: url to request
         :type url: str
         :return: API result
         :rtype: depend of the endpoint
         """
+        import requests  # imported on first use, as it is slow to import
+
         response = requests.get(url, headers={"User-Agent": "Mozilla/5.0"})
         response.raise_for_status()
-        r_json = response.json()
-        if int(r_json['status']) > 0 or r_json['message'] == 'No transactions found':
+        return Client._read_result(response, response.json())
+
+    def request_result(self, url: str):
+        """
+        call the API with an url within the rate limit of the client, raise if the status is not ok and return
+        the API result
+        If the client has several api tokens, the call is made with a token of the pool, and it is retried with
+        another token if the API replies with a rate limit or an invalid key error.
+
+        :param url: url to request
+        :type url: str
+        :return: API result
+        :rtype: depend of the endpoint
+        """
+        if self.key_pool is None:
+            return self._request(url)
+        attempt = 0
+        while True:
+            api_token = self.key_pool.acquire()
+            try:
+                return self._request(set_api_key(url, api_token))
+            except APIException as err:
+                if err.is_rate_limit:
+                    self.key_pool.report_rate_limit(api_token)
+                elif err.is_invalid_key:
+                    self.key_pool.report_invalid_key(api_token)
+                else:
+                    raise
+                attempt += 1
+                if attempt >= len(self.key_pool):
+                    raise
+                get_metrics().increment('scanwatch_api_retries_total', network=self._metrics_network)
+
+    def _request(self, url: str):
+        """
+        send a request to the API, raise if the status is not ok and return the API result
+
+        :param url: url to request
+        :type url: str
+        :return: API result
+        :rtype: depend of the endpoint
+        """
+        query = dict(parse_qsl(urlsplit(url).query))
+        if self.scheduler is not None:
+            self.scheduler.acquire(query.get('address', ''))
+        elif self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        metrics = get_metrics()
+        action = query.get('action', '')
+        with span("scanwatch.http", action=action):
+            start = time.perf_counter()
+            response = self.transport.get(url)
+            metrics.observe('scanwatch_api_request_seconds', time.perf_counter() - start,
+                            network=self._metrics_network, action=action)
+        response.raise_for_status()
+        with span("scanwatch.json_decode"):
+            r_json = response.json()
+        try:
+            return self._read_result(response, r_json)
+        except APIException as err:
+            metrics.increment('scanwatch_api_errors_total', network=self._metrics_network, action=action)
+            if err.is_rate_limit:
+                metrics.increment('scanwatch_api_rate_limited_total', network=self._metrics_network)
+            raise
+
+    @staticmethod
+    def _read_result(response, r_json: Dict):
+        """
+        return the result of a decoded API response, raise if its status is not ok
+
+        :param response: response of the API
+        :type response: requests.Response
+        :param r_json: decoded body of the response
+        :type r_json: Dict
+        :return: API result
+        :rtype: depend of the endpoint
+        """
+        if 'status' not in r_json and 'error' not in r_json:  # proxy endpoints follow the JSON-RPC format
+            return r_json['result']
+        if int(r_json.get('status', 0)) > 0 or r_json.get('message') == 'No transactions found':
             return r_json['result']
         raise APIException(response)
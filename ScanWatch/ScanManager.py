@@ -1,11 +1,20 @@
+import time
 from decimal import Decimal
-from typing import Dict, List
-
-from tqdm import tqdm
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
 from ScanWatch.Client import Client
+from ScanWatch.Transport import Transport
+from ScanWatch.storage.ResponseCache import ResponseCache
 from ScanWatch.storage.ScanDataBase import ScanDataBase
+from ScanWatch.storage.StorageEncoding import StorageEncoding
+from ScanWatch.storage.TransactionArchive import TransactionArchive
+from ScanWatch.utils.KeyPool import APIKeyPool
+from ScanWatch.utils.RateLimiter import RateLimiter
+from ScanWatch.utils.RequestScheduler import RequestScheduler
+from ScanWatch.utils.SingleFlight import SingleFlight
 from ScanWatch.utils.enums import NETWORK, TRANSACTION
+from ScanWatch.utils.metrics import get_metrics
+from ScanWatch.utils.tracing import span
 
 
 class ScanManager:
@@ -13,7 +22,16 @@ class ScanManager:
     This class is the interface between the user, the API and the Database
     """
 
-    def __init__(self, address: str, nt_type: NETWORK, api_token: str, net: str = "main"):
+    # updates in progress in this process, shared by all the managers
+    _update_flights = SingleFlight()
+
+    def __init__(self, address: str, nt_type: NETWORK, api_token: Union[str, List[str], APIKeyPool], net: str = "main",
+                 response_cache: Optional[ResponseCache] = None, finality_depth: Optional[int] = None,
+                 rate_limiter: Optional[RateLimiter] = None, concurrent_db: bool = False,
+                 transport: Optional[Transport] = None, storage_encoding: Optional[StorageEncoding] = None,
+                 shared_storage: bool = False, token_allowlist: Optional[List[str]] = None,
+                 token_denylist: Optional[List[str]] = None, scheduler: Optional[RequestScheduler] = None,
+                 change_log: bool = False, archive: Optional[TransactionArchive] = None, flow_index: bool = False):
         """
         Initiate the manager
 
@@ -21,38 +39,308 @@ class ScanManager:
         :type address: str
         :param nt_type: type of the network
         :type nt_type: NETWORK
-        :param api_token: token to communicate with the API
-        :type api_token: str
+        :param api_token: token to communicate with the API, or several tokens to spread the calls over
+        :type api_token: Union[str, List[str], APIKeyPool]
         :param net: name of the network, used to differentiate main and test nets
         :type net: str, default 'main'
+        :param response_cache: cache for the API results of the historical blocks, None to disable the caching
+        :type response_cache: Optional[ResponseCache]
+        :param finality_depth: number of confirmations after which a block is considered final. If provided, each
+            update will fetch again the non-final blocks and replace their transactions, to stay consistent
+            with chain reorganisations. If None, the updates only fetch the blocks after the last one recorded.
+        :type finality_depth: Optional[int]
+        :param rate_limiter: limiter for the calls to the API, to share between the managers using the same token
+        :type rate_limiter: Optional[RateLimiter]
+        :param concurrent_db: if the database is used by managers running in several threads, see DataBase
+        :type concurrent_db: bool
+        :param transport: transport of the client, see Client
+        :type transport: Optional[Transport]
+        :param storage_encoding: compact encoding of the transactions in the database, see StorageEncoding
+        :type storage_encoding: Optional[StorageEncoding]
+        :param shared_storage: if the transactions should be stored once for all the addresses, see ScanDataBase
+        :type shared_storage: bool
+        :param token_allowlist: contract addresses of the only tokens whose erc20 and erc721 transfers are fetched
+            and saved, None for all the tokens. The history of a token added later to the list is not fetched
+            before the last block already saved.
+        :type token_allowlist: Optional[List[str]]
+        :param token_denylist: contract addresses of the tokens whose erc20 and erc721 transfers are not saved
+        :type token_denylist: Optional[List[str]]
+        :param scheduler: scheduler of the calls to the API, to share between the managers using the same token.
+            It replaces the rate limiter, see RequestScheduler
+        :type scheduler: Optional[RequestScheduler]
+        :param change_log: if the new transactions should be appended to the change log of the database, see
+            ScanDataBase.get_changes
+        :type change_log: bool
+        :param archive: archive of the old transactions, see archive_transactions
+        :type archive: Optional[TransactionArchive]
+        :param flow_index: if the transfers should be aggregated per counterparty as they are stored, see
+            get_counterparties
+        :type flow_index: bool
         """
         self.address = address
         self.nt_type = nt_type
         self.net = net
-        self.client = Client(api_token, self.nt_type, self.net)
-        self.db = ScanDataBase()
+        self.client = Client(api_token, self.nt_type, self.net, response_cache=response_cache,
+                             rate_limiter=rate_limiter, transport=transport, scheduler=scheduler)
+        self.finality_depth = finality_depth
+        self.concurrent_db = concurrent_db
+        self.storage_encoding = storage_encoding
+        self.shared_storage = shared_storage
+        self.change_log = change_log
+        self.archive = archive
+        self.flow_index = flow_index
+        self.token_allowlist = None
+        if token_allowlist is not None:
+            self.token_allowlist = list(dict.fromkeys(c.lower() for c in token_allowlist))
+        self.token_denylist = set() if token_denylist is None else {c.lower() for c in token_denylist}
+        self._db = None
+
+    @property
+    def db(self) -> ScanDataBase:
+        """
+        Database of the manager, created on first use
+        """
+        if self._db is None:
+            self._db = ScanDataBase(concurrent=self.concurrent_db, encoding=self.storage_encoding,
+                                    shared_storage=self.shared_storage, change_log=self.change_log,
+                                    archive=self.archive, flow_index=self.flow_index)
+        return self._db
+
+    @db.setter
+    def db(self, db: ScanDataBase):
+        self._db = db
+
+    def close(self):
+        """
+        Close the database of the manager, it will be reopened if the manager is used again
+
+        :return: None
+        :rtype: None
+        """
+        if self._db is not None:
+            self._db.close()
+
+    def __enter__(self):
+        return self
 
-    def update_transactions(self, tr_type: TRANSACTION):
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def update_transactions(self, tr_type: TRANSACTION, share_result: bool = True) -> List[Dict]:
         """
         Update the transactions of a certain type in the database
+        Concurrent updates of the same transactions in the same database (by any manager of this process) are
+        coalesced: the calls made while an update is in progress wait for it and return its result.
 
         :param tr_type: type of transaction to update
         :type tr_type: TRANSACTION
-        :return: None
-        :rtype: None
+        :param share_result: if a call that waited for an update in progress should return its new transactions.
+            If False, it returns an empty list, so that only the caller of the update handles them.
+        :type share_result: bool, default True
+        :return: the transactions that were not recorded before this update
+        :rtype: List[Dict]
+        """
+        network = f"{self.nt_type.name.lower()}_{self.net}"
+        # the start block is looked up inside the update, so that it is never read before a write in progress
+        key = self._get_update_key(tr_type)
+        executed = []
+
+        def update():
+            executed.append(True)
+            return self._update_transactions(tr_type)
+
+        with span("scanwatch.update_transactions", address=self.address, network=network,
+                  tr_type=tr_type.name.lower()):
+            new_transactions = self._update_flights.do(key, update)
+        if not len(executed):
+            get_metrics().increment('scanwatch_coalesced_updates_total', network=network, tr_type=tr_type.name.lower())
+            if not share_result:
+                return []
+        return list(new_transactions)
+
+    def _get_update_key(self, tr_type: TRANSACTION) -> Tuple:
+        """
+        Return the key of the updates of a type of transactions in _update_flights: the updates with the same key
+        write the same transactions in the same database
+
+        :param tr_type: type of transaction to update
+        :type tr_type: TRANSACTION
+        :return: key of the updates
+        :rtype: Tuple
+        """
+        return (str(self.db.save_path), self.nt_type, self.net, tr_type, self.address.lower(), self.finality_depth,
+                self.shared_storage, None if self.token_allowlist is None else tuple(self.token_allowlist),
+                frozenset(self.token_denylist), self.change_log,
+                None if self.archive is None else str(self.archive.path), self.flow_index)
+
+    def _update_transactions(self, tr_type: TRANSACTION) -> List[Dict]:
+        """
+        Update the transactions of a certain type in the database, see update_transactions
+
+        :param tr_type: type of transaction to update
+        :type tr_type: TRANSACTION
+        :return: the transactions that were not recorded before this update
+        :rtype: List[Dict]
+        """
+        if self.finality_depth is not None:
+            return self._update_non_final_transactions(tr_type)
+        with span("scanwatch.resume_lookup"):
+            last_block = self.db.get_last_block_number(self.address, self.nt_type, self.net, tr_type)
+        with span("scanwatch.fetch"):
+            new_transactions = self._fetch_transactions(tr_type, last_block + 1)
+        self.db.add_transactions(self.address, self.nt_type, self.net, tr_type, new_transactions)
+        if len(new_transactions):
+            # the genesis block has no transaction, a first fetch covers the history from its start
+            start_block = last_block + 1 if last_block else 0
+            end_block = max(int(tx['blockNumber']) for tx in new_transactions)
+            self.db.add_coverage(self.address, self.nt_type, self.net, tr_type, start_block, end_block)
+        return new_transactions
+
+    def _update_non_final_transactions(self, tr_type: TRANSACTION) -> List[Dict]:
+        """
+        Fetch all the transactions after the finalized block and replace the recorded ones with them, then move
+        the finalized block mark according to the current block number of the chain.
+
+        :param tr_type: type of transaction to update
+        :type tr_type: TRANSACTION
+        :return: the transactions that were not recorded before this update
+        :rtype: List[Dict]
+        """
+        with span("scanwatch.resume_lookup"):
+            finalized_block = self.db.get_finalized_block(self.address, self.nt_type, self.net, tr_type)
+            if finalized_block is None:  # previous transactions were recorded without tracking the finality
+                last_block = self.db.get_last_block_number(self.address, self.nt_type, self.net, tr_type)
+                finalized_block = last_block - self.finality_depth
+        start_block = max(finalized_block + 1, 0)
+        with span("scanwatch.fetch"):
+            block_number = self.client.get_recent_block_number()  # a late block only delays the finality
+            new_transactions = self._fetch_transactions(tr_type, start_block)
+        added_transactions = self.db.replace_transactions(self.address, self.nt_type, self.net, tr_type,
+                                                          start_block, new_transactions, auto_commit=False)
+        end_block = max([block_number] + [int(tx['blockNumber']) for tx in new_transactions])
+        self.db.add_coverage(self.address, self.nt_type, self.net, tr_type, start_block, end_block, auto_commit=False)
+        finalized_block = max(finalized_block, block_number - self.finality_depth)
+        self.db.set_finalized_block(self.address, self.nt_type, self.net, tr_type, finalized_block)
+        return added_transactions
+
+    def _fetch_transactions(self, tr_type: TRANSACTION, start_block: int,
+                            end_block: Optional[int] = None) -> List[Dict]:
+        """
+        Fetch from the API the transactions of a certain type starting from a block
+
+        :param tr_type: type of transaction to fetch
+        :type tr_type: TRANSACTION
+        :param start_block: first block to fetch
+        :type start_block: int
+        :param end_block: last block to fetch, None for the last block of the chain
+        :type end_block: Optional[int]
+        :return: list of transactions
+        :rtype: List[Dict]
         """
-        last_block = self.db.get_last_block_number(self.address, self.nt_type, self.net, tr_type)
         if tr_type == TRANSACTION.NORMAL:
-            new_transactions = self.client.get_normal_transactions(self.address, start_block=last_block + 1)
+            return self.client.get_normal_transactions(self.address, start_block=start_block, end_block=end_block)
         elif tr_type == TRANSACTION.INTERNAL:
-            new_transactions = self.client.get_internal_transactions(self.address, start_block=last_block + 1)
+            return self.client.get_internal_transactions(self.address, start_block=start_block, end_block=end_block)
         elif tr_type == TRANSACTION.ERC20:
-            new_transactions = self.client.get_erc20_transactions(self.address, start_block=last_block + 1)
+            return self._fetch_token_transactions(self.client.get_erc20_transactions, start_block, end_block)
         elif tr_type == TRANSACTION.ERC721:
-            new_transactions = self.client.get_erc721_transactions(self.address, start_block=last_block + 1)
+            return self._fetch_token_transactions(self.client.get_erc721_transactions, start_block, end_block)
         else:
             raise ValueError(f"unknown transaction type: {tr_type}")
-        self.db.add_transactions(self.address, self.nt_type, self.net, tr_type, new_transactions)
+
+    def _fetch_token_transactions(self, fetch: Callable, start_block: int,
+                                  end_block: Optional[int] = None) -> List[Dict]:
+        """
+        Fetch the token transfers starting from a block, according to the token allowlist and denylist: the
+        allowed contracts are requested one by one to the API, and the denied ones are filtered out.
+
+        :param fetch: client method fetching the transfers (get_erc20_transactions or get_erc721_transactions)
+        :type fetch: Callable
+        :param start_block: first block to fetch
+        :type start_block: int
+        :param end_block: last block to fetch, None for the last block of the chain
+        :type end_block: Optional[int]
+        :return: list of transactions, sorted by block
+        :rtype: List[Dict]
+        """
+        if self.token_allowlist is None:
+            transactions = fetch(self.address, start_block=start_block, end_block=end_block)
+        else:
+            transactions = []
+            for contract_address in self.token_allowlist:
+                if contract_address not in self.token_denylist:
+                    transactions.extend(fetch(self.address, start_block=start_block, end_block=end_block,
+                                              contract_address=contract_address))
+            if len(self.token_allowlist) > 1:
+                transactions.sort(key=lambda tx: (int(tx['blockNumber']), int(tx.get('transactionIndex') or 0)))
+        if len(self.token_denylist):
+            transactions = [tx for tx in transactions if tx['contractAddress'].lower() not in self.token_denylist]
+        return transactions
+
+    def verify_transactions(self, tr_type: TRANSACTION, repair: bool = True) -> Dict:
+        """
+        Look for the block ranges of the recorded history that have not been fetched from the API (holes left by an
+        interrupted or truncated synchronisation) and fetch again only those ranges. The history recorded before
+        the coverage was tracked is entirely fetched again, once, except for its archived blocks, which are not
+        verified. The repair is never run at the same time as an update of the same transactions.
+
+        :param tr_type: type of transaction to verify
+        :type tr_type: TRANSACTION
+        :param repair: if the uncovered ranges should be fetched and their transactions replaced
+        :type repair: bool
+        :return: report with the uncovered ranges, the transactions added by the repair, and the number and
+            checksum of the recorded transactions (see ScanDataBase.get_checksum)
+        :rtype: Dict
+        """
+        uncovered_ranges = []
+        executed = []
+
+        def verify() -> List[Dict]:
+            executed.append(True)
+            archived_block = self.db.get_archived_block(self.address, self.nt_type, self.net, tr_type)
+            first_block = 0 if archived_block is None else archived_block + 1  # the archive is not rewritten
+            uncovered_ranges[:] = [(max(start_block, first_block), end_block) for start_block, end_block
+                                   in self.db.get_uncovered_ranges(self.address, self.nt_type, self.net, tr_type)
+                                   if end_block >= first_block]
+            added = []
+            if repair:
+                for start_block, end_block in uncovered_ranges:
+                    transactions = self._fetch_transactions(tr_type, start_block, end_block)
+                    added.extend(self.db.replace_transactions(self.address, self.nt_type, self.net, tr_type,
+                                                              start_block, transactions, auto_commit=False,
+                                                              to_block=end_block))
+                    self.db.add_coverage(self.address, self.nt_type, self.net, tr_type, start_block, end_block)
+            return added
+
+        # the verification shares the key of the updates: it waits for an update in progress, and the updates
+        # started meanwhile wait for it and receive the transactions it added
+        added_transactions = []
+        while not len(executed):
+            added_transactions = self._update_flights.do(self._get_update_key(tr_type), verify)
+        added_transactions = list(added_transactions)
+        count, checksum = self.db.get_checksum(self.address, self.nt_type, self.net, tr_type)
+        return {
+            'tr_type': tr_type,
+            'uncovered_ranges': uncovered_ranges,
+            'added_transactions': added_transactions,
+            'count': count,
+            'checksum': checksum,
+        }
+
+    def archive_transactions(self, tr_type: TRANSACTION, older_than_days: float = 365) -> int:
+        """
+        Move the old transactions of a certain type from the database to the archive of the manager. They are
+        still returned by get_transactions and counted in the holdings, and the updates resume after them.
+
+        :param tr_type: type of transaction to archive
+        :type tr_type: TRANSACTION
+        :param older_than_days: age in days of the transactions to archive
+        :type older_than_days: float, default 365
+        :return: number of archived transactions
+        :rtype: int
+        """
+        before_timestamp = int(time.time() - older_than_days * 86400)
+        return self.db.archive_transactions(self.address, self.nt_type, self.net, tr_type, before_timestamp)
 
     def update_all_transactions(self):
         """
@@ -61,6 +349,8 @@ class ScanManager:
         :return: None
         :rtype: None
         """
+        from tqdm import tqdm  # imported here as it is only needed for this method
+
         tr_types_names = [name for name in dir(TRANSACTION) if not name.startswith('__')]
         pbar = tqdm(total=len(tr_types_names))
         for name in tr_types_names:
@@ -82,27 +372,32 @@ class ScanManager:
         """
         return self.db.get_transactions(self.address, self.nt_type, self.net, tr_type)
 
-    def get_erc20_holdings(self) -> Dict:
+    def get_erc20_holdings(self, by_contract: bool = False) -> Dict:
         """
         Return the amount of every erc20 the address holds at the last update time.
         WARNING: Some tokens trigger non-erc20 events, such as internal exchange fee. This will not be picked up by
         this function. As a consequence, the balance of such tokens might be wrong.
 
-        :return: a dictionary of token amount per token name
+        :param by_contract: if the amounts should be keyed by contract address instead of token name. Token names
+            are not unique: tokens sharing a name are summed together when keyed by name.
+            The metadata of a contract can be read with ScanDataBase.get_token_metadata.
+        :type by_contract: bool
+        :return: a dictionary of token amount per token name (or contract address)
         :rtype: Dict
         """
         txs = self.get_transactions(TRANSACTION.ERC20)
+        key = 'contractAddress' if by_contract else 'tokenName'
         holdings = {}
         for tx in txs:
             amount = Decimal(tx['value']) / Decimal(10 ** int(tx['tokenDecimal']))
             if self.address.lower() == tx['from']:
                 amount *= -1
             try:
-                holdings[tx['tokenName']] += amount
+                holdings[tx[key]] += amount
             except KeyError:
                 if amount < 0:
                     raise ValueError(f"First operation on an asset is a removal {tx}")
-                holdings[tx['tokenName']] = amount
+                holdings[tx[key]] = amount
         return {k: v for k, v in holdings.items() if v != 0}
 
     def get_erc721_holdings(self) -> List[Dict]:
@@ -141,3 +436,31 @@ class ScanManager:
                                    'tokenID': token_id,
                                    **nft})
         return result
+
+    def get_counterparties(self, limit: int = 10, asset: Optional[str] = None, by_value: bool = False) -> List[Dict]:
+        """
+        Return the addresses the address of the manager interacted with the most, from the flow index (the manager
+        must have been created with flow_index=True), see ScanDataBase.get_counterparties
+
+        :param limit: maximum number of (counterparty, asset) flows to return
+        :type limit: int
+        :param asset: contract address of an erc20 token, or an empty string for the native coin, None for all
+        :type asset: Optional[str]
+        :param by_value: sort the flows by value instead of by number of transfers
+        :type by_value: bool
+        :return: flows with the number of transfers and the value in each direction
+        :rtype: List[Dict]
+        """
+        return self.db.get_counterparties(self.address, self.nt_type, self.net, limit=limit, asset=asset,
+                                          by_value=by_value)
+
+    def get_flows(self, counterparty: str) -> List[Dict]:
+        """
+        Return the flows between the address of the manager and a counterparty, per asset, from the flow index
+
+        :param counterparty: counterparty of the address
+        :type counterparty: str
+        :return: flows with the number of transfers and the value in each direction
+        :rtype: List[Dict]
+        """
+        return self.db.get_flows(self.address, self.nt_type, self.net, counterparty)
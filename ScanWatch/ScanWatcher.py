@@ -0,0 +1,303 @@
+import heapq
+import itertools
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Union
+
+from ScanWatch.ScanManager import ScanManager
+from ScanWatch.storage.ResponseCache import ResponseCache
+from ScanWatch.storage.StorageEncoding import StorageEncoding
+from ScanWatch.storage.TransactionArchive import TransactionArchive
+from ScanWatch.utils.KeyPool import APIKeyPool
+from ScanWatch.utils.LoggerGenerator import LoggerGenerator
+from ScanWatch.utils.RateLimiter import RateLimiter
+from ScanWatch.utils.RequestScheduler import RequestScheduler, request_priority
+from ScanWatch.utils.enums import NETWORK, PRIORITY, TRANSACTION
+
+
+class ScanWatcher:
+    """
+    Long-running watcher that keeps the transactions of many addresses up to date.
+    Each address is polled on its own interval: the interval is reset to the minimum when new transactions are
+    found and grows geometrically while the address stays idle. All the polls share the rate budget of the api
+    token, and the callbacks are called with the newly stored transactions.
+    """
+
+    def __init__(self, nt_type: NETWORK, api_token: Union[str, List[str], APIKeyPool], net: str = "main",
+                 calls_per_second: float = 5,
+                 min_interval: float = 15, max_interval: float = 3600, backoff: float = 2,
+                 finality_depth: Optional[int] = None, response_cache: Optional[ResponseCache] = None,
+                 storage_encoding: Optional[StorageEncoding] = None, shared_storage: bool = False,
+                 change_log: bool = False, archive: Optional[TransactionArchive] = None, flow_index: bool = False):
+        """
+        Initiate the watcher
+
+        :param nt_type: type of the network
+        :type nt_type: NETWORK
+        :param api_token: token to communicate with the API, or several tokens to spread the calls over
+        :type api_token: Union[str, List[str], APIKeyPool]
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str, default 'main'
+        :param calls_per_second: rate budget of each api token
+        :type calls_per_second: float, default 5
+        :param min_interval: interval in seconds between two polls of an active address
+        :type min_interval: float, default 15
+        :param max_interval: maximum interval in seconds between two polls of a dormant address
+        :type max_interval: float, default 3600
+        :param backoff: factor applied to the poll interval of an address each time no new transaction is found
+        :type backoff: float, default 2
+        :param finality_depth: finality depth given to the managers, see ScanManager
+        :type finality_depth: Optional[int]
+        :param response_cache: response cache given to the managers, see ScanManager
+        :type response_cache: Optional[ResponseCache]
+        :param storage_encoding: storage encoding given to the managers, see ScanManager
+        :type storage_encoding: Optional[StorageEncoding]
+        :param shared_storage: if the managers should store the transactions once for all the addresses, see
+            ScanDataBase
+        :type shared_storage: bool
+        :param change_log: if the managers should append the new transactions to the change log of the database,
+            see ScanDataBase.get_changes
+        :type change_log: bool
+        :param archive: archive of the old transactions given to the managers, see ScanManager
+        :type archive: Optional[TransactionArchive]
+        :param flow_index: if the managers should aggregate the transfers per counterparty, see ScanManager
+        :type flow_index: bool
+        """
+        self.nt_type = nt_type
+        if isinstance(api_token, list):
+            api_token = APIKeyPool(api_token, calls_per_second)
+        self.api_token = api_token
+        self.net = net
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.finality_depth = finality_depth
+        self.response_cache = response_cache
+        self.storage_encoding = storage_encoding
+        self.shared_storage = shared_storage
+        self.change_log = change_log
+        self.archive = archive
+        self.flow_index = flow_index
+        # a pool of keys already enforces the rate budget of each of its keys, the scheduler only orders the calls
+        if isinstance(api_token, APIKeyPool):
+            self.rate_limiter = RateLimiter(calls_per_second * len(api_token.api_tokens))
+        else:
+            self.rate_limiter = RateLimiter(calls_per_second)
+        self.scheduler = RequestScheduler(rate_limiter=self.rate_limiter)
+        self.logger = LoggerGenerator.get_logger("ScanWatcher")
+
+        self._managers: Dict[str, ScanManager] = {}
+        self._tr_types: Dict[str, List[TRANSACTION]] = {}
+        self._intervals: Dict[str, float] = {}
+        self._queue = []  # heap of (next poll time, sequence number, address)
+        self._counter = itertools.count()
+        self._scheduled: Dict[str, int] = {}  # sequence number of the valid entry of each address in the heap
+        self._callbacks: List[Callable] = []
+        self._poll_locks: Dict[str, threading.Lock] = {}  # one poll at a time per address
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def add_address(self, address: str, tr_types: Optional[List[TRANSACTION]] = None):
+        """
+        Start watching an address, its first poll will happen as soon as possible
+
+        :param address: address to watch
+        :type address: str
+        :param tr_types: types of transactions to update, default to all the types
+        :type tr_types: Optional[List[TRANSACTION]]
+        :return: None
+        :rtype: None
+        """
+        if tr_types is None:
+            tr_types = list(TRANSACTION)
+        with self._lock:
+            if address not in self._managers:
+                self._managers[address] = ScanManager(address, self.nt_type, self.api_token, self.net,
+                                                      response_cache=self.response_cache,
+                                                      finality_depth=self.finality_depth,
+                                                      scheduler=self.scheduler, concurrent_db=True,
+                                                      storage_encoding=self.storage_encoding,
+                                                      shared_storage=self.shared_storage,
+                                                      change_log=self.change_log,
+                                                      archive=self.archive,
+                                                      flow_index=self.flow_index)
+                self._intervals[address] = self.min_interval
+                self._poll_locks[address] = threading.Lock()
+                self._schedule(address, time.monotonic())
+            self._tr_types[address] = tr_types
+
+    def remove_address(self, address: str):
+        """
+        Stop watching an address
+
+        :param address: address to remove
+        :type address: str
+        :return: None
+        :rtype: None
+        """
+        with self._lock:
+            manager = self._managers.pop(address, None)
+            self._tr_types.pop(address, None)
+            self._intervals.pop(address, None)
+            self._poll_locks.pop(address, None)
+            self._scheduled.pop(address, None)
+            self._queue = [e for e in self._queue if e[2] != address]
+            heapq.heapify(self._queue)
+        if manager is not None:
+            manager.close()
+
+    def add_callback(self, callback: Callable):
+        """
+        Register a function to call each time new transactions are stored. It will be called with the arguments
+        (address, nt_type, net, tr_type, transactions)
+
+        :param callback: function to call
+        :type callback: Callable
+        :return: None
+        :rtype: None
+        """
+        self._callbacks.append(callback)
+
+    def poll_due(self) -> int:
+        """
+        Poll all the addresses whose next poll time has been reached, until the method stop is called
+
+        :return: number of addresses polled
+        :rtype: int
+        """
+        count = 0
+        while not self._stop_event.is_set():
+            with self._lock:
+                if not len(self._queue) or self._queue[0][0] > time.monotonic():
+                    return count
+                _, sequence, address = heapq.heappop(self._queue)
+                if self._scheduled.get(address) != sequence:  # replaced by a later entry
+                    continue
+            self.poll_address(address)
+            count += 1
+        return count
+
+    def poll_address(self, address: str):
+        """
+        Update the transactions of an address, call the callbacks with the new transactions and schedule its
+        next poll
+
+        :param address: watched address
+        :type address: str
+        :return: None
+        :rtype: None
+        """
+        with self._lock:
+            manager = self._managers.get(address)
+            tr_types = self._tr_types.get(address, [])
+            poll_lock = self._poll_locks.get(address)
+        if manager is None:  # the address has been removed
+            return
+        found_new = False
+        with poll_lock:
+            for tr_type in tr_types:
+                try:
+                    # an update joined in progress is handled by the poll that started it
+                    new_transactions = manager.update_transactions(tr_type, share_result=False)
+                except Exception as err:
+                    self.logger.error(f"failed to update {tr_type.name.lower()} transactions of {address}: {err}")
+                    continue
+                if len(new_transactions):
+                    found_new = True
+                    for callback in self._callbacks:
+                        try:
+                            callback(address, self.nt_type, self.net, tr_type, new_transactions)
+                        except Exception as err:
+                            self.logger.error(f"callback {callback} failed for {address}: {err}")
+        with self._lock:
+            if address not in self._managers:
+                return
+            if found_new:
+                interval = self.min_interval
+            else:
+                interval = min(self._intervals[address] * self.backoff, self.max_interval)
+            self._intervals[address] = interval
+            self._schedule(address, time.monotonic() + interval)
+
+    def _schedule(self, address: str, poll_time: float):
+        """
+        Set the next poll time of an address, replacing the previous one. The lock must be held by the caller.
+
+        :param address: watched address
+        :type address: str
+        :param poll_time: monotonic time of the next poll
+        :type poll_time: float
+        :return: None
+        :rtype: None
+        """
+        sequence = next(self._counter)
+        self._scheduled[address] = sequence
+        heapq.heappush(self._queue, (poll_time, sequence, address))
+
+    def refresh_address(self, address: str):
+        """
+        Poll an address now, for example when a user asks for its latest transactions. The calls to the API of
+        this poll go before the ones of the scheduled polls and backfills, which continue in the background.
+        If the address is already being polled, the calls of that poll are promoted and the refresh polls the
+        address again once it is over.
+        This method can be called from another thread than the one running the watcher.
+
+        :param address: watched address
+        :type address: str
+        :return: None
+        :rtype: None
+        """
+        with self.scheduler.promote(address), request_priority(PRIORITY.INTERACTIVE):
+            self.poll_address(address)
+
+    def get_wait_time(self) -> float:
+        """
+        Return the time until the next scheduled poll
+
+        :return: time in seconds
+        :rtype: float
+        """
+        with self._lock:
+            if not len(self._queue):
+                return self.min_interval
+            return max(0., self._queue[0][0] - time.monotonic())
+
+    def run(self):
+        """
+        Poll the addresses until the method stop is called
+
+        :return: None
+        :rtype: None
+        """
+        self._stop_event.clear()
+        while not self._stop_event.is_set():
+            self.poll_due()
+            self._stop_event.wait(min(self.get_wait_time(), 1))  # wake up regularly for the new addresses
+
+    def stop(self):
+        """
+        Stop the run loop after the current poll
+
+        :return: None
+        :rtype: None
+        """
+        self._stop_event.set()
+
+    def close(self):
+        """
+        Stop the run loop and close the databases of the managers
+
+        :return: None
+        :rtype: None
+        """
+        self.stop()
+        with self._lock:
+            managers = list(self._managers.values())
+        for manager in managers:
+            manager.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,343 @@
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Union
+
+from ScanWatch.ScanManager import ScanManager
+from ScanWatch.storage.ScanDataBase import ScanDataBase
+from ScanWatch.storage.StorageEncoding import StorageEncoding
+from ScanWatch.storage.TransactionArchive import TransactionArchive
+from ScanWatch.utils.KeyPool import APIKeyPool
+from ScanWatch.utils.RateLimiter import SharedRateLimiter
+from ScanWatch.utils.enums import NETWORK, TRANSACTION
+
+# state of a worker process, set by _init_worker
+_worker_rate_limiter: Optional[SharedRateLimiter] = None
+_worker_api_token: Union[str, APIKeyPool, None] = None
+_worker_databases: Dict[str, ScanDataBase] = {}
+
+
+def _get_api_token(api_tokens: List[str],
+                   key_limiters: Optional[Dict[str, SharedRateLimiter]]) -> Union[str, APIKeyPool]:
+    """
+    Return the api token to give to the managers of a process: the token itself, or a pool of the tokens using
+    the limiters shared by all the processes
+
+    :param api_tokens: api tokens of the sharded manager
+    :type api_tokens: List[str]
+    :param key_limiters: shared limiter of each token, None if there is a single token
+    :type key_limiters: Optional[Dict[str, SharedRateLimiter]]
+    :return: api token or pool of tokens
+    :rtype: Union[str, APIKeyPool]
+    """
+    if key_limiters is None:
+        return api_tokens[0]
+    return APIKeyPool(api_tokens, rate_limiters=key_limiters)
+
+
+def _get_database(shard_name: str, options: Dict[str, Any]) -> ScanDataBase:
+    """
+    Open the database of a shard with the storage options of the sharded manager
+
+    :param shard_name: name of the database of the shard
+    :type shard_name: str
+    :param options: storage options of the managers, see ShardedScanManager.get_manager_options
+    :type options: Dict[str, Any]
+    :return: database of the shard
+    :rtype: ScanDataBase
+    """
+    return ScanDataBase(shard_name, encoding=options['storage_encoding'], shared_storage=options['shared_storage'],
+                        change_log=options['change_log'], archive=options['archive'],
+                        flow_index=options['flow_index'])
+
+
+def _init_worker(rate_limiter: SharedRateLimiter, api_tokens: List[str],
+                 key_limiters: Optional[Dict[str, SharedRateLimiter]]):
+    """
+    Initialise a worker process of a ShardedScanManager
+
+    :param rate_limiter: rate limiter shared by all the workers
+    :type rate_limiter: SharedRateLimiter
+    :param api_tokens: api tokens of the sharded manager
+    :type api_tokens: List[str]
+    :param key_limiters: limiter of each token shared by all the workers, None if there is a single token
+    :type key_limiters: Optional[Dict[str, SharedRateLimiter]]
+    :return: None
+    :rtype: None
+    """
+    global _worker_rate_limiter, _worker_api_token
+    _worker_rate_limiter = rate_limiter
+    _worker_api_token = _get_api_token(api_tokens, key_limiters)
+
+
+def _update_shard(shard_name: str, addresses: List[str], nt_type: NETWORK, net: str, tr_types: List[TRANSACTION],
+                  options: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
+    """
+    Update the transactions of the addresses of a shard, executed in a worker process
+
+    :return: number of new transactions per address and per type of transaction name
+    :rtype: Dict[str, Dict[str, int]]
+    """
+    db = _worker_databases.get(shard_name)
+    if db is None:
+        db = _worker_databases[shard_name] = _get_database(shard_name, options)
+    results = {}
+    for address in addresses:
+        manager = ScanManager(address, nt_type, _worker_api_token, net, rate_limiter=_worker_rate_limiter, **options)
+        manager.db = db
+        results[address] = {tr_type.name: len(manager.update_transactions(tr_type)) for tr_type in tr_types}
+    return results
+
+
+class ShardedScanManager:
+    """
+    Keep the transactions of many addresses up to date with several worker processes, to use more than one CPU
+    core for the decoding, the conversion and the insertion of the transactions.
+    The addresses are spread over the shards by hash, each shard has its own database file and is updated by one
+    worker at a time. All the workers share the rate budget of the api tokens.
+    The transactions and holdings of an address are read from its shard by this object.
+
+    As the workers are separate processes, the scripts creating a sharded manager must be protected by an
+    ``if __name__ == '__main__':`` block.
+    """
+
+    def __init__(self, nt_type: NETWORK, api_token: Union[str, List[str], APIKeyPool], net: str = "main",
+                 n_shards: int = 4, calls_per_second: float = 5, db_name: str = 'scan_db',
+                 finality_depth: Optional[int] = None, storage_encoding: Optional[StorageEncoding] = None,
+                 mp_context: str = 'spawn', shared_storage: bool = False, change_log: bool = False,
+                 archive: Optional[TransactionArchive] = None, flow_index: bool = False):
+        """
+        Initiate the sharded manager
+
+        :param nt_type: type of the network
+        :type nt_type: NETWORK
+        :param api_token: token to communicate with the API, or several tokens to spread the calls over. The
+            tokens of an APIKeyPool are used with new limiters shared by the workers, the quarantines are made by
+            each process.
+        :type api_token: Union[str, List[str], APIKeyPool]
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str, default 'main'
+        :param n_shards: number of shards, which is also the number of worker processes
+        :type n_shards: int, default 4
+        :param calls_per_second: rate budget of each api token, shared by all the workers
+        :type calls_per_second: float, default 5
+        :param db_name: prefix of the names of the shard databases
+        :type db_name: str, default 'scan_db'
+        :param finality_depth: finality depth of the updates, see ScanManager
+        :type finality_depth: Optional[int]
+        :param storage_encoding: compact encoding of the transactions in the shards, see StorageEncoding
+        :type storage_encoding: Optional[StorageEncoding]
+        :param mp_context: start method of the worker processes ('spawn', 'fork' or 'forkserver')
+        :type mp_context: str, default 'spawn'
+        :param shared_storage: if the transactions of the addresses of a shard should be stored once, see
+            ScanDataBase
+        :type shared_storage: bool
+        :param change_log: if the new transactions should be appended to the change log of their shard, see
+            ScanDataBase.get_changes
+        :type change_log: bool
+        :param archive: archive of the old transactions, shared by all the shards, see ScanManager
+        :type archive: Optional[TransactionArchive]
+        :param flow_index: if the transfers should be aggregated per counterparty in their shard, see ScanManager
+        :type flow_index: bool
+        """
+        if n_shards < 1:
+            raise ValueError(f"n_shards should be at least 1, received {n_shards}")
+        import multiprocessing  # imported here as it is only needed for this class
+
+        self.nt_type = nt_type
+        if isinstance(api_token, APIKeyPool):
+            self.api_tokens = list(api_token.api_tokens)
+        elif isinstance(api_token, list):
+            self.api_tokens = list(dict.fromkeys(api_token))
+        else:
+            self.api_tokens = [api_token]
+        if not len(self.api_tokens):
+            raise ValueError("at least one api token is needed")
+        self.net = net
+        self.n_shards = n_shards
+        self.db_name = db_name
+        self.finality_depth = finality_depth
+        self.storage_encoding = storage_encoding
+        self.shared_storage = shared_storage
+        self.change_log = change_log
+        self.archive = archive
+        self.flow_index = flow_index
+        self.addresses: List[str] = []
+        self._context = multiprocessing.get_context(mp_context)
+        self.rate_limiter = SharedRateLimiter(calls_per_second * len(self.api_tokens), context=self._context)
+        self.key_limiters: Optional[Dict[str, SharedRateLimiter]] = None
+        if len(self.api_tokens) > 1:
+            self.key_limiters = {token: SharedRateLimiter(calls_per_second, context=self._context)
+                                 for token in self.api_tokens}
+        self.api_token = _get_api_token(self.api_tokens, self.key_limiters)  # used in this process
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._databases: Dict[int, ScanDataBase] = {}
+
+    def get_manager_options(self) -> Dict[str, Any]:
+        """
+        Return the options given to the managers and to the databases of the shards
+
+        :return: keyword arguments of ScanManager
+        :rtype: Dict[str, Any]
+        """
+        return {'finality_depth': self.finality_depth, 'storage_encoding': self.storage_encoding,
+                'shared_storage': self.shared_storage, 'change_log': self.change_log, 'archive': self.archive,
+                'flow_index': self.flow_index}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get_shard(self, address: str) -> int:
+        """
+        Return the index of the shard of an address
+
+        :param address: address of the shard
+        :type address: str
+        :return: index of the shard, between 0 and n_shards - 1
+        :rtype: int
+        """
+        return zlib.crc32(address.lower().encode()) % self.n_shards
+
+    def get_shard_name(self, shard: int) -> str:
+        """
+        Return the name of the database of a shard
+
+        :param shard: index of the shard
+        :type shard: int
+        :return: name of the database
+        :rtype: str
+        """
+        return f"{self.db_name}_shard{shard}"
+
+    def add_address(self, address: str):
+        """
+        Add an address to the ones updated by the manager
+
+        :param address: address to add
+        :type address: str
+        :return: None
+        :rtype: None
+        """
+        if address not in self.addresses:
+            self.addresses.append(address)
+
+    def remove_address(self, address: str):
+        """
+        Stop updating an address, its recorded transactions are kept
+
+        :param address: address to remove
+        :type address: str
+        :return: None
+        :rtype: None
+        """
+        if address in self.addresses:
+            self.addresses.remove(address)
+
+    def update_transactions(self, tr_types: Optional[List[TRANSACTION]] = None) -> Dict[str, Dict[str, int]]:
+        """
+        Update the transactions of all the addresses, the shards are updated in parallel by the workers
+
+        :param tr_types: types of transactions to update, default to all the types
+        :type tr_types: Optional[List[TRANSACTION]]
+        :return: number of new transactions per address and per type of transaction name
+        :rtype: Dict[str, Dict[str, int]]
+        """
+        if tr_types is None:
+            tr_types = list(TRANSACTION)
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.n_shards, mp_context=self._context,
+                                                 initializer=_init_worker,
+                                                 initargs=(self.rate_limiter, self.api_tokens, self.key_limiters))
+        shards_addresses = [[] for _ in range(self.n_shards)]
+        for address in self.addresses:
+            shards_addresses[self.get_shard(address)].append(address)
+        options = self.get_manager_options()
+        futures = [self._executor.submit(_update_shard, self.get_shard_name(shard), addresses, self.nt_type,
+                                         self.net, tr_types, options)
+                   for shard, addresses in enumerate(shards_addresses) if len(addresses)]
+        results = {}
+        for future in futures:
+            results.update(future.result())
+        return results
+
+    def get_database(self, address: str) -> ScanDataBase:
+        """
+        Return the database of the shard of an address, opened in this process
+
+        :param address: address of the shard
+        :type address: str
+        :return: database of the shard
+        :rtype: ScanDataBase
+        """
+        shard = self.get_shard(address)
+        db = self._databases.get(shard)
+        if db is None:
+            db = self._databases[shard] = _get_database(self.get_shard_name(shard), self.get_manager_options())
+        return db
+
+    def get_manager(self, address: str) -> ScanManager:
+        """
+        Return a manager of an address that reads and writes in the shard of the address, in this process
+
+        :param address: address of the manager
+        :type address: str
+        :return: manager of the address
+        :rtype: ScanManager
+        """
+        manager = ScanManager(address, self.nt_type, self.api_token, self.net, rate_limiter=self.rate_limiter,
+                              **self.get_manager_options())
+        manager.db = self.get_database(address)
+        return manager
+
+    def get_transactions(self, address: str, tr_type: TRANSACTION) -> List[Dict]:
+        """
+        Return the transactions of an address saved in its shard
+
+        :param address: address of the transactions
+        :type address: str
+        :param tr_type: type of transaction to fetch
+        :type tr_type: TRANSACTION
+        :return: list of transactions
+        :rtype: List[Dict]
+        """
+        return self.get_database(address).get_transactions(address, self.nt_type, self.net, tr_type)
+
+    def get_erc20_holdings(self, address: str, by_contract: bool = False) -> Dict:
+        """
+        Return the erc20 holdings of an address, see ScanManager.get_erc20_holdings
+
+        :param address: address of the holdings
+        :type address: str
+        :param by_contract: if the amounts should be keyed by contract address instead of token name
+        :type by_contract: bool
+        :return: a dictionary of token amount per token name (or contract address)
+        :rtype: Dict
+        """
+        return self.get_manager(address).get_erc20_holdings(by_contract=by_contract)
+
+    def get_erc721_holdings(self, address: str) -> List[Dict]:
+        """
+        Return the erc721 holdings of an address, see ScanManager.get_erc721_holdings
+
+        :param address: address of the holdings
+        :type address: str
+        :return: List of erc721 tokens owned by the address
+        :rtype: List[Dict]
+        """
+        return self.get_manager(address).get_erc721_holdings()
+
+    def close(self):
+        """
+        Stop the worker processes and close the shard databases opened by this object
+
+        :return: None
+        :rtype: None
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        for db in self._databases.values():
+            db.close()
+        self._databases = {}
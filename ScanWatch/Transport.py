@@ -0,0 +1,177 @@
+import gzip
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Optional, Union
+
+from ScanWatch.exceptions import ReplayException
+from ScanWatch.utils.urls import strip_api_key
+
+
+class Transport(ABC):
+    """
+    Base class of the transports used by the Client to send its requests to the API
+    """
+
+    @abstractmethod
+    def get(self, url: str):
+        """
+        Send a GET request
+
+        :param url: url to request
+        :type url: str
+        :return: response with the attributes status_code and text and the methods json and raise_for_status
+        :rtype: requests.Response
+        """
+
+    def close(self):
+        """
+        Release the resources of the transport
+
+        :return: None
+        :rtype: None
+        """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class HTTPTransport(Transport):
+    """
+    Send the requests over HTTP, reusing the connections to the API
+    """
+
+    def __init__(self, timeout: float = 30):
+        """
+        Initialise an HTTP transport
+
+        :param timeout: timeout in seconds of a request
+        :type timeout: float
+        """
+        self.timeout = timeout
+        self._local = threading.local()  # requests sessions are not thread-safe
+
+    def get(self, url: str):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests  # imported on first use, as it is slow to import
+
+            session = self._local.session = requests.Session()
+        return session.get(url, headers={"User-Agent": "Mozilla/5.0"}, timeout=self.timeout)
+
+
+class ReplayResponse:
+    """
+    Response recorded by a RecordingTransport and returned by a ReplayTransport
+    """
+
+    def __init__(self, url: str, status_code: int, text: str):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+        self.request = None
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            import requests
+
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+
+class RecordingTransport(Transport):
+    """
+    Send the requests with another transport and record the responses in a gzip file of JSON lines, so that they
+    can be replayed later with a ReplayTransport. The api keys are removed from the recorded urls.
+    """
+
+    def __init__(self, file_path: Union[str, Path], transport: Optional[Transport] = None):
+        """
+        Initialise a recording transport
+
+        :param file_path: path of the record file, new records are appended to it
+        :type file_path: Union[str, Path]
+        :param transport: transport used to send the requests, default to HTTPTransport
+        :type transport: Optional[Transport]
+        """
+        self.file_path = Path(file_path)
+        self.transport = transport if transport is not None else HTTPTransport()
+        self._file = gzip.open(self.file_path, 'at', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def get(self, url: str):
+        response = self.transport.get(url)
+        record = {'url': strip_api_key(url), 'status_code': response.status_code, 'text': response.text}
+        with self._lock:
+            self._file.write(json.dumps(record) + '\n')
+        return response
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+        self.transport.close()
+
+
+class ReplayTransport(Transport):
+    """
+    Replay the responses recorded by a RecordingTransport, without any network access.
+    The responses of a url are returned in the order they were recorded, the last one is repeated once they have
+    all been replayed. A latency and a rate limit can be simulated to reproduce the conditions of the real API.
+    """
+
+    RATE_LIMIT_TEXT = json.dumps({'status': '0', 'message': 'NOTOK', 'result': 'Max rate limit reached'})
+
+    def __init__(self, file_path: Union[str, Path], latency: float = 0., calls_per_second: Optional[float] = None):
+        """
+        Initialise a replay transport
+
+        :param file_path: path of the record file
+        :type file_path: Union[str, Path]
+        :param latency: time in seconds added to each response
+        :type latency: float
+        :param calls_per_second: simulated rate limit, the calls over the limit receive the rate limit error of the
+            API. None for no limit.
+        :type calls_per_second: Optional[float]
+        """
+        self.latency = latency
+        self.calls_per_second = calls_per_second
+        self._records = defaultdict(deque)
+        self._calls_times = deque()
+        self._lock = threading.Lock()
+        with gzip.open(file_path, 'rt', encoding='utf-8') as file:
+            for line in file:
+                record = json.loads(line)
+                self._records[record['url']].append((record['status_code'], record['text']))
+
+    def _is_rate_limited(self) -> bool:
+        if self.calls_per_second is None:
+            return False
+        now = time.monotonic()
+        while len(self._calls_times) and now - self._calls_times[0] > 1:
+            self._calls_times.popleft()
+        if len(self._calls_times) >= self.calls_per_second:
+            return True
+        self._calls_times.append(now)
+        return False
+
+    def get(self, url: str):
+        if self.latency:
+            time.sleep(self.latency)
+        key = strip_api_key(url)
+        with self._lock:
+            if self._is_rate_limited():
+                return ReplayResponse(url, 200, self.RATE_LIMIT_TEXT)
+            responses = self._records.get(key)
+            if not responses:
+                raise ReplayException(f"no recorded response for the request {key}")
+            status_code, text = responses[0] if len(responses) == 1 else responses.popleft()
+        return ReplayResponse(url, status_code, text)
@@ -7,11 +7,25 @@ class APIException(Exception):
         except ValueError:
             self.message = 'Invalid JSON error message from the API: {}'.format(response.text)
         else:
-            self.code = int(json_res['status'])
-            self.message = json_res['result']
+            self.code = int(json_res.get('status', 0))
+            self.message = json_res.get('result', json_res.get('error'))
         self.status_code = response.status_code
         self.response = response
         self.request = getattr(response, 'request', None)
 
+    @property
+    def is_rate_limit(self) -> bool:
+        return isinstance(self.message, str) and 'rate limit' in self.message.lower()
+
+    @property
+    def is_invalid_key(self) -> bool:
+        return isinstance(self.message, str) and 'invalid api key' in self.message.lower()
+
     def __str__(self):  # pragma: no cover
         return 'APIError(code=%s): %s' % (self.code, self.message)
+
+
+class ReplayException(Exception):
+    """
+    Raised by a ReplayTransport when a request has not been recorded
+    """
@@ -0,0 +1,118 @@
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from ScanWatch.storage.DataBaseWriter import open_connection
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    Connection of the pool. It counts the write jobs running on it (see DataBase._execute_write), as all the
+    DataBase instances sharing the connection also share its transaction.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.job_depth = 0
+
+
+class ConnectionPool:
+    """
+    Registry of the sqlite3 connections shared by the DataBase instances. There is at most one connection per
+    database file, per thread and per mode (read-write or read-only), whatever the number of DataBase instances
+    using it, so that the number of open files does not grow with the number of instances.
+    Each call to get_connection must be matched with a call to release_connection, the connection is closed once
+    all its users have released it.
+    The read-write connections can only be used by their thread, the read-only ones can be released from another
+    thread (the readers of a concurrent DataBase are released by the thread closing it).
+    """
+
+    _connections: Dict[Tuple[Path, int, bool], List] = {}  # key -> [connection, number of users]
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_connection(cls, save_path: Path, read_only: bool = False) -> sqlite3.Connection:
+        """
+        Return the connection of the current thread to a database file, open it if needed
+
+        :param save_path: path of the database file
+        :type save_path: Path
+        :param read_only: if the connection should refuse the writes
+        :type read_only: bool
+        :return: the shared connection
+        :rtype: sqlite3.Connection
+        """
+        key = (save_path, threading.get_ident(), read_only)
+        with cls._lock:
+            entry = cls._connections.get(key)
+            if entry is None:
+                conn = open_connection(save_path, check_same_thread=not read_only, factory=PooledConnection)
+                if read_only:
+                    conn.execute("PRAGMA query_only=ON")
+                entry = cls._connections[key] = [conn, 0]
+            entry[1] += 1
+            return entry[0]
+
+    @classmethod
+    def release_connection(cls, conn: sqlite3.Connection):
+        """
+        Release a connection returned by get_connection, close it if it has no other user
+
+        :param conn: connection to release
+        :type conn: sqlite3.Connection
+        :return: None
+        :rtype: None
+        """
+        with cls._lock:
+            for key, entry in cls._connections.items():
+                if entry[0] is conn:
+                    entry[1] -= 1
+                    if entry[1] > 0:
+                        return
+                    del cls._connections[key]
+                    break
+            else:
+                return
+        cls._close(conn)
+
+    @classmethod
+    def close_all(cls):
+        """
+        Close all the connections of the pool, whatever their number of users
+
+        :return: None
+        :rtype: None
+        """
+        with cls._lock:
+            connections = [entry[0] for entry in cls._connections.values()]
+            cls._connections = {}
+        for conn in connections:
+            cls._close(conn)
+
+    @staticmethod
+    def _close(conn: sqlite3.Connection):
+        """
+        Close a connection. A read-write connection released by another thread than its own is left to be closed
+        when it is garbage collected.
+
+        :param conn: connection to close
+        :type conn: sqlite3.Connection
+        :return: None
+        :rtype: None
+        """
+        try:
+            conn.close()
+        except sqlite3.ProgrammingError:  # created in another thread
+            pass
+
+    @classmethod
+    def count(cls) -> int:
+        """
+        Return the number of open connections in the pool
+
+        :return: number of connections
+        :rtype: int
+        """
+        with cls._lock:
+            return len(cls._connections)
@@ -1,9 +1,21 @@
+import gzip
+import io
+import os
+import shutil
 from enum import Enum
-from typing import List, Tuple, Optional, Any, Union
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Tuple, Optional, Any, Union
 import sqlite3
+import threading
+import time
+import weakref
 
+from ScanWatch.storage.ConnectionPool import ConnectionPool
+from ScanWatch.storage.DataBaseWriter import DataBaseWriter, open_connection
 from ScanWatch.storage.tables import Table
 from ScanWatch.utils.LoggerGenerator import LoggerGenerator
+from ScanWatch.utils.enums import SNAPSHOT_FORMAT
+from ScanWatch.utils.metrics import get_metrics
 from ScanWatch.utils.paths import get_data_path
 
 
@@ -24,31 +36,71 @@ class SQLConditionEnum(Enum):
 class DataBase:
     """
     This class will be used to interact with sqlite3 databases without having to generates sqlite commands
+
+    By default, the database uses a single connection that should stay in the thread that created it. The DataBase
+    instances of a file in a thread share this connection, and so its transaction: a commit by one instance also
+    saves the writes made by the others with auto_commit=False.
+    In concurrent mode, the writes of every thread (and of every DataBase instance on the same file) go through a
+    single writer thread that batches the commits, and each thread reads with its own connection.
+    The connections are shared by all the DataBase instances of a file (see ConnectionPool): close the instances
+    that are not needed anymore, or use them as context managers.
     """
 
-    def __init__(self, name: str):
+    _instances = weakref.WeakSet()
+
+    def __init__(self, name: str, concurrent: bool = False):
         """
         Initialise a DataBase instance
 
         :param name: name of the database
         :type name: str
+        :param concurrent: if the database will be used from several threads
+        :type concurrent: bool
         """
         self.name = name
-        self.logger = LoggerGenerator.get_logger(self.name)
+        self.concurrent = concurrent
         self.save_path = get_data_path() / f"{name}.db"
         self.db_conn = None
         self.db_cursor = None
-        self.connect()
+        self._logger = None
+        self._connected = False
+        self._writer = None
+        self._local = threading.local()
+        self._read_conns = []
+        self._read_conns_lock = threading.Lock()
+        DataBase._instances.add(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def logger(self):
+        """
+        Logger of the database, created on first use
+        """
+        if self._logger is None:
+            self._logger = LoggerGenerator.get_logger(self.name)
+        return self._logger
 
     def connect(self):
         """
-        Connect to the sqlite3 database
+        Connect to the sqlite3 database. This is done automatically on the first operation on the database.
 
         :return: None
         :rtype: None
         """
-        self.db_conn = sqlite3.connect(self.save_path)
-        self.db_cursor = self.db_conn.cursor()
+        if self._connected:
+            return
+        os.makedirs(self.save_path.parent, exist_ok=True)
+        self._connected = True
+        if self.concurrent:
+            self._writer = DataBaseWriter.get_writer(self.save_path)
+        else:
+            self.db_conn = ConnectionPool.get_connection(self.save_path)
+            self.db_cursor = self.db_conn.cursor()
 
     def close(self):
         """
@@ -57,28 +109,131 @@ class DataBase:
         :return: None
         :rtype: None
         """
-        self.db_conn.close()
+        if not self._connected:
+            return
+        self._connected = False
+        if self.concurrent:
+            self._writer.release()
+            with self._read_conns_lock:
+                for conn in self._read_conns:
+                    ConnectionPool.release_connection(conn)
+                self._read_conns = []
+            self._local = threading.local()
+        else:
+            ConnectionPool.release_connection(self.db_conn)
+            self.db_conn = None
+            self.db_cursor = None
+
+    @classmethod
+    def close_all(cls):
+        """
+        Close all the DataBase instances, then every connection and writer thread still open
+
+        :return: None
+        :rtype: None
+        """
+        for database in list(cls._instances):
+            database.close()
+        DataBaseWriter.close_all()
+        ConnectionPool.close_all()
+
+    def _get_cursor(self) -> sqlite3.Cursor:
+        """
+        Return the cursor to use in the current thread: the writer cursor in the writer thread, a read-only cursor
+        of the thread connection in the other threads (concurrent mode) or the cursor of the single connection.
+
+        :return: cursor to execute the commands with
+        :rtype: sqlite3.Cursor
+        """
+        self.connect()
+        if not self.concurrent:
+            return self.db_cursor
+        if self._writer.is_writer_thread():
+            return self._writer.cursor
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            conn = ConnectionPool.get_connection(self.save_path, read_only=True)
+            with self._read_conns_lock:
+                self._read_conns.append(conn)
+            cursor = self._local.cursor = conn.cursor()
+        return cursor
+
+    def _execute_write(self, job: Callable[[sqlite3.Cursor], Any], auto_commit: bool = True) -> Any:
+        """
+        Execute a write job. In concurrent mode, the job is sent to the writer thread and this method returns once
+        the job is committed. In single connection mode, the job runs in a savepoint: its changes are rolled back
+        if it fails, and the write methods it calls are saved with it instead of committing on their own.
+
+        :param job: function to execute with the cursor
+        :type job: Callable[[sqlite3.Cursor], Any]
+        :param auto_commit: if the database state should be saved after the changes (single connection mode only,
+            the writer thread commits every job)
+        :type auto_commit: bool
+        :return: result of the job
+        :rtype: Any
+        """
+        self.connect()
+        if not self.concurrent:
+            if self.db_conn.job_depth:  # nested in a running job, saved with it
+                return job(self.db_cursor)
+            if not self.db_conn.in_transaction:
+                self.db_cursor.execute("BEGIN")  # so that releasing the savepoint does not commit
+            self.db_cursor.execute("SAVEPOINT job")
+            self.db_conn.job_depth += 1
+            try:
+                result = job(self.db_cursor)
+            except BaseException:
+                if self.db_conn.in_transaction:
+                    self.db_cursor.execute("ROLLBACK TO job")
+                    self.db_cursor.execute("RELEASE job")
+                raise
+            finally:
+                self.db_conn.job_depth -= 1
+            self.db_cursor.execute("RELEASE job")
+            if auto_commit:
+                self.commit()
+            return result
+        if self._writer.is_writer_thread():
+            return job(self._writer.cursor)
+        return self._writer.submit(job).result()
+
+    def run_in_transaction(self, function: Callable[[], Any], auto_commit: bool = True) -> Any:
+        """
+        Execute a function that calls several write methods of the database, so that all its changes are saved
+        together (in concurrent mode, the function is run by the writer thread).
 
-    def _fetch_rows(self, execution_cmd: str) -> List[Tuple]:
+        :param function: function to execute
+        :type function: Callable[[], Any]
+        :param auto_commit: if the database state should be saved after the changes
+        :type auto_commit: bool
+        :return: result of the function
+        :rtype: Any
+        """
+        return self._execute_write(lambda cursor: function(), auto_commit=auto_commit)
+
+    def _fetch_rows(self, execution_cmd: str, row_factory: Optional[Callable] = None,
+                    parameters: Tuple = ()) -> List[Any]:
         """
         Execute a command to fetch some rows and return them
 
         :param execution_cmd: the command to execute
         :type execution_cmd: str
+        :param row_factory: function (cursor, row) -> Any to decode the rows, None to return them as Tuple
+        :type row_factory: Optional[Callable]
+        :param parameters: values bound to the placeholders (?) of the command
+        :type parameters: Tuple
         :return: list of the table's rows selected by the command
-        :rtype: List[Tuple]
+        :rtype: List[Any]
         """
-        rows = []
+        cursor = self._get_cursor()
+        if row_factory is not None:  # dedicated cursor, to leave the shared one untouched
+            cursor = cursor.connection.cursor()
+            cursor.row_factory = row_factory
         try:
-            self.db_cursor.execute(execution_cmd)
+            cursor.execute(execution_cmd, parameters)
         except sqlite3.OperationalError:
-            return rows
-        while True:
-            row = self.db_cursor.fetchone()
-            if row is None:
-                break
-            rows.append(row)
-        return rows
+            return []
+        return cursor.fetchall()
 
     def get_row_by_key(self, table: Table, key_value) -> Optional[Tuple]:
         """
@@ -101,7 +256,8 @@ class DataBase:
     def get_conditions_rows(self, table: Table,
                             selection: Union[str, List[str]] = '*',
                             conditions_list: Optional[List[Tuple[str, SQLConditionEnum, Any]]] = None,
-                            order_list: Optional[List[str]] = None) -> List[Tuple]:
+                            order_list: Optional[List[str]] = None,
+                            row_factory: Optional[Callable] = None) -> List[Any]:
         """
         Select rows with optional conditions and optional order
 
@@ -113,8 +269,11 @@ class DataBase:
         :type conditions_list: Optional[List[Tuple[str, SQLConditionEnum, Any]]]
         :param order_list: List of SQL type order by
         :type order_list: Optional[List[str]]
+        :param row_factory: function (cursor, row) -> Any to decode the rows (ex: Table.row_factory), None to
+            return them as Tuple
+        :type row_factory: Optional[Callable]
         :return: the selected rows
-        :rtype: List[Tuple]
+        :rtype: List[Any]
         """
         if isinstance(selection, List):
             selection = ','.join(selection)
@@ -125,18 +284,20 @@ class DataBase:
         execution_cmd = f"SELECT {selection} from {table.name}"
         execution_cmd = self._add_conditions(execution_cmd, conditions_list=conditions_list)
         execution_cmd = self._add_order(execution_cmd, order_list=order_list)
-        return self._fetch_rows(execution_cmd)
+        return self._fetch_rows(execution_cmd, row_factory=row_factory)
 
-    def get_all_rows(self, table: Table) -> List[Tuple]:
+    def get_all_rows(self, table: Table, row_factory: Optional[Callable] = None) -> List[Any]:
         """
         Get all the rows of a table
 
         :param table: table to get the rows from
         :type table: Table
+        :param row_factory: function (cursor, row) -> Any to decode the rows, None to return them as Tuple
+        :type row_factory: Optional[Callable]
         :return: all the rows of the table
-        :rtype: List[Tuple]
+        :rtype: List[Any]
         """
-        return self.get_conditions_rows(table)
+        return self.get_conditions_rows(table, row_factory=row_factory)
 
     def add_row(self, table: Table, row: Tuple, auto_commit: bool = True, update_if_exists: bool = False):
         """
@@ -154,18 +315,17 @@ class DataBase:
         :return: None
         :rtype: None
         """
-        row_s = ", ".join(f"'{v}'" for v in row)
-        row_s = f'({row_s})'
-        execution_order = f"INSERT INTO {table.name} VALUES {row_s}"
+        execution_order = self.get_insert_cmd(table)
+
+        def job(cursor: sqlite3.Cursor):
+            try:
+                cursor.execute(execution_order, row)
+            except sqlite3.OperationalError:
+                self.create_table(table)
+                cursor.execute(execution_order, row)
+
         try:
-            self.db_cursor.execute(execution_order)
-            if auto_commit:
-                self.commit()
-        except sqlite3.OperationalError:
-            self.create_table(table)
-            self.db_cursor.execute(execution_order)
-            if auto_commit:
-                self.commit()
+            self._execute_write(job, auto_commit=auto_commit)
         except sqlite3.IntegrityError as err:
             if update_if_exists:
                 self.update_row(table, row, auto_commit)
@@ -175,7 +335,8 @@ class DataBase:
                 self.logger.error(msg)
                 raise err
 
-    def add_rows(self, table: Table, rows: List[Tuple], auto_commit: bool = True, update_if_exists: bool = False):
+    def add_rows(self, table: Table, rows: List[Tuple], auto_commit: bool = True, update_if_exists: bool = False,
+                 skip_existing: bool = False):
         """
         Add several rows to a table
 
@@ -188,13 +349,30 @@ class DataBase:
         :param update_if_exists: if an integrity error is raised and this parameter is true,
             will update the existing row
         :type update_if_exists: bool
+        :param skip_existing: if the rows conflicting with an existing row (primary key or unique index) should be
+            ignored
+        :type skip_existing: bool
         :return: None
         :rtype: None
         """
-        for row in rows:
-            self.add_row(table, row, auto_commit=False, update_if_exists=update_if_exists)
-        if auto_commit:
-            self.commit()
+        if update_if_exists:
+            def add_all():
+                for row in rows:
+                    self.add_row(table, row, auto_commit=False, update_if_exists=True)
+
+            self.run_in_transaction(add_all, auto_commit=auto_commit)
+            return
+
+        execution_order = self.get_insert_cmd(table, skip_existing=skip_existing)
+
+        def job(cursor: sqlite3.Cursor):
+            try:
+                cursor.executemany(execution_order, rows)
+            except sqlite3.OperationalError:
+                self.create_table(table)
+                cursor.executemany(execution_order, rows)
+
+        self._execute_write(job, auto_commit=auto_commit)
 
     def update_row(self, table: Table, row: Tuple, auto_commit=True):
         """
@@ -209,11 +387,40 @@ class DataBase:
         :return: None
         :rtype: None
         """
-        row_s = ", ".join(f"{n} = {v}" for n, v in zip(table.columns_names, row))
-        execution_order = f"UPDATE {table.name} SET {row_s} WHERE {table.primary_key} = {row[0]}"
-        self.db_cursor.execute(execution_order)
-        if auto_commit:
-            self.commit()
+        if table.primary_key is None:
+            raise ValueError(f"table {table.name} has no explicit primary key")
+        row_s = ", ".join(f"[{n}] = ?" for n in table.columns_names)
+        execution_order = f"UPDATE {table.name} SET {row_s} WHERE [{table.primary_key}] = ?"
+        self._execute_write(lambda cursor: cursor.execute(execution_order, (*row[1:], row[0])),
+                            auto_commit=auto_commit)
+
+    def delete_conditions_rows(self, table: Table,
+                               conditions_list: Optional[List[Tuple[str, SQLConditionEnum, Any]]] = None,
+                               auto_commit: bool = True):
+        """
+        Delete the rows of a table matching some conditions (all the rows if no condition is provided)
+
+        :param table: table to delete the rows from
+        :type table: Table
+        :param conditions_list: list of conditions to select the rows to delete
+        :type conditions_list: Optional[List[Tuple[str, SQLConditionEnum, Any]]]
+        :param auto_commit: if the database state should be saved after the changes
+        :type auto_commit:  bool
+        :return: None
+        :rtype: None
+        """
+        if conditions_list is None:
+            conditions_list = []
+        execution_cmd = f"DELETE FROM {table.name}"
+        execution_cmd = self._add_conditions(execution_cmd, conditions_list=conditions_list)
+
+        def job(cursor: sqlite3.Cursor):
+            try:
+                cursor.execute(execution_cmd)
+            except sqlite3.OperationalError:  # the table does not exist yet
+                pass
+
+        self._execute_write(job, auto_commit=auto_commit)
 
     def create_table(self, table: Table):
         """
@@ -224,9 +431,13 @@ class DataBase:
         :return: None
         :rtype: None
         """
-        create_cmd = self.get_create_cmd(table)
-        self.db_cursor.execute(create_cmd)
-        self.db_conn.commit()
+        create_cmds = [self.get_create_cmd(table)] + self.get_create_index_cmds(table)
+
+        def job(cursor: sqlite3.Cursor):
+            for create_cmd in create_cmds:
+                cursor.execute(create_cmd)
+
+        self._execute_write(job)
 
     def drop_table(self, table: Union[Table, str]):
         """
@@ -240,8 +451,7 @@ class DataBase:
         if isinstance(table, Table):
             table = table.name
         execution_order = f"DROP TABLE IF EXISTS {table}"
-        self.db_cursor.execute(execution_order)
-        self.db_conn.commit()
+        self._execute_write(lambda cursor: cursor.execute(execution_order))
 
     def drop_all_tables(self):
         """
@@ -251,9 +461,12 @@ class DataBase:
         :rtype: None
         """
         tables_desc = self.get_all_tables()
-        for table_desc in tables_desc:
-            self.drop_table(table_desc[1])
-        self.commit()
+
+        def drop_all():
+            for table_desc in tables_desc:
+                self.drop_table(table_desc[1])
+
+        self.run_in_transaction(drop_all)
 
     def get_all_tables(self) -> List[Tuple]:
         """
@@ -268,11 +481,146 @@ class DataBase:
     def commit(self):
         """
         Submit and save the database state
+        In concurrent mode, wait until the writer thread has committed all the jobs submitted so far.
+
+        :return: None
+        :rtype: None
+        """
+        self.connect()
+        if not self.concurrent:
+            if self.db_conn.job_depth:  # the running job is committed once it is over
+                return
+            start = time.perf_counter()
+            self.db_conn.commit()
+            get_metrics().observe('scanwatch_db_commit_seconds', time.perf_counter() - start, db=self.name)
+        elif not self._writer.is_writer_thread():
+            self._writer.flush()
+
+    def export_snapshot(self, path: Union[str, Path], snapshot_format: SNAPSHOT_FORMAT = SNAPSHOT_FORMAT.SQLITE):
+        """
+        Save a copy of the database in a gzip file, with all its tables (including the synchronisation states), so
+        that another node can load it with import_snapshot and resume the updates from it.
+        The copy is made with the online backup API of sqlite3: the database can be used during the export, the
+        snapshot holds the state committed when it starts.
+
+        :param path: path of the snapshot file to write
+        :type path: Union[str, Path]
+        :param snapshot_format: SQLITE for a copy of the database file, SQL for a dump of SQL statements, which is
+            larger but can be loaded by any sqlite version
+        :type snapshot_format: SNAPSHOT_FORMAT
+        :return: None
+        :rtype: None
+        """
+        from ScanWatch import __version__  # imported here to avoid a circular import
+
+        path = Path(path)
+        self.commit()
+        copy_path = path.parent / f".{path.name}.tmp"
+        copy_conn = sqlite3.connect(copy_path)
+        try:
+            self._get_cursor().connection.backup(copy_conn)
+            copy_conn.execute("CREATE TABLE IF NOT EXISTS snapshot_info ([key] TEXT PRIMARY KEY, [value] TEXT)")
+            copy_conn.executemany("INSERT OR REPLACE INTO snapshot_info VALUES (?, ?)",
+                                  [('version', __version__), ('database', self.name),
+                                   ('created_at', str(int(time.time())))])
+            copy_conn.commit()
+            copy_conn.execute("PRAGMA journal_mode=DELETE")  # the snapshot is a single file
+            copy_conn.execute("VACUUM")
+            with gzip.open(path, 'wb') as file:
+                if snapshot_format == SNAPSHOT_FORMAT.SQL:
+                    for line in copy_conn.iterdump():
+                        file.write(f"{line}\n".encode())
+                else:
+                    copy_conn.close()
+                    with open(copy_path, 'rb') as copy_file:
+                        shutil.copyfileobj(copy_file, file)
+        finally:
+            copy_conn.close()
+            copy_path.unlink()
+
+    def import_snapshot(self, path: Union[str, Path]) -> Dict[str, str]:
+        """
+        Replace the whole content of the database by a snapshot written by export_snapshot (in any format).
+        The database should not be written to by other instances or processes during the import.
+        The snapshots must come from a trusted source: the statements of an SQL snapshot are executed one by one,
+        and the ones attaching other database files or changing the settings of the connection are refused.
+
+        :param path: path of the snapshot file
+        :type path: Union[str, Path]
+        :return: information on the snapshot: version of the library, name of the exported database and
+            creation timestamp
+        :rtype: Dict[str, str]
+        """
+        path = Path(path)
+        self.connect()
+        self.commit()
+        copy_path = path.parent / f".{path.name}.tmp"
+        copy_conn = None
+        try:
+            with gzip.open(path, 'rb') as file:
+                header = file.read(16)
+                file.seek(0)
+                if header == b"SQLite format 3\x00":
+                    with open(copy_path, 'wb') as copy_file:
+                        shutil.copyfileobj(file, copy_file)
+                    copy_conn = sqlite3.connect(copy_path)
+                else:
+                    copy_conn = sqlite3.connect(copy_path, isolation_level=None)  # the dump holds its transaction
+                    copy_conn.set_authorizer(self._authorize_snapshot_statement)
+                    self._load_sql_dump(copy_conn, io.TextIOWrapper(file, encoding='utf-8'))
+            info = dict(copy_conn.execute("SELECT * FROM snapshot_info").fetchall())
+            conn = open_connection(self.save_path)
+            try:
+                copy_conn.backup(conn)
+                conn.execute("DROP TABLE IF EXISTS snapshot_info")
+                conn.commit()
+            finally:
+                conn.close()
+        finally:
+            if copy_conn is not None:
+                copy_conn.close()
+            copy_path.unlink(missing_ok=True)
+        return info
 
+    @staticmethod
+    def _load_sql_dump(conn: sqlite3.Connection, lines: Iterable[str]):
+        """
+        Execute the statements of an SQL dump one at a time, without loading the whole dump in memory
+
+        :param conn: connection to the database to fill
+        :type conn: sqlite3.Connection
+        :param lines: lines of the dump
+        :type lines: Iterable[str]
         :return: None
         :rtype: None
         """
-        self.db_conn.commit()
+        statement = ""
+        for line in lines:
+            statement += line
+            if sqlite3.complete_statement(statement):
+                conn.execute(statement)
+                statement = ""
+        if statement.strip():
+            raise ValueError("the SQL snapshot ends with an incomplete statement")
+
+    @staticmethod
+    def _authorize_snapshot_statement(action: int, arg1: Optional[str], *_) -> int:
+        """
+        Authorizer of the connection loading an SQL snapshot: refuse to attach or detach databases and to execute
+        pragmas, except the foreign keys one written by the dumps of recent sqlite3 versions
+
+        :param action: code of the action to authorize
+        :type action: int
+        :param arg1: first argument of the action (name of the pragma for a pragma)
+        :type arg1: Optional[str]
+        :return: SQLITE_OK or SQLITE_DENY
+        :rtype: int
+        """
+        if action in (sqlite3.SQLITE_ATTACH, sqlite3.SQLITE_DETACH):
+            return sqlite3.SQLITE_DENY
+        if action == sqlite3.SQLITE_PRAGMA and (arg1 or "").lower() != "foreign_keys":
+            return sqlite3.SQLITE_DENY
+        return sqlite3.SQLITE_OK
 
     @staticmethod
     def _add_conditions(execution_cmd: str, conditions_list: List[Tuple[str, SQLConditionEnum, Any]]):
@@ -314,6 +662,39 @@ class DataBase:
         else:
             return execution_cmd
 
+    @staticmethod
+    def get_insert_cmd(table: Table, skip_existing: bool = False) -> str:
+        """
+        Return the parametrized command to insert a full row in a table
+
+        :param table: table to insert the rows in
+        :type table: Table
+        :param skip_existing: if the rows conflicting with an existing row should be ignored
+        :type skip_existing: bool
+        :return: insert command with one placeholder per column
+        :rtype: str
+        """
+        insert = "INSERT OR IGNORE" if skip_existing else "INSERT"
+        return f"{insert} INTO {table.name} VALUES ({', '.join('?' * len(table.keys))})"
+
+    @staticmethod
+    def get_create_index_cmds(table: Table) -> List[str]:
+        """
+        Return the commands to create the indexes of a table
+
+        :param table: Table instance with the config of the table
+        :type table: Table
+        :return: execution commands for the indexes creation
+        :rtype: List[str]
+        """
+        cmds = []
+        for columns, unique in table.indexes:
+            unique_s = "UNIQUE " if unique else ""
+            columns_s = ", ".join(f"[{c}]" for c in columns)
+            cmds.append(f"CREATE {unique_s}INDEX IF NOT EXISTS {table.name}_{'_'.join(columns)} "
+                        f"ON {table.name} ({columns_s})")
+        return cmds
+
     @staticmethod
     def get_create_cmd(table: Table) -> str:
         """
@@ -0,0 +1,220 @@
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+from ScanWatch.utils.metrics import get_metrics
+
+# pragmas applied to every connection: WAL lets the readers work while a write is in progress
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,  # in KiB when negative: 64MB of page cache
+    'mmap_size': 256 * 1024 ** 2,
+    'temp_store': 'MEMORY',
+}
+BUSY_TIMEOUT = 30  # seconds a connection waits for a lock before raising "database is locked"
+
+
+def open_connection(save_path: Path, **kwargs) -> sqlite3.Connection:
+    """
+    Open a sqlite3 connection with the tuned pragmas
+
+    :param save_path: path of the database file
+    :type save_path: Path
+    :param kwargs: keyword arguments for sqlite3.connect
+    :type kwargs: Any
+    :return: the connection
+    :rtype: sqlite3.Connection
+    """
+    conn = sqlite3.connect(save_path, timeout=BUSY_TIMEOUT, **kwargs)
+    for pragma, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma}={value}")
+    return conn
+
+
+class DataBaseWriter:
+    """
+    Dedicated thread that executes all the writes to a database file. Jobs submitted by any number of producer
+    threads are executed in order, grouped in batches that are committed together. Each job runs in its own
+    savepoint, so a failing job is rolled back without affecting the other jobs of the batch.
+    One writer is shared by all the users of a database file, see DataBaseWriter.get_writer.
+    """
+
+    _writers: Dict[Path, 'DataBaseWriter'] = {}
+    _writers_lock = threading.Lock()
+
+    def __init__(self, save_path: Path, batch_size: int = 256):
+        """
+        Start a writer thread for a database file
+
+        :param save_path: path of the database file
+        :type save_path: Path
+        :param batch_size: maximum number of jobs committed together
+        :type batch_size: int
+        """
+        self.save_path = save_path
+        self.batch_size = batch_size
+        self.users = 0
+        self.cursor = None  # cursor of the writer connection, only usable from the writer thread
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f"ScanWatch-writer-{save_path.name}", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def get_writer(cls, save_path: Path) -> 'DataBaseWriter':
+        """
+        Return the writer of a database file, start it if needed. Each call must be matched with a call to
+        release.
+
+        :param save_path: path of the database file
+        :type save_path: Path
+        :return: the writer of the file
+        :rtype: DataBaseWriter
+        """
+        with cls._writers_lock:
+            writer = cls._writers.get(save_path)
+            if writer is None:
+                writer = cls(save_path)
+                cls._writers[save_path] = writer
+            writer.users += 1
+            return writer
+
+    def release(self):
+        """
+        Release the writer, the thread is stopped once all its users have released it
+
+        :return: None
+        :rtype: None
+        """
+        with self._writers_lock:
+            self.users -= 1
+            if self.users > 0:
+                return
+            if self._writers.get(self.save_path) is self:  # may have been replaced after a close_all
+                del self._writers[self.save_path]
+        self.close()
+
+    @classmethod
+    def close_all(cls):
+        """
+        Stop all the writers, whatever their number of users
+
+        :return: None
+        :rtype: None
+        """
+        with cls._writers_lock:
+            writers = list(cls._writers.values())
+            cls._writers = {}
+        for writer in writers:
+            writer.close()
+
+    def is_writer_thread(self) -> bool:
+        """
+        Return True if the current thread is the writer thread
+
+        :return: if the caller is executed by the writer
+        :rtype: bool
+        """
+        return threading.get_ident() == self._thread.ident
+
+    def submit(self, job: Callable[[sqlite3.Cursor], Any]) -> Future:
+        """
+        Submit a job to the writer
+
+        :param job: function executed with a cursor of the writer connection
+        :type job: Callable[[sqlite3.Cursor], Any]
+        :return: future of the job result, resolved once the job is committed
+        :rtype: Future
+        """
+        future = Future()
+        self._queue.put((job, future))
+        return future
+
+    def flush(self):
+        """
+        Wait until all the jobs submitted so far are committed
+
+        :return: None
+        :rtype: None
+        """
+        self.submit(lambda cursor: None).result()
+
+    def close(self):
+        """
+        Commit the pending jobs and stop the writer thread
+
+        :return: None
+        :rtype: None
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self):
+        """
+        Loop of the writer thread
+
+        :return: None
+        :rtype: None
+        """
+        conn = open_connection(self.save_path, isolation_level=None)  # transactions are handled manually
+        cursor = self.cursor = conn.cursor()
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                running = False
+            batch = [e for e in batch if e is not None]
+            if not len(batch):
+                continue
+            self._execute_batch(cursor, batch, self.save_path.stem)
+        conn.close()
+
+    @staticmethod
+    def _execute_batch(cursor: sqlite3.Cursor, batch, db_name: str):
+        """
+        Execute a batch of jobs in a single transaction and resolve their futures after the commit
+
+        :param cursor: cursor of the writer connection
+        :type cursor: sqlite3.Cursor
+        :param batch: list of (job, future)
+        :type batch: List[Tuple[Callable, Future]]
+        :param db_name: name of the database, for the metrics
+        :type db_name: str
+        :return: None
+        :rtype: None
+        """
+        outcomes = []
+        cursor.execute("BEGIN")
+        for job, future in batch:
+            cursor.execute("SAVEPOINT job")
+            try:
+                result = job(cursor)
+            except BaseException as err:
+                cursor.execute("ROLLBACK TO job")
+                cursor.execute("RELEASE job")
+                outcomes.append((future, None, err))
+            else:
+                cursor.execute("RELEASE job")
+                outcomes.append((future, result, None))
+        try:
+            start = time.perf_counter()
+            cursor.execute("COMMIT")
+            get_metrics().observe('scanwatch_db_commit_seconds', time.perf_counter() - start, db=db_name)
+        except sqlite3.Error as err:
+            cursor.execute("ROLLBACK")
+            outcomes = [(future, None, err) for future, _, _ in outcomes]
+        for future, result, err in outcomes:
+            if err is None:
+                future.set_result(result)
+            else:
+                future.set_exception(err)
@@ -0,0 +1,148 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Optional
+
+from ScanWatch.utils.paths import get_data_path
+from ScanWatch.utils.urls import strip_api_key
+
+
+class ResponseCache:
+    """
+    On-disk cache of API results. It is meant to store only the results that can not change anymore
+    (block ranges below the finality depth), the decision of what to cache belongs to the caller.
+    Entries are keyed by the request url without the api key and the least recently used entries are evicted
+    when the cache grows over its maximum size.
+    """
+
+    def __init__(self, folder: Optional[Path] = None, max_size: int = 512 * 1024 ** 2):
+        """
+        Initialise a response cache
+
+        :param folder: folder where to store the cached responses, default to a folder in the data path
+        :type folder: Optional[Path]
+        :param max_size: maximum size in bytes of the cache on the disk
+        :type max_size: int
+        """
+        self.folder = Path(folder) if folder is not None else get_data_path() / "response_cache"
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._size = None
+        os.makedirs(self.folder, exist_ok=True)
+
+    @staticmethod
+    def get_key(url: str) -> str:
+        """
+        Return the cache key of a request url
+
+        :param url: url of the request
+        :type url: str
+        :return: cache key
+        :rtype: str
+        """
+        return strip_api_key(url)
+
+    def get(self, url: str) -> Optional[Any]:
+        """
+        Return the cached result of a request, None if the request is not cached
+
+        :param url: url of the request
+        :type url: str
+        :return: cached API result
+        :rtype: Optional[Any]
+        """
+        path = self._get_path(url)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as file:
+                result = json.load(file)
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)  # mark as recently used for the eviction
+        except OSError:
+            pass
+        return result
+
+    def set(self, url: str, result: Any):
+        """
+        Save the result of a request in the cache
+
+        :param url: url of the request
+        :type url: str
+        :param result: API result to save
+        :type result: Any
+        :return: None
+        :rtype: None
+        """
+        path = self._get_path(url)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as file:
+            json.dump(result, file)
+        with self._lock:
+            size = self._get_size()
+            if path.exists():
+                size -= path.stat().st_size
+            os.replace(tmp_path, path)
+            self._size = size + path.stat().st_size
+            if self._size > self.max_size:
+                self._evict()
+
+    def clear(self):
+        """
+        Remove all the entries of the cache
+
+        :return: None
+        :rtype: None
+        """
+        with self._lock:
+            for path in self.folder.glob("*.json.gz"):
+                path.unlink()
+            self._size = 0
+
+    def _get_path(self, url: str) -> Path:
+        """
+        Return the path of the file storing the result of a request
+
+        :param url: url of the request
+        :type url: str
+        :return: path of the cache entry
+        :rtype: Path
+        """
+        digest = hashlib.sha256(self.get_key(url).encode()).hexdigest()
+        return self.folder / f"{digest}.json.gz"
+
+    def _get_size(self) -> int:
+        """
+        Return the total size of the cache entries, computed from the disk on the first call
+
+        :return: size in bytes
+        :rtype: int
+        """
+        if self._size is None:
+            self._size = sum(p.stat().st_size for p in self.folder.glob("*.json.gz"))
+        return self._size
+
+    def _evict(self):
+        """
+        Remove the least recently used entries until the cache size is below 90% of its maximum size
+
+        :return: None
+        :rtype: None
+        """
+        entries = []
+        for path in self.folder.glob("*.json.gz"):
+            stat = path.stat()
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        target = 0.9 * self.max_size
+        for _, size, path in entries:
+            if self._size <= target:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            self._size -= size
@@ -1,23 +1,594 @@
-from typing import Dict, List
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+import hashlib
+import json
+import sqlite3
 
-from ScanWatch.storage.DataBase import DataBase
-from ScanWatch.storage.tables import get_transaction_table
+from ScanWatch.storage.DataBase import DataBase, SQLConditionEnum
+from ScanWatch.storage.StorageEncoding import StorageEncoding
+from ScanWatch.storage.TransactionArchive import TransactionArchive
+from ScanWatch.storage.tables import Table, get_archive_state_table, get_change_log_table, get_coverage_table, \
+    get_flow_table, get_membership_table, get_shared_transaction_table, get_sync_state_table, get_token_table, \
+    get_transaction_table
 from ScanWatch.utils.enums import TRANSACTION, NETWORK
+from ScanWatch.utils.metrics import get_metrics
+from ScanWatch.utils.tracing import span
 
 
 class ScanDataBase(DataBase):
     """
     Handles the recording of the address transactions in a local database
+
+    By default, the transactions of each address are stored in their own table. In shared storage mode, the
+    transactions of all the addresses are stored once in a table per network and type of transaction, and a
+    membership table links each address to its transactions: a transfer between two watched addresses is stored
+    only once. The two modes use different tables, the history of an address is fetched again when switching modes.
+
+    With the change log enabled, the newly stored transactions are also appended to a log with an increasing
+    sequence number, from which the consumers can read only the transactions stored since their last read
+    (see get_changes). The transactions removed by a chain reorganisation are not logged.
+
+    With an archive, the old transactions can be moved from the database to Parquet files (see
+    archive_transactions). The transactions are then read from both, transparently.
+
+    With the flow index enabled, the transfers of the recorded addresses are also aggregated per counterparty and
+    asset as they are stored, to find the main counterparties of an address without reading its history (see
+    get_counterparties).
     """
 
-    def __init__(self, name: str = 'scan_db'):
+    TOKEN_COLUMNS = ('tokenName', 'tokenSymbol', 'tokenDecimal')
+    # columns identifying a transaction in the shared storage mode (the API gives no log index for the transfers)
+    KEY_COLUMNS = {
+        TRANSACTION.NORMAL: ('hash',),
+        TRANSACTION.INTERNAL: ('hash', 'traceId'),
+        TRANSACTION.ERC20: ('hash', 'contractAddress', 'from', 'to', 'value'),
+        TRANSACTION.ERC721: ('hash', 'contractAddress', 'tokenID', 'from', 'to'),
+    }
+    # types of transactions aggregated in the flow index (the value of an erc721 transfer is not an amount)
+    FLOW_TRANSACTIONS = (TRANSACTION.NORMAL, TRANSACTION.INTERNAL, TRANSACTION.ERC20)
+
+    def __init__(self, name: str = 'scan_db', concurrent: bool = False, encoding: Optional[StorageEncoding] = None,
+                 shared_storage: bool = False, change_log: bool = False,
+                 archive: Optional[TransactionArchive] = None, flow_index: bool = False):
         """
         Initialise a Scan database instance
 
         :param name: name of the database
         :type name: str
+        :param concurrent: if the database will be used from several threads, see DataBase
+        :type concurrent: bool
+        :param encoding: compact encoding of the stored transactions, None to store them as returned by the API.
+            The same encoding should be given to every instance reading the database.
+        :type encoding: Optional[StorageEncoding]
+        :param shared_storage: if the transactions should be stored once for all the addresses
+        :type shared_storage: bool
+        :param change_log: if the stored transactions should be appended to the change log
+        :type change_log: bool
+        :param archive: archive of the old transactions, required to read the histories partly archived
+        :type archive: Optional[TransactionArchive]
+        :param flow_index: if the stored transfers should be aggregated in the flow index
+        :type flow_index: bool
+        """
+        super().__init__(name, concurrent=concurrent)
+        self.encoding = encoding
+        self.shared_storage = shared_storage
+        self.change_log = change_log
+        self.archive = archive
+        self.flow_index = flow_index
+        self._tokens: Dict[str, Dict[str, Tuple]] = {}  # token table name -> contract address -> metadata
+
+    def import_snapshot(self, path: Union[str, Path]) -> Dict[str, str]:
+        """
+        Replace the whole content of the database by a snapshot, see DataBase.import_snapshot. The updates of the
+        histories of the snapshot resume from their last recorded block. The archive files, if any, are not part
+        of the snapshot and should be copied separately.
+
+        :param path: path of the snapshot file
+        :type path: Union[str, Path]
+        :return: information on the snapshot
+        :rtype: Dict[str, str]
+        """
+        info = super().import_snapshot(path)
+        self._tokens = {}
+        return info
+
+    def _normalizes_tokens(self, table: Table) -> bool:
+        """
+        Return True if the token metadata of the rows written in a table is stored in the token table
+
+        :param table: table of the transactions
+        :type table: Table
+        :return: if the token metadata is normalized
+        :rtype: bool
+        """
+        return (self.encoding is not None and self.encoding.normalize_tokens
+                and all(column in table.keys for column in self.TOKEN_COLUMNS))
+
+    def _get_tokens(self, nt_type: NETWORK, net: str, reload: bool = False) -> Dict[str, Tuple]:
+        """
+        Return the token metadata recorded for a network, loaded once from the token table
+
+        :param nt_type: type of network
+        :type nt_type: NETWORK
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str
+        :param reload: if the metadata should be read again from the database
+        :type reload: bool
+        :return: (tokenName, tokenSymbol, tokenDecimal) per contract address
+        :rtype: Dict[str, Tuple]
+        """
+        token_table = get_token_table(nt_type, net)
+        tokens = self._tokens.get(token_table.name)
+        if tokens is None or reload:
+            tokens = {row[0]: tuple(row[1:]) for row in self.get_all_rows(token_table)}
+            self._tokens[token_table.name] = tokens
+        return tokens
+
+    def get_token_metadata(self, nt_type: NETWORK, net: str, contract_address: str) -> Optional[Dict]:
+        """
+        Return the metadata of a token recorded in the token table (only filled when the tokens are normalized,
+        see StorageEncoding)
+
+        :param nt_type: type of network
+        :type nt_type: NETWORK
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str
+        :param contract_address: contract address of the token
+        :type contract_address: str
+        :return: tokenName, tokenSymbol and tokenDecimal of the token, None if it is not recorded
+        :rtype: Optional[Dict]
+        """
+        metadata = self._get_tokens(nt_type, net).get(contract_address)
+        if metadata is None:
+            metadata = self._get_tokens(nt_type, net, reload=True).get(contract_address)
+        if metadata is not None:
+            return dict(zip(self.TOKEN_COLUMNS, metadata))
+
+    def _to_rows(self, table: Table, nt_type: NETWORK, net: str, transactions: List[Dict],
+                 normalize: bool = True) -> Tuple[List[Tuple], Dict[str, Tuple]]:
+        """
+        Convert transactions to the rows stored in a table. When the tokens are normalized, the token metadata
+        already recorded (or new in this list) for a contract is removed from the rows.
+
+        :param table: table of the transactions
+        :type table: Table
+        :param nt_type: type of network
+        :type nt_type: NETWORK
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str
+        :param transactions: transactions as returned by the API
+        :type transactions: List[Dict]
+        :param normalize: False to keep the token metadata in the rows
+        :type normalize: bool
+        :return: rows to store and metadata of the tokens to add to the token table
+        :rtype: Tuple[List[Tuple], Dict[str, Tuple]]
+        """
+        rows = table.dicts_to_tuples(transactions)
+        new_tokens = {}
+        if normalize and self._normalizes_tokens(table):
+            tokens = self._get_tokens(nt_type, net)
+            indices = [table.keys.index(column) for column in self.TOKEN_COLUMNS]
+            contract_index = table.keys.index('contractAddress')
+            normalized_rows = []
+            for row in rows:
+                contract = row[contract_index]
+                metadata = tuple(row[i] for i in indices)
+                known = tokens.get(contract) or new_tokens.get(contract)
+                if known is None:
+                    known = new_tokens[contract] = metadata
+                if known == metadata:  # a transfer with other metadata than the recorded one keeps its own
+                    row = list(row)
+                    for i in indices:
+                        row[i] = None
+                    row = tuple(row)
+                normalized_rows.append(row)
+            rows = normalized_rows
+        if self.encoding is not None:
+            rows = list(map(self.encoding.get_encoder(table), rows))
+        return rows, new_tokens
+
+    def _check_new_tokens(self, table: Table, nt_type: NETWORK, net: str, transactions: List[Dict],
+                          rows: List[Tuple], new_tokens: Dict[str, Tuple]) -> Tuple[List[Tuple], Dict[str, Tuple]]:
+        """
+        Check the new tokens of rows against the token table, from the write job: another instance may have
+        recorded some of them since the tokens were loaded. If one was recorded with other metadata, the rows are
+        converted again so that its transfers keep their own metadata.
+
+        :param table: table of the transactions
+        :type table: Table
+        :param nt_type: type of network
+        :type nt_type: NETWORK
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str
+        :param transactions: transactions as returned by the API
+        :type transactions: List[Dict]
+        :param rows: rows of the transactions, see _to_rows
+        :type rows: List[Tuple]
+        :param new_tokens: metadata of the tokens to add, see _to_rows
+        :type new_tokens: Dict[str, Tuple]
+        :return: rows to store and metadata of the tokens to add to the token table
+        :rtype: Tuple[List[Tuple], Dict[str, Tuple]]
+        """
+        if not len(new_tokens):
+            return rows, new_tokens
+        tokens = self._get_tokens(nt_type, net, reload=True)
+        if any(tokens.get(contract, metadata) != metadata for contract, metadata in new_tokens.items()):
+            return self._to_rows(table, nt_type, net, transactions)
+        return rows, {contract: metadata for contract, metadata in new_tokens.items() if contract not in tokens}
+
+    def _add_tokens(self, nt_type: NETWORK, net: str, new_tokens: Dict[str, Tuple]):
+        """
+        Record the metadata of new tokens in the token table, without committing. The metadata already recorded
+        for a contract is kept.
+
+        :param nt_type: type of network
+        :type nt_type: NETWORK
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str
+        :param new_tokens: (tokenName, tokenSymbol, tokenDecimal) per contract address
+        :type new_tokens: Dict[str, Tuple]
+        :return: None
+        :rtype: None
+        """
+        if len(new_tokens):
+            rows = [(contract, *metadata) for contract, metadata in new_tokens.items()]
+            self.add_rows(get_token_table(nt_type, net), rows, auto_commit=False, skip_existing=True)
+
+    def _fill_tokens(self, table: Table, nt_type: NETWORK, net: str, transactions: List[Dict]) -> List[Dict]:
+        """
+        Put back the token metadata in the transactions read from a table where it was normalized
+
+        :param table: table of the transactions
+        :type table: Table
+        :param nt_type: type of network
+        :type nt_type: NETWORK
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str
+        :param transactions: transactions read from the table
+        :type transactions: List[Dict]
+        :return: the same transactions, completed
+        :rtype: List[Dict]
+        """
+        if not all(column in table.keys for column in self.TOKEN_COLUMNS):
+            return transactions
+        tokens = None
+        for transaction in transactions:
+            if transaction['tokenName'] is None and transaction['tokenDecimal'] is None:
+                if tokens is None:
+                    tokens = self._get_tokens(nt_type, net)
+                metadata = tokens.get(transaction['contractAddress'])
+                if metadata is None:  # recorded by another instance since the tokens were loaded
+                    tokens = self._get_tokens(nt_type, net, reload=True)
+                    metadata = tokens.get(transaction['contractAddress'], (None, None, None))
+                transaction.update(zip(self.TOKEN_COLUMNS, metadata))
+        return transactions
+
+    def _get_row_factory(self, table: Table) -> Callable:
+        """
+        Return the row factory decoding the stored rows of a table into transactions
+
+        :param table: table of the transactions
+        :type table: Table
+        :return: row factory
+        :rtype: Callable
+        """
+        if self.encoding is not None:
+            return self.encoding.get_row_factory(table)
+        return table.row_factory
+
+    @classmethod
+    def get_transaction_keys(cls, tr_type: TRANSACTION, transactions: List[Dict]) -> List[str]:
+        """
+        Return the keys identifying transactions in the shared storage mode. Identical transfers within a
+        transaction are told apart by their occurrence number.
+
+        :param tr_type: type of the transactions
+        :type tr_type: TRANSACTION
+        :param transactions: transactions as returned by the API
+        :type transactions: List[Dict]
+        :return: key of each transaction
+        :rtype: List[str]
+        """
+        columns = cls.KEY_COLUMNS[tr_type]
+        keys = []
+        occurrences = {}
+        for transaction in transactions:
+            key = '|'.join(transaction[column] for column in columns)
+            occurrence = occurrences.get(key, 0)
+            occurrences[key] = occurrence + 1
+            keys.append(key if occurrence == 0 else f"{key}#{occurrence}")
+        return keys
+
+    def _add_shared_rows(self, address: str, nt_type: NETWORK, net: str, tr_type: TRANSACTION,
+                         keys: List[str], rows: List[Tuple], transactions: List[Dict]):
+        """
+        Record transactions in the shared storage mode without committing: the rows not already stored are
+        added to the shared table and linked to the address in the membership table
+
+        :param address: address involved in the transactions
+        :type address: str
+        :param nt_type: type of network
+        :type nt_type: NETWORK
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str
+        :param tr_type: type of the transactions
+        :type tr_type: TRANSACTION
+        :param keys: keys of the transactions, see get_transaction_keys
+        :type keys: List[str]
+        :param rows: rows of the transactions, see _to_rows
+        :type rows: List[Tuple]
+        :param transactions: transactions as returned by the API
+        :type transactions: List[Dict]
+        :return: None
+        :rtype: None
+        """
+        shared_rows = [(key, *row) for key, row in zip(keys, rows)]
+        self.add_rows(get_shared_transaction_table(nt_type, net, tr_type), shared_rows, auto_commit=False,
+                      skip_existing=True)
+        membership_rows = [(address, key, int(tx['blockNumber'])) for key, tx in zip(keys, transactions)]
+        self.add_rows(get_membership_table(nt_type, net, tr_type), membership_rows, auto_commit=False,
+                      skip_existing=True)
+
+    def _log_changes(self, address: str, nt_type: NETWORK, net: str, tr_type: TRANSACTION, transactions: List[Dict]):
+        """
+        Append newly stored transactions to the change log without committing, if the change log is enabled
+
+        :param address: address involved in the transactions
+        :type address: str
+        :param nt_type: type of network
+        :type nt_type: NETWORK
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str
+        :param tr_type: type of the transactions
+        :type tr_type: TRANSACTION
+        :param transactions: transactions as returned by the API
+        :type transactions: List[Dict]
+        :return: None
+        :rtype: None
+        """
+        if self.change_log and len(transactions):
+            network, tr_name = nt_type.name, tr_type.name
+            rows = [(None, address, network, net, tr_name, int(tx['blockNumber']),
+                     json.dumps(tx, separators=(',', ':'))) for tx in transactions]
+            self.add_rows(get_change_log_table(), rows, auto_commit=False)
+
+    def get_changes(self, since_seq: int = 0, limit: int = 1000) -> List[Dict]:
+        """
+        Return the transactions appended to the change log after a sequence number, in the order they were stored.
+        A consumer reads the log incrementally by giving the sequence number of the last change it has read.
+
+        :param since_seq: sequence number of the last change already read, 0 to read from the start of the log
+        :type since_seq: int
+        :param limit: maximum number of changes to return
+        :type limit: int
+        :return: changes, as dictionaries with the keys seq, address, nt_type, net, tr_type and transaction
+        :rtype: List[Dict]
+        """
+        table = get_change_log_table()
+        execution_cmd = (f"SELECT {table.seq}, {table.address}, {table.network}, {table.net}, {table.trType}, "
+                         f"{table.payload} FROM {table.name} WHERE {table.seq} > {int(since_seq)} "
+                         f"ORDER BY {table.seq} LIMIT {int(limit)}")
+        return [{'seq': seq, 'address': address, 'nt_type': NETWORK[network], 'net': net,
+                 'tr_type': TRANSACTION[tr_name], 'transaction': json.loads(payload)}
+                for seq, address, network, net, tr_name, payload in self._fetch_rows(execution_cmd)]
+
+    def get_last_change_seq(self) -> int:
+        """
+        Return the sequence number of the last change of the change log, for a consumer to start reading from now
+
+        :return: sequence number, 0 if the log is empty
+        :rtype: int
+        """
+        table = get_change_log_table()
+        query = self.get_conditions_rows(table, selection=f"MAX({table.seq})")
+        if not len(query) or query[0][0] is None:
+            return 0
+        return query[0][0]
+
+    def _update_flows(self, address: str, nt_type: NETWORK, net: str, tr_type: TRANSACTION,
+                      added: List[Dict], removed: List[Dict] = ()):
+        """
+        Add the stored transfers to the flow index, and withdraw the removed ones, without committing. The first
+        and last blocks of a counterparty are not moved back when transfers are removed.
+
+        :param address: address involved in the transactions
+        :type address: str
+        :param nt_type: type of network
+        :type nt_type: NETWORK
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str
+        :param tr_type: type of the transactions
+        :type tr_type: TRANSACTION
+        :param added: transactions stored
+        :type added: List[Dict]
+        :param removed: transactions removed
+        :type removed: List[Dict]
+        :return: None
+        :rtype: None
+        """
+        if not self.flow_index or tr_type not in self.FLOW_TRANSACTIONS or not (len(added) or len(removed)):
+            return
+        address = address.lower()
+        # (counterparty, asset) -> [inCount, outCount, inValue, outValue, firstBlock, lastBlock]
+        deltas: Dict[Tuple[str, str], List] = {}
+        for sign, transactions in ((1, added), (-1, removed)):
+            for tx in transactions:
+                sender = tx['from'].lower()
+                receiver = (tx['to'] or tx['contractAddress']).lower()  # a contract creation has no receiver
+                asset = tx['contractAddress'].lower() if tr_type == TRANSACTION.ERC20 else ''
+                value = 0 if tx.get('isError') == '1' else int(tx['value'] or 0)
+                block = int(tx['blockNumber'])
+                directions = []  # (counterparty, 0 for a received transfer or 1 for a sent one)
+                if receiver == address:
+                    directions.append((sender, 0))
+                if sender == address:
+                    directions.append((receiver, 1))
+                for counterparty, i in directions:
+                    delta = deltas.setdefault((counterparty, asset), [0, 0, 0, 0, None, None])
+                    delta[i] += sign
+                    delta[2 + i] += sign * value
+                    if sign > 0:
+                        delta[4] = block if delta[4] is None else min(delta[4], block)
+                        delta[5] = block if delta[5] is None else max(delta[5], block)
+        table = get_flow_table(nt_type, net)
+        select_cmd = (f"SELECT * FROM {table.name} WHERE {table.address} = ? AND {table.counterparty} = ? "
+                      f"AND {table.asset} = ?")
+
+        def job(cursor: sqlite3.Cursor):
+            keys = [(address, counterparty, asset) for counterparty, asset in deltas]
+            try:
+                previous_rows = {row[:3]: row for key in keys for row in cursor.execute(select_cmd, key).fetchall()}
+            except sqlite3.OperationalError:  # the table does not exist yet
+                self.create_table(table)
+                previous_rows = {}
+            rows = []
+            for key, (in_count, out_count, in_value, out_value, first_block, last_block) in zip(keys, deltas.values()):
+                previous = previous_rows.get(key)
+                if previous is not None:
+                    in_count += previous[3]
+                    out_count += previous[4]
+                    in_value += int(previous[5])
+                    out_value += int(previous[6])
+                    first_block = previous[7] if first_block is None else min(previous[7], first_block)
+                    last_block = previous[8] if last_block is None else max(previous[8], last_block)
+                if in_count + out_count > 0:
+                    rows.append((*key, in_count, out_count, str(in_value), str(out_value), first_block, last_block))
+            cursor.executemany(f"DELETE FROM {table.name} WHERE {table.address} = ? AND {table.counterparty} = ? "
+                               f"AND {table.asset} = ?", keys)
+            cursor.executemany(self.get_insert_cmd(table), rows)
+
+        self._execute_write(job, auto_commit=False)
+
+    def _replace_flows(self, address: str, nt_type: NETWORK, net: str, tr_type: TRANSACTION,
+                       previous_transactions: List[Dict], transactions: List[Dict]):
+        """
+        Update the flow index after the transactions of a block range have been replaced, without committing
+
+        :param address: address involved in the transactions
+        :type address: str
+        :param nt_type: type of network
+        :type nt_type: NETWORK
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str
+        :param tr_type: type of the transactions
+        :type tr_type: TRANSACTION
+        :param previous_transactions: transactions of the range before the replacement
+        :type previous_transactions: List[Dict]
+        :param transactions: transactions of the range after the replacement
+        :type transactions: List[Dict]
+        :return: None
+        :rtype: None
+        """
+        if not self.flow_index or tr_type not in self.FLOW_TRANSACTIONS:
+            return
+        previous_keys = self.get_transaction_keys(tr_type, previous_transactions)
+        keys = self.get_transaction_keys(tr_type, transactions)
+        previous_keys_set, keys_set = set(previous_keys), set(keys)
+        added = [tx for tx, key in zip(transactions, keys) if key not in previous_keys_set]
+        removed = [tx for tx, key in zip(previous_transactions, previous_keys) if key not in keys_set]
+        self._update_flows(address, nt_type, net, tr_type, added, removed)
+
+    def rebuild_flow_index(self, address: str, nt_type: NETWORK, net: str):
+        """
+        Compute again the flow index of an address from its recorded transactions, for example for the histories
+        recorded before the flow index was enabled
+
+        :param address: address to index
+        :type address: str
+        :param nt_type: type of network
+        :type nt_type: NETWORK
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str
+        :return: None
+        :rtype: None
+        """
+        if not self.flow_index:
+            raise ValueError("the flow index is not enabled for this database")
+        table = get_flow_table(nt_type, net)
+        histories = {tr_type: self.get_transactions(address, nt_type, net, tr_type)
+                     for tr_type in self.FLOW_TRANSACTIONS}
+
+        def rebuild():
+            self.delete_conditions_rows(table, conditions_list=[(table.address, SQLConditionEnum.equal,
+                                                                 address.lower())], auto_commit=False)
+            for tr_type, transactions in histories.items():
+                self._update_flows(address, nt_type, net, tr_type, transactions)
+
+        self.run_in_transaction(rebuild)
+
+    def _get_flow_rows(self, execution_cmd: str, parameters: Tuple) -> List[Dict]:
+        """
+        Fetch rows of a flow table and return them as dictionaries with integer sums
+
+        :param execution_cmd: command selecting all the columns of a flow table
+        :type execution_cmd: str
+        :param parameters: values bound to the placeholders of the command
+        :type parameters: Tuple
+        :return: flows
+        :rtype: List[Dict]
+        """
+        flows = []
+        for row in self._fetch_rows(execution_cmd, parameters=parameters):
+            address, counterparty, asset, in_count, out_count, in_value, out_value, first_block, last_block = row
+            flows.append({'counterparty': counterparty, 'asset': asset, 'inCount': in_count, 'outCount': out_count,
+                          'inValue': int(in_value), 'outValue': int(out_value), 'firstBlock': first_block,
+                          'lastBlock': last_block})
+        return flows
+
+    def get_counterparties(self, address: str, nt_type: NETWORK, net: str, limit: int = 10,
+                           asset: Optional[str] = None, by_value: bool = False) -> List[Dict]:
+        """
+        Return the main counterparties of an address from the flow index, with the number of transfers and
+        the value sent in each direction, per asset. The asset is the contract address of an erc20 token, or an
+        empty string for the native coin.
+
+        :param address: address of the flows
+        :type address: str
+        :param nt_type: type of network
+        :type nt_type: NETWORK
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str
+        :param limit: maximum number of (counterparty, asset) flows to return
+        :type limit: int
+        :param asset: only return the flows of this asset, None for all the assets
+        :type asset: Optional[str]
+        :param by_value: sort the flows by value sent and received instead of by number of transfers, it is only
+            meaningful for a single asset
+        :type by_value: bool
+        :return: flows, with the keys counterparty, asset, inCount, outCount, inValue, outValue, firstBlock and
+            lastBlock
+        :rtype: List[Dict]
+        """
+        table = get_flow_table(nt_type, net)
+        execution_cmd = f"SELECT * FROM {table.name} WHERE {table.address} = ?"
+        parameters = (address.lower(),)
+        if asset is not None:
+            execution_cmd += f" AND {table.asset} = ?"
+            parameters += (asset.lower(),)
+        if by_value:
+            order = f"CAST({table.inValue} AS REAL) + CAST({table.outValue} AS REAL)"
+        else:
+            order = f"{table.inCount} + {table.outCount}"
+        return self._get_flow_rows(execution_cmd + f" ORDER BY {order} DESC LIMIT {int(limit)}", parameters)
+
+    def get_flows(self, address: str, nt_type: NETWORK, net: str, counterparty: str) -> List[Dict]:
+        """
+        Return the flows between an address and one of its counterparties, per asset, see get_counterparties
+
+        :param address: address of the flows
+        :type address: str
+        :param nt_type: type of network
+        :type nt_type: NETWORK
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str
+        :param counterparty: counterparty of the address
+        :type counterparty: str
+        :return: flows
+        :rtype: List[Dict]
         """
-        super().__init__(name)
+        table = get_flow_table(nt_type, net)
+        return self._get_flow_rows(f"SELECT * FROM {table.name} WHERE {table.address} = ? AND {table.counterparty} = ?",
+                                   (address.lower(), counterparty.lower()))
 
     def add_transactions(self, address: str, nt_type: NETWORK, net: str, tr_type: TRANSACTION, transactions: List[Dict]):
         """
@@ -37,10 +608,26 @@ class ScanDataBase(DataBase):
         :rtype: None
         """
         table = get_transaction_table(address, nt_type, net, tr_type)
-        for transaction in transactions:
-            row = table.dict_to_tuple(transaction)
-            self.add_row(table, row, auto_commit=False)
-        self.commit()
+        with span("scanwatch.convert", rows=len(transactions)):
+            rows, new_tokens = self._to_rows(table, nt_type, net, transactions)
+
+        def add():
+            nonlocal rows, new_tokens
+            rows, new_tokens = self._check_new_tokens(table, nt_type, net, transactions, rows, new_tokens)
+            self._add_tokens(nt_type, net, new_tokens)
+            if self.shared_storage:
+                keys = self.get_transaction_keys(tr_type, transactions)
+                self._add_shared_rows(address, nt_type, net, tr_type, keys, rows, transactions)
+            else:
+                self.add_rows(table, rows, auto_commit=False)
+            self._log_changes(address, nt_type, net, tr_type, transactions)
+            self._update_flows(address, nt_type, net, tr_type, transactions)
+
+        with span("scanwatch.sqlite", rows=len(rows)):
+            self.run_in_transaction(add)
+        self._get_tokens(nt_type, net).update(new_tokens)
+        get_metrics().increment('scanwatch_rows_inserted_total', len(rows), network=f"{nt_type.name.lower()}_{net}",
+                                tr_type=tr_type.name.lower())
 
     def get_transactions(self, address: str, nt_type: NETWORK, net: str, tr_type: TRANSACTION) -> List[Dict]:
         """
@@ -57,9 +644,60 @@ class ScanDataBase(DataBase):
         :return: list of the transaction recorded
         :rtype: List[Dict]
         """
+        archived_block = self.get_archived_block(address, nt_type, net, tr_type)
+        transactions = self._get_stored_transactions(address, nt_type, net, tr_type)
+        if archived_block is None:
+            return transactions
+        if self.archive is None:
+            raise ValueError(f"the {tr_type.name.lower()} transactions of {address} have been partly archived, the "
+                             f"archive must be given to the database to read them")
+        # rows above the archived block only, in case an archiving was interrupted before the rows were deleted
+        recent_transactions = [tx for tx in transactions if int(tx['blockNumber']) > archived_block]
+        return self.archive.read(address, nt_type, net, tr_type, up_to_block=archived_block) + recent_transactions
+
+    def _get_stored_transactions(self, address: str, nt_type: NETWORK, net: str, tr_type: TRANSACTION,
+                                 from_block: Optional[int] = None, to_block: Optional[int] = None) -> List[Dict]:
+        """
+        Return the transactions recorded in the database, without the archived ones
+
+        :param address: address involved in the transactions
+        :type address: str
+        :param nt_type: type of network
+        :type nt_type: NETWORK
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str
+        :param tr_type: type of the transaction to fetch
+        :type tr_type: TRANSACTION
+        :param from_block: first block of the transactions to return, None for no limit
+        :type from_block: Optional[int]
+        :param to_block: last block of the transactions to return, None for no limit
+        :type to_block: Optional[int]
+        :return: list of the transaction recorded
+        :rtype: List[Dict]
+        """
         table = get_transaction_table(address, nt_type, net, tr_type)
-        rows = self.get_all_rows(table)
-        return [table.tuple_to_dict(row) for row in rows]
+        if self.shared_storage:
+            shared_table = get_shared_transaction_table(nt_type, net, tr_type)
+            membership_table = get_membership_table(nt_type, net, tr_type)
+            selection = ", ".join(f"s.[{key}]" for key in table.keys)
+            execution_cmd = (f"SELECT {selection} FROM {shared_table.name} s JOIN {membership_table.name} m "
+                             f"ON s.txKey = m.txKey WHERE m.address = ?")
+            if from_block is not None:
+                execution_cmd += f" AND m.blockNumber >= {int(from_block)}"
+            if to_block is not None:
+                execution_cmd += f" AND m.blockNumber <= {int(to_block)}"
+            execution_cmd += " ORDER BY m.rowid"
+            transactions = self._fetch_rows(execution_cmd, row_factory=self._get_row_factory(table),
+                                            parameters=(address,))
+        else:
+            conditions = []
+            if from_block is not None:
+                conditions.append((f"CAST({table.blockNumber} AS INTEGER)", SQLConditionEnum.greater_equal, from_block))
+            if to_block is not None:
+                conditions.append((f"CAST({table.blockNumber} AS INTEGER)", SQLConditionEnum.lower_equal, to_block))
+            transactions = self.get_conditions_rows(table, conditions_list=conditions,
+                                                    row_factory=self._get_row_factory(table))
+        return self._fill_tokens(table, nt_type, net, transactions)
 
     def get_last_block_number(self, address: str, nt_type: NETWORK, net: str, tr_type: TRANSACTION) -> int:
         """
@@ -77,14 +715,408 @@ class ScanDataBase(DataBase):
         :return: last block number
         :rtype: int
         """
-        table = get_transaction_table(address, nt_type, net, tr_type)
-        selection = str(table.blockNumber)
-        query = self.get_conditions_rows(table, selection=selection)
-        default = 0
-        try:
-            return max([int(e[0]) for e in query])
-        except ValueError:
+        if self.shared_storage:
+            table = get_membership_table(nt_type, net, tr_type)
+            query = self.get_conditions_rows(table, selection=f"MAX({table.blockNumber})",
+                                             conditions_list=[(table.address, SQLConditionEnum.equal, address)])
+        else:
+            table = get_transaction_table(address, nt_type, net, tr_type)
+            selection = f"MAX(CAST({table.blockNumber} AS INTEGER))"
+            query = self.get_conditions_rows(table, selection=selection)
+        default = self.get_archived_block(address, nt_type, net, tr_type) or 0
+        if not len(query) or query[0][0] is None:  # missing or empty table
             return default
+        return max(query[0][0], default)
+
+    def replace_transactions(self, address: str, nt_type: NETWORK, net: str, tr_type: TRANSACTION,
+                             from_block: int, transactions: List[Dict], auto_commit: bool = True,
+                             to_block: Optional[int] = None):
+        """
+        Replace all the recorded transactions starting from a block by a list of transactions. This is used to
+        overwrite the transactions that may have been reorganised since they were recorded.
+
+        :param address: address involved in the transactions
+        :type address: str
+        :param nt_type: type of network
+        :type nt_type: NETWORK
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str
+        :param tr_type: type of the transactions to replace
+        :type tr_type: TRANSACTION
+        :param from_block: first block of the replaced range
+        :type from_block: int
+        :param transactions: transactions of the range, fetched from the API
+        :type transactions: List[Dict]
+        :param auto_commit: if the database state should be saved after the changes
+        :type auto_commit:  bool
+        :param to_block: last block of the replaced range, None for the last block of the chain
+        :type to_block: Optional[int]
+        :return: the transactions that were not recorded before the replacement
+        :rtype: List[Dict]
+        """
+        table = get_transaction_table(address, nt_type, net, tr_type)
+        conditions = [(f"CAST({table.blockNumber} AS INTEGER)", SQLConditionEnum.greater_equal, from_block)]
+        if to_block is not None:
+            conditions.append((f"CAST({table.blockNumber} AS INTEGER)", SQLConditionEnum.lower_equal, to_block))
+        # confirmations change at each block, they are ignored to compare the recorded transactions
+        volatile_index = table.columns_names.index('confirmations') if 'confirmations' in table.columns_names else None
+
+        def get_stable_part(row):
+            return row[:volatile_index] + row[volatile_index + 1:] if volatile_index is not None else row
+
+        with span("scanwatch.convert", rows=len(transactions)):
+            rows, new_tokens = self._to_rows(table, nt_type, net, transactions)
+            # the rows are compared with their token metadata and encoded, as the recorded rows may have been
+            # stored before the encoding was used
+            full_rows = self._to_rows(table, nt_type, net, transactions, normalize=False)[0] \
+                if self._normalizes_tokens(table) and not self.shared_storage else rows
+
+        def get_stored_stable_part(row):
+            if self.encoding is None:
+                return get_stable_part(row)
+            row = self.encoding.get_decoder(table)(row)
+            if self._normalizes_tokens(table):
+                transaction = self._fill_tokens(table, nt_type, net, [table.tuple_to_dict(row)])[0]
+                row = table.dict_to_tuple(transaction)
+            return get_stable_part(self.encoding.get_encoder(table)(row))
+
+        def get_previous_transactions():
+            if not self.flow_index or tr_type not in self.FLOW_TRANSACTIONS:
+                return []
+            return self._get_stored_transactions(address, nt_type, net, tr_type, from_block, to_block)
+
+        def replace():
+            nonlocal rows, new_tokens
+            rows, new_tokens = self._check_new_tokens(table, nt_type, net, transactions, rows, new_tokens)
+            previous_transactions = get_previous_transactions()
+            previous_rows = self.get_conditions_rows(table, conditions_list=conditions)
+            previous_rows = {get_stored_stable_part(row) for row in previous_rows}
+            self.delete_conditions_rows(table, conditions_list=conditions, auto_commit=False)
+            self._add_tokens(nt_type, net, new_tokens)
+            self.add_rows(table, rows, auto_commit=False)
+            added = [tx for tx, row in zip(transactions, full_rows) if get_stable_part(row) not in previous_rows]
+            self._log_changes(address, nt_type, net, tr_type, added)
+            self._replace_flows(address, nt_type, net, tr_type, previous_transactions, transactions)
+            return added
+
+        def replace_shared():
+            # the transactions are compared by key, the content of a recorded transaction is refreshed
+            nonlocal rows, new_tokens
+            rows, new_tokens = self._check_new_tokens(table, nt_type, net, transactions, rows, new_tokens)
+            shared_table = get_shared_transaction_table(nt_type, net, tr_type)
+            membership_table = get_membership_table(nt_type, net, tr_type)
+            membership_conditions = [(membership_table.address, SQLConditionEnum.equal, address),
+                                     (membership_table.blockNumber, SQLConditionEnum.greater_equal, from_block)]
+            if to_block is not None:
+                membership_conditions.append((membership_table.blockNumber, SQLConditionEnum.lower_equal, to_block))
+            previous_transactions = get_previous_transactions()
+            keys = self.get_transaction_keys(tr_type, transactions)
+            previous_keys = {row[0] for row in self.get_conditions_rows(membership_table, selection='txKey',
+                                                                        conditions_list=membership_conditions)}
+            self.delete_conditions_rows(membership_table, conditions_list=membership_conditions, auto_commit=False)
+            removed_keys = previous_keys.difference(keys)
+
+            def delete_shared_rows(cursor: sqlite3.Cursor):
+                try:
+                    cursor.executemany(f"DELETE FROM {shared_table.name} WHERE txKey = ?", [(k,) for k in keys])
+                except sqlite3.OperationalError:  # the tables do not exist yet
+                    pass
+
+            self._execute_write(delete_shared_rows, auto_commit=False)
+            self._delete_orphan_shared_rows(nt_type, net, tr_type, removed_keys)
+            self._add_tokens(nt_type, net, new_tokens)
+            self._add_shared_rows(address, nt_type, net, tr_type, keys, rows, transactions)
+            added = [tx for tx, key in zip(transactions, keys) if key not in previous_keys]
+            self._log_changes(address, nt_type, net, tr_type, added)
+            self._replace_flows(address, nt_type, net, tr_type, previous_transactions, transactions)
+            return added
+
+        with span("scanwatch.sqlite", rows=len(rows)):
+            added_transactions = self.run_in_transaction(replace_shared if self.shared_storage else replace,
+                                                         auto_commit=auto_commit)
+        self._get_tokens(nt_type, net).update(new_tokens)
+        get_metrics().increment('scanwatch_rows_inserted_total', len(added_transactions),
+                                network=f"{nt_type.name.lower()}_{net}", tr_type=tr_type.name.lower())
+        return added_transactions
+
+    def _delete_orphan_shared_rows(self, nt_type: NETWORK, net: str, tr_type: TRANSACTION, keys: Iterable[str]):
+        """
+        Delete, without committing, the rows of the shared transaction table that are not referenced anymore by
+        an address of the membership table
+
+        :param nt_type: type of network
+        :type nt_type: NETWORK
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str
+        :param tr_type: type of the transactions
+        :type tr_type: TRANSACTION
+        :param keys: keys of the rows to delete if they are not referenced
+        :type keys: Iterable[str]
+        :return: None
+        :rtype: None
+        """
+        shared_table = get_shared_transaction_table(nt_type, net, tr_type)
+        membership_table = get_membership_table(nt_type, net, tr_type)
 
+        def job(cursor: sqlite3.Cursor):
+            try:
+                cursor.executemany(f"DELETE FROM {shared_table.name} WHERE txKey = ? AND NOT EXISTS "
+                                   f"(SELECT 1 FROM {membership_table.name} WHERE txKey = ?)",
+                                   [(k, k) for k in keys])
+            except sqlite3.OperationalError:  # the tables do not exist yet
+                pass
 
+        self._execute_write(job, auto_commit=False)
 
+    def get_archived_block(self, address: str, nt_type: NETWORK, net: str, tr_type: TRANSACTION) -> Optional[int]:
+        """
+        Return the last block of the transactions moved to the archive, None if none has been archived
+
+        :param address: address involved in the transactions
+        :type address: str
+        :param nt_type: type of network
+        :type nt_type: NETWORK
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str
+        :param tr_type: type of the transactions
+        :type tr_type: TRANSACTION
+        :return: last archived block
+        :rtype: Optional[int]
+        """
+        table = get_transaction_table(address, nt_type, net, tr_type)
+        row = self.get_row_by_key(get_archive_state_table(), table.name)
+        if row is not None:
+            return int(row[1])
+
+    def archive_transactions(self, address: str, nt_type: NETWORK, net: str, tr_type: TRANSACTION,
+                             before_timestamp: int) -> int:
+        """
+        Move the final transactions older than a timestamp from the database to the archive. When the finality is
+        tracked (see ScanManager), the transactions above the finalized block are kept in the database.
+        The archive files are written and read back first and the rows are deleted afterwards, an interrupted
+        archiving leaves the history readable and is completed by the next one.
+
+        :param address: address involved in the transactions
+        :type address: str
+        :param nt_type: type of network
+        :type nt_type: NETWORK
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str
+        :param tr_type: type of the transactions
+        :type tr_type: TRANSACTION
+        :param before_timestamp: unix timestamp, the transactions before it are archived
+        :type before_timestamp: int
+        :return: number of archived transactions
+        :rtype: int
+        """
+        if self.archive is None:
+            raise ValueError("no archive has been given to the database")
+        finalized_block = self.get_finalized_block(address, nt_type, net, tr_type)
+        archived_block = self.get_archived_block(address, nt_type, net, tr_type)
+        transactions = [tx for tx in self._get_stored_transactions(address, nt_type, net, tr_type)
+                        if int(tx['timeStamp']) < before_timestamp
+                        and (finalized_block is None or int(tx['blockNumber']) <= finalized_block)
+                        and (archived_block is None or int(tx['blockNumber']) > archived_block)]
+        if not len(transactions):
+            return 0
+        with span("scanwatch.archive", rows=len(transactions)):
+            self.archive.write(address, nt_type, net, tr_type, transactions,
+                               after_block=-1 if archived_block is None else archived_block)
+        last_block = max(int(tx['blockNumber']) for tx in transactions)
+        table = get_transaction_table(address, nt_type, net, tr_type)
+
+        def move():
+            self.add_row(get_archive_state_table(), (table.name, last_block), auto_commit=False, update_if_exists=True)
+            if self.shared_storage:
+                membership_table = get_membership_table(nt_type, net, tr_type)
+                conditions = [(membership_table.address, SQLConditionEnum.equal, address),
+                              (membership_table.blockNumber, SQLConditionEnum.lower_equal, last_block)]
+                keys = [row[0] for row in self.get_conditions_rows(membership_table, selection='txKey',
+                                                                   conditions_list=conditions)]
+                self.delete_conditions_rows(membership_table, conditions_list=conditions, auto_commit=False)
+                self._delete_orphan_shared_rows(nt_type, net, tr_type, keys)
+            else:
+                conditions = [(f"CAST({table.blockNumber} AS INTEGER)", SQLConditionEnum.lower_equal, last_block)]
+                self.delete_conditions_rows(table, conditions_list=conditions, auto_commit=False)
+
+        self.run_in_transaction(move)
+        return len(transactions)
+
+    def get_finalized_block(self, address: str, nt_type: NETWORK, net: str, tr_type: TRANSACTION) -> Optional[int]:
+        """
+        Return the block up to which the recorded transactions are considered final (they can not be reorganised
+        anymore). Return None if no finalized block has been recorded yet.
+
+        :param address: address involved in the transactions
+        :type address: str
+        :param nt_type: type of network
+        :type nt_type: NETWORK
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str
+        :param tr_type: type of the transactions
+        :type tr_type: TRANSACTION
+        :return: finalized block number
+        :rtype: Optional[int]
+        """
+        table = get_transaction_table(address, nt_type, net, tr_type)
+        row = self.get_row_by_key(get_sync_state_table(), table.name)
+        if row is not None:
+            return int(row[1])
+
+    def set_finalized_block(self, address: str, nt_type: NETWORK, net: str, tr_type: TRANSACTION,
+                            block_number: int, auto_commit: bool = True):
+        """
+        Record the block up to which the recorded transactions are considered final
+
+        :param address: address involved in the transactions
+        :type address: str
+        :param nt_type: type of network
+        :type nt_type: NETWORK
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str
+        :param tr_type: type of the transactions
+        :type tr_type: TRANSACTION
+        :param block_number: finalized block number
+        :type block_number: int
+        :param auto_commit: if the database state should be saved after the changes
+        :type auto_commit:  bool
+        :return: None
+        :rtype: None
+        """
+        table = get_transaction_table(address, nt_type, net, tr_type)
+        self.add_row(get_sync_state_table(), (table.name, block_number), auto_commit=auto_commit,
+                     update_if_exists=True)
+
+    def get_coverage(self, address: str, nt_type: NETWORK, net: str, tr_type: TRANSACTION) -> List[Tuple[int, int]]:
+        """
+        Return the block ranges whose transactions have been fetched from the API and recorded
+
+        :param address: address involved in the transactions
+        :type address: str
+        :param nt_type: type of network
+        :type nt_type: NETWORK
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str
+        :param tr_type: type of the transactions
+        :type tr_type: TRANSACTION
+        :return: sorted and disjoint (first block, last block) ranges
+        :rtype: List[Tuple[int, int]]
+        """
+        table = get_transaction_table(address, nt_type, net, tr_type)
+        coverage_table = get_coverage_table()
+        rows = self.get_conditions_rows(coverage_table, selection=[coverage_table.startBlock, coverage_table.endBlock],
+                                        conditions_list=[(coverage_table.tableName, SQLConditionEnum.equal,
+                                                          table.name)])
+        return self._merge_ranges(rows)
+
+    @staticmethod
+    def _merge_ranges(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """
+        Merge overlapping or adjacent block ranges
+
+        :param ranges: (first block, last block) ranges
+        :type ranges: List[Tuple[int, int]]
+        :return: sorted and disjoint ranges
+        :rtype: List[Tuple[int, int]]
+        """
+        merged = []
+        for start, end in sorted(ranges):
+            if len(merged) and start <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
+
+    def add_coverage(self, address: str, nt_type: NETWORK, net: str, tr_type: TRANSACTION, start_block: int,
+                     end_block: int, auto_commit: bool = True):
+        """
+        Record that the transactions of a block range have been fetched from the API and recorded
+
+        :param address: address involved in the transactions
+        :type address: str
+        :param nt_type: type of network
+        :type nt_type: NETWORK
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str
+        :param tr_type: type of the transactions
+        :type tr_type: TRANSACTION
+        :param start_block: first block of the range
+        :type start_block: int
+        :param end_block: last block of the range
+        :type end_block: int
+        :param auto_commit: if the database state should be saved after the changes
+        :type auto_commit:  bool
+        :return: None
+        :rtype: None
+        """
+        if end_block < start_block:
+            return
+        table = get_transaction_table(address, nt_type, net, tr_type)
+        coverage_table = get_coverage_table()
+
+        def add():
+            ranges = self.get_coverage(address, nt_type, net, tr_type)
+            self.delete_conditions_rows(coverage_table, conditions_list=[(coverage_table.tableName,
+                                                                          SQLConditionEnum.equal, table.name)],
+                                        auto_commit=False)
+            ranges = self._merge_ranges(ranges + [(start_block, end_block)])
+            self.add_rows(coverage_table, [(table.name, start, end) for start, end in ranges], auto_commit=False)
+
+        self.run_in_transaction(add, auto_commit=auto_commit)
+
+    def get_uncovered_ranges(self, address: str, nt_type: NETWORK, net: str,
+                             tr_type: TRANSACTION) -> List[Tuple[int, int]]:
+        """
+        Return the block ranges, up to the last recorded block, whose transactions have not been fetched from the
+        API. Those are the holes left by interrupted or truncated synchronisations, or the whole history if it
+        was recorded before the coverage was tracked.
+
+        :param address: address involved in the transactions
+        :type address: str
+        :param nt_type: type of network
+        :type nt_type: NETWORK
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str
+        :param tr_type: type of the transactions
+        :type tr_type: TRANSACTION
+        :return: sorted (first block, last block) ranges
+        :rtype: List[Tuple[int, int]]
+        """
+        last_block = self.get_last_block_number(address, nt_type, net, tr_type)
+        uncovered = []
+        next_block = 0
+        for start, end in self.get_coverage(address, nt_type, net, tr_type):
+            if start > last_block:
+                break
+            if start > next_block:
+                uncovered.append((next_block, start - 1))
+            next_block = max(next_block, end + 1)
+        if last_block and next_block <= last_block:
+            uncovered.append((next_block, last_block))
+        return uncovered
+
+    def get_checksum(self, address: str, nt_type: NETWORK, net: str, tr_type: TRANSACTION) -> Tuple[int, str]:
+        """
+        Return the number of recorded transactions and a checksum of their content, which does not depend on the
+        order or on the storage format of the transactions. The confirmations are left out as they change at
+        each block.
+
+        :param address: address involved in the transactions
+        :type address: str
+        :param nt_type: type of network
+        :type nt_type: NETWORK
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str
+        :param tr_type: type of the transactions
+        :type tr_type: TRANSACTION
+        :return: number of transactions and sha256 hex digest
+        :rtype: Tuple[int, str]
+        """
+        transactions = self.get_transactions(address, nt_type, net, tr_type)
+        lines = sorted(json.dumps({k: v for k, v in tx.items() if k != 'confirmations'}, sort_keys=True)
+                       for tx in transactions)
+        digest = hashlib.sha256()
+        for line in lines:
+            digest.update(line.encode())
+            digest.update(b'\n')
+        return len(transactions), digest.hexdigest()
@@ -0,0 +1,167 @@
+import zlib
+from typing import Callable, Dict, Tuple
+
+from ScanWatch.storage.tables import Table
+from ScanWatch.utils.enums import INPUT_STORAGE
+
+
+def _encode_hex(value):
+    """
+    Encode a lowercase hex string (ex: '0xab12') as bytes, leave the other values unchanged
+    """
+    if isinstance(value, str) and value.startswith('0x') and len(value) > 2 and value == value.lower():
+        try:
+            return bytes.fromhex(value[2:])
+        except ValueError:  # odd length or not hex
+            return value
+    return value
+
+
+def _decode_hex(value):
+    if isinstance(value, bytes):
+        return '0x' + value.hex()
+    return value
+
+
+# first byte of an encoded input, to tell the raw calldata from the compressed one
+_RAW_INPUT = b'\x00'
+_COMPRESSED_INPUT = b'\x01'
+
+
+def _decode_input(value):
+    if isinstance(value, bytes):
+        data = value[1:]
+        if value[:1] == _COMPRESSED_INPUT:
+            data = zlib.decompress(data)
+        return '0x' + data.hex()
+    return value
+
+
+class StorageEncoding:
+    """
+    Compact encoding of the transactions in the database:
+
+    - the hex fields (hashes and addresses) are stored as BLOB instead of hex TEXT, which halves their size
+    - the input calldata is stored as BLOB, compressed or not stored at all (then read as None)
+    - the volatile fields (confirmations) are not stored (then read as None)
+    - the token metadata (tokenName, tokenSymbol and tokenDecimal) of the erc20 and erc721 transfers is stored once
+      per contract in a token table, see ScanDataBase
+
+    The rows are converted back to the API format on read. The rows stored as TEXT (before the encoding was
+    used) are read unchanged, so a database can be switched to the encoding at any time.
+    """
+
+    HEX_COLUMNS = ('hash', 'blockHash', 'from', 'to', 'contractAddress')
+    INPUT_COLUMN = 'input'
+    VOLATILE_COLUMNS = ('confirmations',)
+
+    def __init__(self, input_storage: INPUT_STORAGE = INPUT_STORAGE.RAW, drop_volatile: bool = True,
+                 normalize_tokens: bool = True, compression_level: int = 6):
+        """
+        Initialise an encoding
+
+        :param input_storage: how the input calldata is stored
+        :type input_storage: INPUT_STORAGE
+        :param drop_volatile: if the volatile fields should not be stored
+        :type drop_volatile: bool
+        :param normalize_tokens: if the token metadata should be stored once per contract
+        :type normalize_tokens: bool
+        :param compression_level: zlib level used when the input is compressed
+        :type compression_level: int
+        """
+        self.input_storage = input_storage
+        self.drop_volatile = drop_volatile
+        self.normalize_tokens = normalize_tokens
+        self.compression_level = compression_level
+        self._encoders: Dict[str, Callable[[Tuple], Tuple]] = {}
+        self._decoders: Dict[str, Callable[[Tuple], Tuple]] = {}
+
+    def __getstate__(self):
+        # the converters are rebuilt when needed, which lets the encoding be sent to other processes
+        return {**self.__dict__, '_encoders': {}, '_decoders': {}}
+
+    def _encode_input(self, value):
+        if self.input_storage == INPUT_STORAGE.DROP:
+            return None
+        encoded = _encode_hex(value)
+        if not isinstance(encoded, bytes):
+            return value
+        if self.input_storage == INPUT_STORAGE.COMPRESS:
+            compressed = zlib.compress(encoded, self.compression_level)
+            if len(compressed) < len(encoded):
+                return _COMPRESSED_INPUT + compressed
+        return _RAW_INPUT + encoded
+
+    def get_encoder(self, table: Table) -> Callable[[Tuple], Tuple]:
+        """
+        Return the function encoding the rows (as returned by Table.dict_to_tuple) of a table
+
+        :param table: table of the rows
+        :type table: Table
+        :return: row encoder
+        :rtype: Callable[[Tuple], Tuple]
+        """
+        encoder = self._encoders.get(table.name)
+        if encoder is None:
+            encoder = self._encoders[table.name] = self._build_converter(table, encode=True)
+        return encoder
+
+    def get_row_factory(self, table: Table) -> Callable:
+        """
+        Return a row factory for a sqlite3 cursor that selects all the columns of a table: the rows are decoded
+        and returned as Dict (see Table.row_factory)
+
+        :param table: table of the rows
+        :type table: Table
+        :return: row factory
+        :rtype: Callable
+        """
+        decode = self.get_decoder(table)
+        keys = table.keys
+
+        def row_factory(cursor, row):
+            return dict(zip(keys, decode(row)))
+
+        return row_factory
+
+    def get_decoder(self, table: Table) -> Callable[[Tuple], Tuple]:
+        """
+        Return the function decoding the stored rows of a table back to the API format
+
+        :param table: table of the rows
+        :type table: Table
+        :return: row decoder
+        :rtype: Callable[[Tuple], Tuple]
+        """
+        decoder = self._decoders.get(table.name)
+        if decoder is None:
+            decoder = self._decoders[table.name] = self._build_converter(table, encode=False)
+        return decoder
+
+    def _build_converter(self, table: Table, encode: bool) -> Callable[[Tuple], Tuple]:
+        """
+        Build the function converting the rows of a table, only the encoded columns are visited
+
+        :param table: table of the rows
+        :type table: Table
+        :param encode: True for the encoder, False for the decoder
+        :type encode: bool
+        :return: row converter
+        :rtype: Callable[[Tuple], Tuple]
+        """
+        converters = []
+        for index, key in enumerate(table.keys):
+            if key in self.HEX_COLUMNS:
+                converters.append((index, _encode_hex if encode else _decode_hex))
+            elif key == self.INPUT_COLUMN:
+                converters.append((index, self._encode_input if encode else _decode_input))
+            elif key in self.VOLATILE_COLUMNS and self.drop_volatile and encode:
+                converters.append((index, lambda value: None))
+
+        def convert(row: Tuple) -> Tuple:
+            row = list(row)
+            for i, converter in converters:
+                row[i] = converter(row[i])
+            return tuple(row)
+
+        return convert
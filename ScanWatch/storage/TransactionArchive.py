@@ -0,0 +1,151 @@
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from ScanWatch.storage.tables import get_transaction_columns
+from ScanWatch.utils.enums import NETWORK, TRANSACTION
+from ScanWatch.utils.paths import get_data_path
+
+
+class TransactionArchive:
+    """
+    Archive of the old transactions in compressed Parquet files, to keep the database small.
+    The files are partitioned by network, type of transaction and month (of the transactions timestamps), each file
+    holds the transactions of a single address, written by one archiving and never modified afterwards.
+
+    The archive needs the library pyarrow, installed with ``pip install ScanWatch[archive]``.
+    """
+
+    def __init__(self, path: Optional[Union[str, Path]] = None, compression: str = 'zstd'):
+        """
+        Initialise an archive
+
+        :param path: folder of the archive, default to the folder 'archive' in the data folder of the library
+        :type path: Optional[Union[str, Path]]
+        :param compression: compression codec of the Parquet files
+        :type compression: str, default 'zstd'
+        """
+        try:
+            import pyarrow  # noqa: F401, checked here to fail early
+        except ImportError as err:
+            raise ImportError("the archive needs the library pyarrow: pip install ScanWatch[archive]") from err
+        self.path = Path(path) if path is not None else get_data_path() / "archive"
+        self.compression = compression
+
+    def get_partition_path(self, nt_type: NETWORK, net: str, tr_type: TRANSACTION) -> Path:
+        """
+        Return the folder of the files of a network and a type of transaction
+
+        :param nt_type: type of network
+        :type nt_type: NETWORK
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str
+        :param tr_type: type of the transactions
+        :type tr_type: TRANSACTION
+        :return: folder of the monthly files
+        :rtype: Path
+        """
+        network = nt_type.name.lower() if net == "main" else f"{nt_type.name.lower()}_{net}"
+        return self.path / network / tr_type.name.lower()
+
+    @staticmethod
+    def _get_schema(tr_type: TRANSACTION):
+        """
+        Return the schema of the files of a type of transaction: the address of the archived history followed by
+        the fields of the transactions, as strings
+
+        :param tr_type: type of the transactions
+        :type tr_type: TRANSACTION
+        :return: schema of the files
+        :rtype: pyarrow.Schema
+        """
+        import pyarrow as pa
+
+        return pa.schema([(name, pa.string()) for name in ['address'] + get_transaction_columns(tr_type)])
+
+    def write(self, address: str, nt_type: NETWORK, net: str, tr_type: TRANSACTION, transactions: List[Dict],
+              after_block: int = -1) -> int:
+        """
+        Add transactions of an address to the archive, in new files of the address (one per month) that are never
+        shared with other addresses. The files of the address above a block, left by an interrupted archiving, are
+        deleted first. Each file is written under a temporary name, read back to check its rows and then moved in
+        place.
+
+        :param address: address of the history
+        :type address: str
+        :param nt_type: type of network
+        :type nt_type: NETWORK
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str
+        :param tr_type: type of the transactions
+        :type tr_type: TRANSACTION
+        :param transactions: transactions to archive, as returned by the API
+        :type transactions: List[Dict]
+        :param after_block: last block of the address already archived, the files of the address starting above
+            it are deleted
+        :type after_block: int
+        :return: number of files written
+        :rtype: int
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = self._get_schema(tr_type)
+        months: Dict[str, List[Dict]] = {}
+        for transaction in transactions:
+            month = time.strftime("%Y-%m", time.gmtime(int(transaction['timeStamp'])))
+            months.setdefault(month, []).append(transaction)
+        partition_path = self.get_partition_path(nt_type, net, tr_type)
+        for file_path in partition_path.glob(f"month=*/{address}-*.parquet"):
+            first_block = int(file_path.name[len(address) + 1:].split('-')[0])
+            if first_block > after_block:
+                file_path.unlink()
+        for month, month_transactions in months.items():
+            blocks = [int(transaction['blockNumber']) for transaction in month_transactions]
+            file_name = f"{address}-{min(blocks)}-{max(blocks)}-{uuid.uuid4().hex}.parquet"
+            file_path = partition_path / f"month={month}" / file_name
+            rows = [{'address': address, **transaction} for transaction in month_transactions]
+            table = pa.Table.from_pylist(rows, schema=schema)
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            temporary_path = file_path.parent / f".{file_name}.tmp"  # hidden from the readers
+            pq.write_table(table, temporary_path, compression=self.compression)
+            if not pq.read_table(temporary_path, schema=schema).equals(table):
+                temporary_path.unlink()
+                raise ValueError(f"the archive file {file_path} does not hold the rows written to it")
+            os.replace(temporary_path, file_path)
+        return len(months)
+
+    def read(self, address: str, nt_type: NETWORK, net: str, tr_type: TRANSACTION,
+             up_to_block: Optional[int] = None) -> List[Dict]:
+        """
+        Return the archived transactions of an address, sorted by block
+
+        :param address: address of the history
+        :type address: str
+        :param nt_type: type of network
+        :type nt_type: NETWORK
+        :param net: name of the network, used to differentiate main and test nets
+        :type net: str
+        :param tr_type: type of the transactions
+        :type tr_type: TRANSACTION
+        :param up_to_block: last block to read, None for all the archived blocks
+        :type up_to_block: Optional[int]
+        :return: transactions, as returned by the API
+        :rtype: List[Dict]
+        """
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        partition_path = self.get_partition_path(nt_type, net, tr_type)
+        if not partition_path.exists():
+            return []
+        dataset = ds.dataset(partition_path, schema=self._get_schema(tr_type), format='parquet')
+        condition = ds.field('address') == address
+        if up_to_block is not None:
+            condition = condition & (ds.field('blockNumber').cast(pa.int64()) <= up_to_block)
+        table = dataset.to_table(columns=get_transaction_columns(tr_type), filter=condition)
+        transactions = table.to_pylist()
+        transactions.sort(key=lambda tx: int(tx['blockNumber']))  # stable, keeps the order within a block
+        return transactions
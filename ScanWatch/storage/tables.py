@@ -1,3 +1,5 @@
+from functools import lru_cache
+from operator import itemgetter
 from typing import List, Optional, Tuple, Dict
 
 from ScanWatch.utils.enums import NETWORK, TRANSACTION
@@ -8,10 +10,12 @@ class Table:
     This class represent a table in a database. All columns names are dynamic attributes
     @DynamicAttrs
     This class is used to describe the tables that will be used to in the database
+    The tables returned by the get_*_table functions are cached and shared, they must not be modified.
     """
 
     def __init__(self, name: str, columns_names: List[str], columns_sql_types: List[str],
-                 primary_key: Optional[str] = None, primary_key_sql_type: Optional[str] = None):
+                 primary_key: Optional[str] = None, primary_key_sql_type: Optional[str] = None,
+                 indexes: Optional[List[Tuple[List[str], bool]]] = None):
         """
         Initialise a Table instance
 
@@ -25,12 +29,15 @@ class Table:
         :type primary_key: Optional[str]
         :param primary_key_sql_type: sql type of the primary key (None, if no primary key is needed)
         :type primary_key_sql_type: Optional[str]
+        :param indexes: indexes created with the table, as (columns names, unique)
+        :type indexes: Optional[List[Tuple[List[str], bool]]]
         """
         self.name = name
         self.columns_names = columns_names
         self.columns_sql_types = columns_sql_types
         self.primary_key = primary_key
         self.primary_key_sql_type = primary_key_sql_type
+        self.indexes = indexes if indexes is not None else []
 
         for column_name in self.columns_names:
             try:
@@ -42,6 +49,10 @@ class Table:
         if self.primary_key is not None:
             setattr(self, self.primary_key, self.primary_key)
 
+        # keys of a full row, in the order of the columns, and the converters built from them
+        self.keys = ((self.primary_key,) if self.primary_key is not None else ()) + tuple(self.columns_names)
+        self._getter = itemgetter(*self.keys) if len(self.keys) > 1 else lambda row: (row[self.keys[0]],)
+
     def tuple_to_dict(self, row: Tuple) -> Dict:
         """
         Transform a row from Tuple to Dict with column names as keys.
@@ -51,13 +62,9 @@ class Table:
         :return: the dictionary equivalent of this row
         :rtype: Dict
         """
-        keys = []
-        if self.primary_key is not None:
-            keys.append(self.primary_key)
-        keys += self.columns_names
-        if len(keys) != len(row):
-            raise ValueError(f"{len(keys)} values were expected but the row submitted only has {len(row)}")
-        return {k: v for k, v in zip(keys, row)}
+        if len(self.keys) != len(row):
+            raise ValueError(f"{len(self.keys)} values were expected but the row submitted only has {len(row)}")
+        return dict(zip(self.keys, row))
 
     def dict_to_tuple(self, row: Dict) -> Tuple:
         """
@@ -68,14 +75,37 @@ class Table:
         :return: the tuple equivalent of this row
         :rtype: Tuple
         """
-        keys = []
-        if self.primary_key is not None:
-            keys.append(self.primary_key)
-        keys += self.columns_names
         try:
-            return tuple([row[k] for k in keys])
+            return self._getter(row)
+        except KeyError as err:
+            raise ValueError(f"missing keys in the row provided: {list(self.keys)} are expected") from err
+
+    def dicts_to_tuples(self, rows: List[Dict]) -> List[Tuple]:
+        """
+        Transform a list of rows from Dict to Tuple, in the order of the table columns
+
+        :param rows: rows of this table
+        :type rows: List[Dict]
+        :return: the tuple equivalents of these rows
+        :rtype: List[Tuple]
+        """
+        try:
+            return list(map(self._getter, rows))
         except KeyError as err:
-            raise ValueError(f"missing keys in the row provided: {keys} are expected") from err
+            raise ValueError(f"missing keys in a row provided: {list(self.keys)} are expected") from err
+
+    def row_factory(self, cursor, row: Tuple) -> Dict:
+        """
+        Row factory for a sqlite3 cursor that selects all the columns of this table, it returns the rows as Dict
+
+        :param cursor: cursor that fetched the row
+        :type cursor: sqlite3.Cursor
+        :param row: a row of this table
+        :type row: Tuple
+        :return: the dictionary equivalent of this row
+        :rtype: Dict
+        """
+        return dict(zip(self.keys, row))
 
 
 def get_normal_transaction_table(address: str, scan_type: NETWORK):
@@ -113,20 +143,14 @@ def get_normal_transaction_table(address: str, scan_type: NETWORK):
     return Table(f"{scan_type}_{address}_normal_transaction", rows, row_types)
 
 
-def get_transaction_table(address: str, nt_type: NETWORK, net: str, tr_type: TRANSACTION):
+def get_transaction_columns(tr_type: TRANSACTION) -> List[str]:
     """
-    Return the table used to store the transactions depending on the address, network type and transaction type
+    Return the names of the columns of the transactions of a type, as returned by the API
 
-    :param address: address of the transactions
-    :type address: str
-    :param nt_type: type of network
-    :type nt_type: NETWORK
-    :param net: name of the network, used to differentiate main and test nets
-    :type net: str
-    :param tr_type: type of the transaction to record
+    :param tr_type: type of the transactions
     :type tr_type: TRANSACTION
-    :return: corresponding table
-    :rtype: Table
+    :return: names of the columns
+    :rtype: List[str]
     """
     if tr_type == TRANSACTION.NORMAL:
         rows = [
@@ -213,8 +237,203 @@ def get_transaction_table(address: str, nt_type: NETWORK, net: str, tr_type: TRA
     else:
         raise ValueError(f"unknown transaction type: {tr_type}")
 
-    row_types = len(rows) * ['TEXT']
+    return rows
+
+
+def _get_pre_name(nt_type: NETWORK, net: str, tr_type: TRANSACTION) -> str:
     pre_name = f"{nt_type.name.lower()}_{tr_type.name.lower()}"
     if net != "main":  # backward compatibility
         pre_name += f"_{net}"
-    return Table(pre_name + f"_{address}_transaction", rows, row_types)
+    return pre_name
+
+
+@lru_cache(maxsize=4096)
+def get_transaction_table(address: str, nt_type: NETWORK, net: str, tr_type: TRANSACTION):
+    """
+    Return the table used to store the transactions depending on the address, network type and transaction type
+
+    :param address: address of the transactions
+    :type address: str
+    :param nt_type: type of network
+    :type nt_type: NETWORK
+    :param net: name of the network, used to differentiate main and test nets
+    :type net: str
+    :param tr_type: type of the transaction to record
+    :type tr_type: TRANSACTION
+    :return: corresponding table
+    :rtype: Table
+    """
+    rows = get_transaction_columns(tr_type)
+    row_types = len(rows) * ['TEXT']
+    return Table(_get_pre_name(nt_type, net, tr_type) + f"_{address}_transaction", rows, row_types)
+
+
+@lru_cache(maxsize=None)
+def get_shared_transaction_table(nt_type: NETWORK, net: str, tr_type: TRANSACTION):
+    """
+    Return the table storing once the transactions of every address (shared storage mode), keyed by a transaction
+    key (see ScanDataBase.get_transaction_keys)
+
+    :param nt_type: type of network
+    :type nt_type: NETWORK
+    :param net: name of the network, used to differentiate main and test nets
+    :type net: str
+    :param tr_type: type of the transactions
+    :type tr_type: TRANSACTION
+    :return: shared transaction table
+    :rtype: Table
+    """
+    rows = get_transaction_columns(tr_type)
+    row_types = len(rows) * ['TEXT']
+    return Table(_get_pre_name(nt_type, net, tr_type) + "_shared_transaction", rows, row_types,
+                 primary_key='txKey', primary_key_sql_type='TEXT')
+
+
+@lru_cache(maxsize=None)
+def get_membership_table(nt_type: NETWORK, net: str, tr_type: TRANSACTION):
+    """
+    Return the table linking the addresses to their transactions of the shared transaction table
+
+    :param nt_type: type of network
+    :type nt_type: NETWORK
+    :param net: name of the network, used to differentiate main and test nets
+    :type net: str
+    :param tr_type: type of the transactions
+    :type tr_type: TRANSACTION
+    :return: membership table
+    :rtype: Table
+    """
+    rows = [
+        'address',
+        'txKey',
+        'blockNumber',
+    ]
+    row_types = ['TEXT', 'TEXT', 'INTEGER']
+    indexes = [(['address', 'txKey'], True), (['address', 'blockNumber'], False), (['txKey'], False)]
+    return Table(_get_pre_name(nt_type, net, tr_type) + "_membership", rows, row_types, indexes=indexes)
+
+
+@lru_cache(maxsize=None)
+def get_token_table(nt_type: NETWORK, net: str):
+    """
+    Return the table used to store the metadata of the tokens of a network, referenced by the erc20 and erc721
+    transactions through their contract address
+
+    :param nt_type: type of network
+    :type nt_type: NETWORK
+    :param net: name of the network, used to differentiate main and test nets
+    :type net: str
+    :return: token table
+    :rtype: Table
+    """
+    rows = [
+        'tokenName',
+        'tokenSymbol',
+        'tokenDecimal',
+    ]
+    row_types = len(rows) * ['TEXT']
+    pre_name = nt_type.name.lower()
+    if net != "main":
+        pre_name += f"_{net}"
+    return Table(pre_name + "_token", rows, row_types, primary_key='contractAddress', primary_key_sql_type='TEXT')
+
+
+@lru_cache(maxsize=None)
+def get_sync_state_table():
+    """
+    Return the table used to store the synchronisation state of each transaction table
+
+    :return: sync state table
+    :rtype: Table
+    """
+    rows = [
+        'finalized_block'
+    ]
+    row_types = ['INTEGER']
+    return Table("sync_state", rows, row_types, primary_key='table_name', primary_key_sql_type='TEXT')
+
+
+@lru_cache(maxsize=None)
+def get_change_log_table():
+    """
+    Return the table logging the transactions stored in the database, in the order they were stored. The rowid
+    of the table is used as sequence number.
+
+    :return: change log table
+    :rtype: Table
+    """
+    rows = [
+        'address',
+        'network',
+        'net',
+        'trType',
+        'blockNumber',
+        'payload',
+    ]
+    row_types = ['TEXT', 'TEXT', 'TEXT', 'TEXT', 'INTEGER', 'TEXT']
+    return Table("change_log", rows, row_types, primary_key='seq', primary_key_sql_type='INTEGER')
+
+
+@lru_cache(maxsize=None)
+def get_coverage_table():
+    """
+    Return the table used to store the block ranges fetched from the API for each transaction table
+
+    :return: coverage table
+    :rtype: Table
+    """
+    rows = [
+        'tableName',
+        'startBlock',
+        'endBlock',
+    ]
+    row_types = ['TEXT', 'INTEGER', 'INTEGER']
+    return Table("coverage", rows, row_types, indexes=[(['tableName'], False)])
+
+
+@lru_cache(maxsize=None)
+def get_archive_state_table():
+    """
+    Return the table used to store the last block of each transaction table moved to the archive
+
+    :return: archive state table
+    :rtype: Table
+    """
+    rows = [
+        'archived_block'
+    ]
+    row_types = ['INTEGER']
+    return Table("archive_state", rows, row_types, primary_key='table_name', primary_key_sql_type='TEXT')
+
+
+@lru_cache(maxsize=None)
+def get_flow_table(nt_type: NETWORK, net: str):
+    """
+    Return the table aggregating the transfers between the recorded addresses and their counterparties, per asset
+    (the native coin or the contract address of a token). The sums are integers stored as text, as they exceed
+    the sqlite integers.
+
+    :param nt_type: type of network
+    :type nt_type: NETWORK
+    :param net: name of the network, used to differentiate main and test nets
+    :type net: str
+    :return: flow table
+    :rtype: Table
+    """
+    rows = [
+        'address',
+        'counterparty',
+        'asset',
+        'inCount',
+        'outCount',
+        'inValue',
+        'outValue',
+        'firstBlock',
+        'lastBlock',
+    ]
+    row_types = ['TEXT', 'TEXT', 'TEXT', 'INTEGER', 'INTEGER', 'TEXT', 'TEXT', 'INTEGER', 'INTEGER']
+    pre_name = nt_type.name.lower()
+    if net != "main":
+        pre_name += f"_{net}"
+    indexes = [(['address', 'counterparty', 'asset'], True)]
+    return Table(pre_name + "_flow", rows, row_types, indexes=indexes)
@@ -0,0 +1,113 @@
+import threading
+import time
+from typing import Dict, List, Optional
+
+from ScanWatch.utils.RateLimiter import RateLimiter
+
+
+class APIKeyPool:
+    """
+    Pool of api tokens of the same network. The calls are spread over the keys according to their own rate budget,
+    and the keys that hit a rate limit or are rejected by the API are quarantined for some time.
+    """
+
+    def __init__(self, api_tokens: List[str], calls_per_second: float = 5, rate_limit_quarantine: float = 60,
+                 invalid_key_quarantine: float = 3600, rate_limiters: Optional[Dict[str, RateLimiter]] = None):
+        """
+        Initialise a pool of api tokens
+
+        :param api_tokens: tokens of the pool
+        :type api_tokens: List[str]
+        :param calls_per_second: rate budget of each token
+        :type calls_per_second: float, default 5
+        :param rate_limit_quarantine: time in seconds a token is put aside after hitting the rate limit
+        :type rate_limit_quarantine: float, default 60
+        :param invalid_key_quarantine: time in seconds a token is put aside after being rejected as invalid
+        :type invalid_key_quarantine: float, default 3600
+        :param rate_limiters: limiter of each token, to share the budget of the tokens with other pools (for example
+            SharedRateLimiter between processes), default to a new limiter of calls_per_second per token
+        :type rate_limiters: Optional[Dict[str, RateLimiter]]
+        """
+        if not len(api_tokens):
+            raise ValueError("at least one api token is needed")
+        self.api_tokens = list(dict.fromkeys(api_tokens))
+        self.rate_limit_quarantine = rate_limit_quarantine
+        self.invalid_key_quarantine = invalid_key_quarantine
+        if rate_limiters is None:
+            rate_limiters = {token: RateLimiter(calls_per_second) for token in self.api_tokens}
+        self._limiters = {token: rate_limiters[token] for token in self.api_tokens}
+        self._quarantine_ends = {token: 0. for token in self.api_tokens}
+        self._stats = {token: {'calls': 0, 'rate_limited': 0, 'invalid': 0} for token in self.api_tokens}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.api_tokens)
+
+    def acquire(self) -> str:
+        """
+        Block until one of the tokens can be used and return it. The available token with the shortest wait is
+        chosen, so that the load is spread over all the tokens.
+
+        :return: api token to use for the next call
+        :rtype: str
+        """
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                available = [t for t in self.api_tokens if self._quarantine_ends[t] <= now]
+                if not len(available):
+                    wait_time = min(self._quarantine_ends.values()) - now
+                else:
+                    token = min(available, key=lambda t: self._limiters[t].get_wait_time())
+                    wait_time = None
+            if wait_time is not None:
+                time.sleep(wait_time)
+                continue
+            self._limiters[token].acquire()
+            with self._lock:
+                self._stats[token]['calls'] += 1
+            return token
+
+    def report_rate_limit(self, api_token: str):
+        """
+        Quarantine a token that has hit the rate limit of the API
+
+        :param api_token: token to quarantine
+        :type api_token: str
+        :return: None
+        :rtype: None
+        """
+        with self._lock:
+            self._stats[api_token]['rate_limited'] += 1
+            self._quarantine_ends[api_token] = time.monotonic() + self.rate_limit_quarantine
+
+    def report_invalid_key(self, api_token: str):
+        """
+        Quarantine a token that has been rejected by the API
+
+        :param api_token: token to quarantine
+        :type api_token: str
+        :return: None
+        :rtype: None
+        """
+        with self._lock:
+            self._stats[api_token]['invalid'] += 1
+            self._quarantine_ends[api_token] = time.monotonic() + self.invalid_key_quarantine
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """
+        Return the usage statistics of each token of the pool
+
+        :return: number of calls, rate limit hits and invalid key errors, and if the token is quarantined
+        :rtype: Dict[str, Dict]
+
+        .. code-block:: python
+
+            {'<TOKEN_1>': {'calls': 1450, 'rate_limited': 2, 'invalid': 0, 'quarantined': False},
+             '<TOKEN_2>': {'calls': 1449, 'rate_limited': 0, 'invalid': 0, 'quarantined': False}}
+
+        """
+        now = time.monotonic()
+        with self._lock:
+            return {token: {**stats, 'quarantined': self._quarantine_ends[token] > now}
+                    for token, stats in self._stats.items()}
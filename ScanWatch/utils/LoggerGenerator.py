@@ -1,19 +1,22 @@
 import logging
 import os
-from typing import Optional
+import threading
+from typing import Dict, Optional
 
 from ScanWatch.utils.paths import get_data_path
 
 
 class LoggerGenerator:
     """
-    This class is a utility to facilitate the creation of loggers for the different classes / files
+    This class is a utility to facilitate the creation of loggers for the different classes / files.
+    A single logger is created per name, it is shared by all the objects asking for this name.
     """
-    LOGS_FOLDER_PATH = get_data_path() / "logs"
+    LOGS_FOLDER_PATH = None  # default to the logs folder inside the data path, created with the first log file
 
     _default_log_level = logging.WARNING
     _default_write_file = False
-    _logger_count = 0
+    _loggers: Dict[str, logging.Logger] = {}
+    _loggers_lock = threading.Lock()
 
     @staticmethod
     def set_global_log_level(log_level: int):
@@ -39,14 +42,28 @@ class LoggerGenerator:
         """
         LoggerGenerator._default_write_file = write_file
 
+    @staticmethod
+    def get_logs_folder_path():
+        """
+        Return the folder where the log files are saved, create it if needed
+
+        :return: path of the logs folder
+        :rtype: pathlib.Path
+        """
+        if LoggerGenerator.LOGS_FOLDER_PATH is None:
+            LoggerGenerator.LOGS_FOLDER_PATH = get_data_path() / "logs"
+        os.makedirs(LoggerGenerator.LOGS_FOLDER_PATH, exist_ok=True)
+        return LoggerGenerator.LOGS_FOLDER_PATH
+
     @staticmethod
     def get_logger(logger_name: str, write_file: Optional[bool] = None,
                    log_level: Optional[int] = None) -> logging.Logger:
         """
-        create a logger that will display messages according to the log level threshold. If specified, it will
-        also save the messages in a file inside the logs folder
+        return the logger of a name, that will display messages according to the log level threshold. If specified,
+        it will also save the messages in a file inside the logs folder. The logger is created on the first call
+        for a name, the next calls return the same logger (with the updated log level and file handler).
 
-        :param logger_name: name of the logger (a unique logger id will be added after the name)
+        :param logger_name: name of the logger
         :type logger_name: str
         :param write_file: if the logger should save the message in a file
         :type write_file: bool
@@ -60,33 +77,45 @@ class LoggerGenerator:
         if write_file is None:
             write_file = LoggerGenerator._default_write_file
 
-        # create logger
-        logger = logging.getLogger(f"lg_{LoggerGenerator._logger_count}_{logger_name}")
-        logger.setLevel(level=log_level)
-        LoggerGenerator._logger_count += 1
-
-        # create formatter and add it to the handlers
-        log_format = '[%(asctime)s %(name)s %(levelname)s] %(message)s [%(pathname)s:%(lineno)d in %(funcName)s]'
-        formatter = logging.Formatter(log_format)
-
-        if write_file:
-            # create file handler for logger.
-            log_file_path = LoggerGenerator.LOGS_FOLDER_PATH / f"{logger_name}.log"
-            fh = logging.FileHandler(log_file_path)
-            fh.setLevel(level=log_level)
-            fh.setFormatter(formatter)
-            logger.addHandler(fh)
-
-        # create console handler for logger.
-        ch = logging.StreamHandler()
-        ch.setLevel(level=log_level)
-        ch.setFormatter(formatter)
-        logger.addHandler(ch)
-
-        return logger
+        with LoggerGenerator._loggers_lock:
+            logger = LoggerGenerator._loggers.get(logger_name)
+            if logger is None:
+                logger = logging.getLogger(f"lg_{logger_name}")
+                LoggerGenerator._loggers[logger_name] = logger
+            logger.setLevel(level=log_level)
+
+            # create formatter and add it to the handlers
+            log_format = '[%(asctime)s %(name)s %(levelname)s] %(message)s [%(pathname)s:%(lineno)d in %(funcName)s]'
+            formatter = logging.Formatter(log_format)
+
+            if write_file and not any(isinstance(h, logging.FileHandler) for h in logger.handlers):
+                # create file handler for logger.
+                log_file_path = LoggerGenerator.get_logs_folder_path() / f"{logger_name}.log"
+                fh = logging.FileHandler(log_file_path)
+                fh.setFormatter(formatter)
+                logger.addHandler(fh)
+
+            if not any(type(h) is logging.StreamHandler for h in logger.handlers):
+                # create console handler for logger.
+                ch = logging.StreamHandler()
+                ch.setFormatter(formatter)
+                logger.addHandler(ch)
+
+            for handler in logger.handlers:
+                handler.setLevel(level=log_level)
+            return logger
 
+    @staticmethod
+    def close_all():
+        """
+        Close the handlers of all the loggers created by the generator and forget the loggers
 
-try:  # create logs folder
-    os.makedirs(LoggerGenerator.LOGS_FOLDER_PATH)
-except FileExistsError:
-    pass
+        :return: None
+        :rtype: None
+        """
+        with LoggerGenerator._loggers_lock:
+            for logger in LoggerGenerator._loggers.values():
+                for handler in list(logger.handlers):
+                    logger.removeHandler(handler)
+                    handler.close()
+            LoggerGenerator._loggers = {}
@@ -0,0 +1,127 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket used to stay under the rate limit of an API key
+    """
+
+    def __init__(self, calls_per_second: float, burst: int = 1):
+        """
+        Initialise a rate limiter
+
+        :param calls_per_second: number of calls allowed per second on average
+        :type calls_per_second: float
+        :param burst: number of calls that can be made at once after an idle period
+        :type burst: int
+        """
+        if calls_per_second <= 0:
+            raise ValueError(f"calls_per_second should be positive, received {calls_per_second}")
+        self.calls_per_second = calls_per_second
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        """
+        Add the tokens accumulated since the last refill
+
+        :param now: current monotonic time
+        :type now: float
+        :return: None
+        :rtype: None
+        """
+        self._tokens = min(self.burst, self._tokens + (now - self._last_time) * self.calls_per_second)
+        self._last_time = now
+
+    def get_wait_time(self) -> float:
+        """
+        Return the time to wait before a call can be made
+
+        :return: time in seconds
+        :rtype: float
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0., (1 - self._tokens) / self.calls_per_second)
+
+    def try_acquire(self) -> bool:
+        """
+        Consume a call if one is available right now
+
+        :return: if a call has been consumed
+        :rtype: bool
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def acquire(self):
+        """
+        Block until a call is available and consume it
+
+        :return: None
+        :rtype: None
+        """
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_time = (1 - self._tokens) / self.calls_per_second
+            time.sleep(wait_time)
+
+
+class SharedRateLimiter(RateLimiter):
+    """
+    Token bucket shared by several processes: its state lives in shared memory. It must be given to the child
+    processes when they are started (as an argument of the process or of the pool initializer).
+    """
+
+    def __init__(self, calls_per_second: float, burst: int = 1, context=None):
+        """
+        Initialise a shared rate limiter
+
+        :param calls_per_second: number of calls allowed per second on average, for all the processes together
+        :type calls_per_second: float
+        :param burst: number of calls that can be made at once after an idle period
+        :type burst: int
+        :param context: multiprocessing context of the processes sharing the limiter, default to multiprocessing
+        :type context: Optional[multiprocessing.context.BaseContext]
+        """
+        if context is None:
+            import multiprocessing  # imported here as it is only needed for this class
+
+            context = multiprocessing
+        self._state = context.Array('d', [float(burst), time.monotonic()])  # tokens, last refill time
+        super().__init__(calls_per_second, burst)
+        self._lock = self._state.get_lock()
+
+    @property
+    def _tokens(self) -> float:
+        return self._state[0]
+
+    @_tokens.setter
+    def _tokens(self, value: float):
+        self._state[0] = value
+
+    @property
+    def _last_time(self) -> float:
+        return self._state[1]
+
+    @_last_time.setter
+    def _last_time(self, value: float):
+        self._state[1] = value
+
+    def __getstate__(self):
+        return {'calls_per_second': self.calls_per_second, 'burst': self.burst, '_state': self._state}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = self._state.get_lock()
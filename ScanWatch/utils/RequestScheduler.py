@@ -0,0 +1,209 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from ScanWatch.utils.RateLimiter import RateLimiter
+from ScanWatch.utils.enums import PRIORITY
+from ScanWatch.utils.metrics import get_metrics
+
+_local = threading.local()
+
+
+@contextmanager
+def request_priority(priority: PRIORITY):
+    """
+    Set the priority of the API calls made by the current thread inside the block
+
+    .. code-block:: python
+
+        with request_priority(PRIORITY.INTERACTIVE):
+            manager.update_transactions(TRANSACTION.NORMAL)
+
+    :param priority: priority of the calls
+    :type priority: PRIORITY
+    :return: context manager
+    :rtype: ContextManager
+    """
+    previous = getattr(_local, 'priority', None)
+    _local.priority = priority
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+def get_request_priority() -> Optional[PRIORITY]:
+    """
+    Return the priority set for the API calls of the current thread by request_priority
+
+    :return: priority of the calls, None if no priority is set
+    :rtype: Optional[PRIORITY]
+    """
+    return getattr(_local, 'priority', None)
+
+
+class RequestScheduler:
+    """
+    Give the turns to call the API within a rate limit. The waiting calls are served by priority: an interactive
+    call always goes before the background ones. Within a priority, the addresses are served in turn, so that a
+    long backfill of an address does not delay the other addresses. The calls of an address can be promoted to a
+    higher priority while they are waiting, see promote.
+    The scheduler can be shared by several clients, it then replaces their own rate limiter.
+    """
+
+    def __init__(self, calls_per_second: float = 5, rate_limiter: Optional[RateLimiter] = None,
+                 default_priority: PRIORITY = PRIORITY.BACKGROUND):
+        """
+        Initialise a scheduler
+
+        :param calls_per_second: rate budget of the API calls, ignored if a rate limiter is provided
+        :type calls_per_second: float, default 5
+        :param rate_limiter: rate limiter to respect
+        :type rate_limiter: Optional[RateLimiter]
+        :param default_priority: priority of the calls made outside of a request_priority block
+        :type default_priority: PRIORITY, default PRIORITY.BACKGROUND
+        """
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter(calls_per_second)
+        self.default_priority = default_priority
+        # waiting calls: priority -> address -> tickets, in order of arrival
+        self._lanes: Dict[PRIORITY, OrderedDict] = {priority: OrderedDict() for priority in PRIORITY}
+        self._promotions: Dict[str, List[PRIORITY]] = {}  # address -> priorities of the promote blocks in progress
+        self._condition = threading.Condition()
+
+    def _get_next_ticket(self) -> Tuple[Optional[PRIORITY], Optional[object]]:
+        """
+        Return the ticket of the next call to serve, with the priority of its lane
+
+        :return: priority and ticket, (None, None) if no call is waiting
+        :rtype: Tuple[Optional[PRIORITY], Optional[object]]
+        """
+        for priority in sorted(self._lanes, key=lambda p: p.value):
+            lane = self._lanes[priority]
+            if len(lane):
+                return priority, next(iter(lane.values()))[0]
+        return None, None
+
+    def _remove_ticket(self, priority: PRIORITY, address: str):
+        """
+        Remove the first ticket of an address, the address goes at the end of the round
+
+        :param priority: priority of the ticket
+        :type priority: PRIORITY
+        :param address: address of the ticket
+        :type address: str
+        :return: None
+        :rtype: None
+        """
+        lane = self._lanes[priority]
+        tickets = lane[address]
+        tickets.popleft()
+        if len(tickets):
+            lane.move_to_end(address)
+        else:
+            del lane[address]
+
+    def _discard_ticket(self, address: str, ticket: object):
+        """
+        Remove the ticket of a call that stopped waiting, from the lane it is in
+
+        :param address: address of the ticket
+        :type address: str
+        :param ticket: ticket to remove
+        :type ticket: object
+        :return: None
+        :rtype: None
+        """
+        for lane in self._lanes.values():
+            tickets = lane.get(address)
+            if tickets is not None and ticket in tickets:
+                tickets.remove(ticket)
+                if not len(tickets):
+                    del lane[address]
+                return
+
+    @contextmanager
+    def promote(self, address: str, priority: PRIORITY = PRIORITY.INTERACTIVE):
+        """
+        Serve the calls of an address with a higher priority inside the block, including the calls already waiting.
+        It speeds up an update in progress that a user is now waiting for.
+
+        .. code-block:: python
+
+            with scheduler.promote(address):
+                wait_for_the_update(address)
+
+        :param address: address of the calls
+        :type address: str
+        :param priority: priority given to the calls of the address
+        :type priority: PRIORITY, default PRIORITY.INTERACTIVE
+        :return: context manager
+        :rtype: ContextManager
+        """
+        with self._condition:
+            self._promotions.setdefault(address, []).append(priority)
+            for lane_priority, lane in self._lanes.items():
+                if lane_priority.value > priority.value and address in lane:
+                    self._lanes[priority].setdefault(address, deque()).extend(lane.pop(address))
+            self._condition.notify_all()
+        try:
+            yield
+        finally:
+            with self._condition:
+                promotions = self._promotions[address]
+                promotions.remove(priority)
+                if not len(promotions):
+                    del self._promotions[address]
+
+    def acquire(self, address: str = '', priority: Optional[PRIORITY] = None):
+        """
+        Block until it is the turn of a call and consume a call of the rate budget
+
+        :param address: address concerned by the call, used to share the turns between the addresses
+        :type address: str
+        :param priority: priority of the call, default to the priority of the request_priority block, or to the
+            default priority of the scheduler
+        :type priority: Optional[PRIORITY]
+        :return: None
+        :rtype: None
+        """
+        if priority is None:
+            priority = get_request_priority() or self.default_priority
+        ticket = object()
+        start = time.perf_counter()
+        with self._condition:
+            priority = min([priority] + self._promotions.get(address, []), key=lambda p: p.value)
+            lane = self._lanes[priority]
+            if address not in lane:
+                lane[address] = deque()
+            lane[address].append(ticket)
+            self._condition.notify_all()  # a call of higher priority may now be the next one
+            try:
+                while True:
+                    next_priority, next_ticket = self._get_next_ticket()
+                    if next_ticket is ticket:
+                        if self.rate_limiter.try_acquire():
+                            self._remove_ticket(next_priority, address)  # the ticket may have been promoted
+                            self._condition.notify_all()
+                            break
+                        self._condition.wait(self.rate_limiter.get_wait_time())
+                    else:
+                        self._condition.wait()
+            except BaseException:  # interrupted while waiting: give the turn to the next call
+                self._discard_ticket(address, ticket)
+                self._condition.notify_all()
+                raise
+        get_metrics().observe('scanwatch_scheduler_wait_seconds', time.perf_counter() - start,
+                              priority=priority.name.lower())
+
+    def get_waiting_count(self) -> Dict[PRIORITY, int]:
+        """
+        Return the number of calls waiting for their turn
+
+        :return: number of waiting calls per priority
+        :rtype: Dict[PRIORITY, int]
+        """
+        with self._condition:
+            return {priority: sum(len(tickets) for tickets in lane.values())
+                    for priority, lane in self._lanes.items()}
@@ -0,0 +1,52 @@
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Coalesce the concurrent calls sharing a key: while a call is in progress, the other calls with the same key
+    wait for it and receive its result (or its exception) instead of executing the function again.
+    """
+
+    def __init__(self):
+        """
+        Initialise a single-flight group
+        """
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        """
+        Execute a function, unless a call with the same key is already in progress: wait for it and return its
+        result in this case.
+
+        :param key: key identifying the call
+        :type key: Hashable
+        :param function: function to execute
+        :type function: Callable[[], Any]
+        :return: result of the function
+        :rtype: Any
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result()
+        try:
+            result = function()
+        except BaseException as err:
+            self._forget(key)
+            future.set_exception(err)
+            raise
+        self._forget(key)
+        future.set_result(result)
+        return result
+
+    def _forget(self, key: Hashable):
+        # the key is removed before the result is published, so that the calls made after the end of this one
+        # execute the function again
+        with self._lock:
+            del self._calls[key]
@@ -12,3 +12,19 @@ class TRANSACTION(Enum):
     INTERNAL = 2
     ERC20 = 3
     ERC721 = 4
+
+
+class INPUT_STORAGE(Enum):
+    RAW = 1
+    COMPRESS = 2
+    DROP = 3
+
+
+class PRIORITY(Enum):
+    INTERACTIVE = 1
+    BACKGROUND = 2
+
+
+class SNAPSHOT_FORMAT(Enum):
+    SQLITE = 1
+    SQL = 2
@@ -0,0 +1,236 @@
+import bisect
+import threading
+from typing import Dict, Optional, Tuple
+
+
+class MetricsHook:
+    """
+    Interface receiving the metrics of ScanWatch. The default implementation ignores them, subclass it to forward
+    the metrics to another monitoring system.
+
+    Metrics recorded by ScanWatch:
+
+    - scanwatch_api_request_seconds (histogram, labels: network, action): latency of the API calls, network is
+      <network>_<net> (ex: ether_main)
+    - scanwatch_api_errors_total (counter, labels: network, action): API calls that returned an error
+    - scanwatch_api_rate_limited_total (counter, labels: network): API calls that hit the rate limit
+    - scanwatch_api_retries_total (counter, labels: network): API calls retried with another key
+    - scanwatch_rows_fetched_total (counter, labels: network, action): transactions received from the API
+    - scanwatch_rows_inserted_total (counter, labels: network, tr_type): transactions saved in the database
+    - scanwatch_db_commit_seconds (histogram, labels: db): latency of the database commits
+    - scanwatch_cache_requests_total (counter, labels: result): response cache lookups, result is hit or miss
+    - scanwatch_coalesced_updates_total (counter, labels: network, tr_type): updates that joined an identical
+      update already in progress instead of fetching the transactions again
+    - scanwatch_scheduler_wait_seconds (histogram, labels: priority): time spent by the API calls waiting for their
+      turn in a RequestScheduler
+    """
+
+    def increment(self, name: str, value: float = 1, **labels: str):
+        """
+        Increment a counter
+
+        :param name: name of the counter
+        :type name: str
+        :param value: value to add
+        :type value: float
+        :param labels: labels of the counter
+        :type labels: str
+        :return: None
+        :rtype: None
+        """
+
+    def observe(self, name: str, value: float, **labels: str):
+        """
+        Record a value in a histogram
+
+        :param name: name of the histogram
+        :type name: str
+        :param value: observed value
+        :type value: float
+        :param labels: labels of the histogram
+        :type labels: str
+        :return: None
+        :rtype: None
+        """
+
+
+class MetricsRegistry(MetricsHook):
+    """
+    In-memory metrics, that can be read directly or exported in the Prometheus text format
+    """
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        """
+        Initialise an empty registry
+
+        :param buckets: upper bounds of the histograms buckets
+        :type buckets: Tuple[float, ...]
+        """
+        self.buckets = tuple(sorted(buckets))
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._histograms: Dict[Tuple[str, Tuple], list] = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: float = 1, **labels: str):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0., 0]
+            histogram[0][bisect.bisect_left(self.buckets, value)] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def get_counter(self, name: str, **labels: str) -> float:
+        """
+        Return the value of a counter
+
+        :param name: name of the counter
+        :type name: str
+        :param labels: labels of the counter
+        :type labels: str
+        :return: value of the counter, 0 if it has never been incremented
+        :rtype: float
+        """
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def get_histogram(self, name: str, **labels: str) -> Optional[Dict]:
+        """
+        Return the state of a histogram
+
+        :param name: name of the histogram
+        :type name: str
+        :param labels: labels of the histogram
+        :type labels: str
+        :return: count, sum and count per bucket upper bound of the histogram, None if nothing was observed
+        :rtype: Optional[Dict]
+        """
+        with self._lock:
+            histogram = self._histograms.get((name, tuple(sorted(labels.items()))))
+            if histogram is None:
+                return None
+            return {'count': histogram[2],
+                    'sum': histogram[1],
+                    'buckets': dict(zip(self.buckets + (float('inf'),), histogram[0]))}
+
+    def reset(self):
+        """
+        Remove all the recorded metrics
+
+        :return: None
+        :rtype: None
+        """
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+
+    def to_prometheus(self) -> str:
+        """
+        Export the metrics in the Prometheus text exposition format
+
+        :return: metrics text
+        :rtype: str
+        """
+
+        def format_labels(labels, extra=()):
+            labels = list(labels) + list(extra)
+            if not len(labels):
+                return ''
+            return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+        last_name = None
+        for (name, labels), value in counters:
+            if name != last_name:
+                lines.append(f"# TYPE {name} counter")
+                last_name = name
+            lines.append(f"{name}{format_labels(labels)} {value}")
+        for (name, labels), (counts, total, count) in histograms:
+            if name != last_name:
+                lines.append(f"# TYPE {name} histogram")
+                last_name = name
+            cumulated = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulated += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{name}_bucket{format_labels(labels, [('le', le)])} {cumulated}")
+            lines.append(f"{name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+_metrics: MetricsHook = MetricsRegistry()
+
+
+def get_metrics() -> MetricsHook:
+    """
+    Return the hook receiving the metrics of ScanWatch, by default an in-memory MetricsRegistry
+
+    :return: metrics hook
+    :rtype: MetricsHook
+    """
+    return _metrics
+
+
+def set_metrics(metrics: MetricsHook):
+    """
+    Replace the hook receiving the metrics of ScanWatch, give MetricsHook() to disable the metrics
+
+    :param metrics: new metrics hook
+    :type metrics: MetricsHook
+    :return: None
+    :rtype: None
+    """
+    global _metrics
+    _metrics = metrics
+
+
+def start_prometheus_server(port: int, registry: Optional[MetricsRegistry] = None,
+                            host: str = '127.0.0.1'):
+    """
+    Serve the metrics of a registry in the Prometheus text format on /metrics, from a background thread
+
+    :param port: port of the server
+    :type port: int
+    :param registry: registry to export, default to the current metrics hook
+    :type registry: Optional[MetricsRegistry]
+    :param host: interface of the server, the local one by default. Give '0.0.0.0' to expose the metrics on
+        every network interface.
+    :type host: str, default '127.0.0.1'
+    :return: the running server, call its shutdown method to stop it
+    :rtype: http.server.ThreadingHTTPServer
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # only imported when the server is needed
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            exported = registry if registry is not None else get_metrics()
+            if self.path.split('?')[0] != '/metrics' or not isinstance(exported, MetricsRegistry):
+                self.send_error(404)
+                return
+            body = exported.to_prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
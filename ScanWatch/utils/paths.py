@@ -1,4 +1,3 @@
-import os
 from pathlib import Path
 from appdirs import AppDirs
 
@@ -9,6 +8,7 @@ def get_data_path():
     """
     Return the folder path where to store the data created by this project
     It uses the library appdirs to follow the conventions across multi OS(MAc, Linux, Windows)
+    The folder is not created by this function, it is created by the components when they first write in it.
 
     https://pypi.org/project/appdirs/
 
@@ -16,11 +16,3 @@ def get_data_path():
     :rtype: pathlib.Path
     """
     return Path(_app_dirs.user_data_dir)
-
-
-try:  # create the data folder path
-    os.makedirs(get_data_path())
-except FileExistsError:
-    pass
-
-
@@ -0,0 +1,251 @@
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Optional
+
+
+class _NoopSpan:
+    """
+    Span returned when no tracer is set, it does nothing
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+    def set_attribute(self, key: str, value):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer(ABC):
+    """
+    Base class of the tracers receiving the spans of ScanWatch
+
+    Spans emitted by ScanWatch:
+
+    - scanwatch.update_transactions: update of a type of transactions for an address, with the sub-stages:
+    - scanwatch.resume_lookup: search of the block to resume the update from
+    - scanwatch.fetch: download of the transactions, made of scanwatch.http (request to the API) and
+      scanwatch.json_decode (decoding of the response)
+    - scanwatch.convert: conversion of the transactions to database rows (Table.dicts_to_tuples)
+    - scanwatch.sqlite: writing of the rows in the database
+    """
+
+    @abstractmethod
+    def start_span(self, name: str, attributes: Dict):
+        """
+        Return a context manager that measures a stage
+
+        :param name: name of the stage
+        :type name: str
+        :param attributes: attributes of the span
+        :type attributes: Dict
+        :return: span context manager
+        :rtype: ContextManager
+        """
+
+
+class _TimedSpan:
+    """
+    Span that calls a function with its name, duration and attributes when it ends
+    """
+
+    __slots__ = ('name', 'attributes', 'on_end', 'start')
+
+    def __init__(self, name: str, attributes: Dict, on_end: Callable):
+        self.name = name
+        self.attributes = attributes
+        self.on_end = on_end
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.on_end(self, time.perf_counter() - self.start, exc_val)
+        return False
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+
+class CallbackTracer(Tracer):
+    """
+    Tracer calling a function at the end of each span with (name, duration, attributes). The attributes contain
+    the name of the parent span under the key 'parent' and the exception that ended the span under 'error', if any.
+    """
+
+    def __init__(self, callback: Callable[[str, float, Dict], None]):
+        """
+        Initialise a callback tracer
+
+        :param callback: function called at the end of each span
+        :type callback: Callable[[str, float, Dict], None]
+        """
+        self.callback = callback
+        self._local = threading.local()
+
+    def start_span(self, name: str, attributes: Dict):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        if len(stack):
+            attributes['parent'] = stack[-1]
+        stack.append(name)
+        return _TimedSpan(name, attributes, self._on_end)
+
+    def _on_end(self, span: _TimedSpan, duration: float, error: Optional[BaseException]):
+        self._local.stack.pop()
+        if error is not None:
+            span.attributes['error'] = repr(error)
+        self.callback(span.name, duration, span.attributes)
+
+
+class OpenTelemetryTracer(Tracer):
+    """
+    Forward the spans to an OpenTelemetry tracer (or any object with a compatible start_as_current_span method)
+
+    .. code-block:: python
+
+        from opentelemetry import trace
+
+        set_tracer(OpenTelemetryTracer(trace.get_tracer("ScanWatch")))
+
+    """
+
+    def __init__(self, otel_tracer):
+        """
+        Initialise the tracer
+
+        :param otel_tracer: tracer of OpenTelemetry
+        :type otel_tracer: opentelemetry.trace.Tracer
+        """
+        self.otel_tracer = otel_tracer
+
+    def start_span(self, name: str, attributes: Dict):
+        attributes = {k: v if isinstance(v, (str, bool, int, float)) else str(v) for k, v in attributes.items()}
+        return self.otel_tracer.start_as_current_span(name, attributes=attributes)
+
+
+class StageProfiler(Tracer):
+    """
+    Sampling profiler accumulating the time spent in each stage. The sampling is decided for each root span
+    (usually scanwatch.update_transactions), so that the stages of a sampled update are all measured.
+    """
+
+    def __init__(self, sample_rate: float = 1.):
+        """
+        Initialise a profiler
+
+        :param sample_rate: fraction of the root spans that are measured, between 0 and 1
+        :type sample_rate: float
+        """
+        self.sample_rate = sample_rate
+        self._stats: Dict[str, list] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def start_span(self, name: str, attributes: Dict):
+        depth = getattr(self._local, 'depth', 0)
+        if depth == 0:
+            self._local.sampled = random.random() < self.sample_rate
+        self._local.depth = depth + 1
+        if not self._local.sampled:
+            return _TimedSpan(name, attributes, self._on_skipped_end)
+        return _TimedSpan(name, attributes, self._on_end)
+
+    def _on_skipped_end(self, span: _TimedSpan, duration: float, error: Optional[BaseException]):
+        self._local.depth -= 1
+
+    def _on_end(self, span: _TimedSpan, duration: float, error: Optional[BaseException]):
+        self._local.depth -= 1
+        with self._lock:
+            stats = self._stats.get(span.name)
+            if stats is None:
+                stats = self._stats[span.name] = [0, 0.]
+            stats[0] += 1
+            stats[1] += duration
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """
+        Return the cumulative timings of each stage
+
+        :return: number of sampled spans, total and mean duration in seconds per stage
+        :rtype: Dict[str, Dict]
+        """
+        with self._lock:
+            return {name: {'count': count, 'total': total, 'mean': total / count}
+                    for name, (count, total) in self._stats.items()}
+
+    def dump(self) -> str:
+        """
+        Return a table of the cumulative timings of each stage, sorted by total time
+
+        :return: timings table
+        :rtype: str
+        """
+        stats = sorted(self.get_stats().items(), key=lambda e: -e[1]['total'])
+        lines = [f"{'stage':<32}{'count':>10}{'total (s)':>14}{'mean (ms)':>14}"]
+        for name, stat in stats:
+            lines.append(f"{name:<32}{stat['count']:>10}{stat['total']:>14.3f}{1000 * stat['mean']:>14.3f}")
+        return '\n'.join(lines)
+
+    def reset(self):
+        """
+        Remove the recorded timings
+
+        :return: None
+        :rtype: None
+        """
+        with self._lock:
+            self._stats = {}
+
+
+_tracer: Optional[Tracer] = None
+
+
+def set_tracer(tracer: Optional[Tracer]):
+    """
+    Set the tracer receiving the spans of ScanWatch, None to disable the tracing (default)
+
+    :param tracer: tracer to use
+    :type tracer: Optional[Tracer]
+    :return: None
+    :rtype: None
+    """
+    global _tracer
+    _tracer = tracer
+
+
+def get_tracer() -> Optional[Tracer]:
+    """
+    Return the tracer receiving the spans of ScanWatch
+
+    :return: the current tracer
+    :rtype: Optional[Tracer]
+    """
+    return _tracer
+
+
+def span(name: str, **attributes):
+    """
+    Return a span measuring a stage, to use as a context manager. When no tracer is set, a shared no-op span is
+    returned.
+
+    :param name: name of the stage
+    :type name: str
+    :param attributes: attributes of the span
+    :type attributes: Any
+    :return: span context manager
+    :rtype: ContextManager
+    """
+    if _tracer is None:
+        return _NOOP_SPAN
+    return _tracer.start_span(name, attributes)
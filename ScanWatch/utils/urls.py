@@ -0,0 +1,33 @@
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+
+def strip_api_key(url: str) -> str:
+    """
+    Return the url without its apikey parameter, so that it can be used as an identifier of the request
+    independently of the key used to send it
+
+    :param url: url of a request to the API
+    :type url: str
+    :return: the url without the apikey parameter
+    :rtype: str
+    """
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != 'apikey']
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), parts.fragment))
+
+
+def set_api_key(url: str, api_token: str) -> str:
+    """
+    Return the url with its apikey parameter replaced by another token
+
+    :param url: url of a request to the API
+    :type url: str
+    :param api_token: token to use in the request
+    :type api_token: str
+    :return: the url with the new token
+    :rtype: str
+    """
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != 'apikey']
+    query.append(('apikey', api_token))
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), parts.fragment))
@@ -0,0 +1,230 @@
+"""
+Benchmark suite of ScanWatch, run against the local stand-in API of benchmarks.stub_api and the synthetic
+histories of benchmarks.synthetic.
+
+.. code:: bash
+
+    python -m benchmarks.run --sizes 1000,100000                 # report the throughputs
+    python -m benchmarks.run --sizes 1000,100000 --save-baselines  # store them as the reference
+    python -m benchmarks.run --sizes 1000,100000 --tolerance 0.25  # fail if 25% slower than the reference
+
+The baselines depend on the machine, they should be saved and compared on the same host: none are committed, and
+the comparison fails if the baselines file does not exist. The databases of the benchmarks are created in a
+temporary folder, the data folder of the library is left untouched.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from ScanWatch.ScanManager import ScanManager
+from ScanWatch.storage.ScanDataBase import ScanDataBase
+from ScanWatch.utils.RateLimiter import RateLimiter
+from ScanWatch.utils.enums import NETWORK, TRANSACTION
+from benchmarks import synthetic
+from benchmarks.stub_api import StubScanAPI
+
+BASELINES_PATH = Path(__file__).parent / "baselines.json"
+DB_NAME = "scanwatch_benchmark"
+ADDRESS = "0x" + "ab" * 20
+NT_TYPE = NETWORK.ETHER
+NET = "main"
+INSERT_CHUNK = 10000
+RESUME_LOOKUPS = 20
+IMPORT_RUNS = 10
+
+
+def _timed(function: Callable) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def _fill_database(db: ScanDataBase, tr_type: TRANSACTION, size: int):
+    db.drop_all_tables()
+    history = synthetic.generate_history(ADDRESS, tr_type, size)
+    while True:
+        chunk = list(islice(history, INSERT_CHUNK))
+        if not len(chunk):
+            break
+        db.add_transactions(ADDRESS, NT_TYPE, NET, tr_type, chunk)
+
+
+def bench_fetch(size: int, latency: float, api_rate: Optional[float]) -> float:
+    """
+    Fetch a history from the stub API with the client, return the transactions per second
+    """
+    rate_limiter = RateLimiter(api_rate) if api_rate is not None else None
+    manager = ScanManager(ADDRESS, NT_TYPE, "BENCHMARK_KEY", NET, rate_limiter=rate_limiter)
+    with StubScanAPI(histories={ADDRESS: size}, latency=latency, calls_per_second=api_rate) as api:
+        manager.client.BASE_URLS = {NT_TYPE: {NET: api.url}}
+        transactions = []
+        duration = _timed(lambda: transactions.extend(manager.client.get_normal_transactions(ADDRESS, 0)))
+    if len(transactions) != size:
+        raise RuntimeError(f"{len(transactions)} transactions fetched instead of {size}")
+    return size / duration
+
+
+def bench_insert(db: ScanDataBase, size: int) -> float:
+    """
+    Insert a history in the database, return the transactions per second
+    """
+    return size / _timed(lambda: _fill_database(db, TRANSACTION.NORMAL, size))
+
+
+def bench_resume(db: ScanDataBase, size: int) -> float:
+    """
+    Look up the last recorded block (done before every update), return the lookups per second
+    """
+    _fill_database(db, TRANSACTION.NORMAL, size)
+
+    def lookups():
+        for _ in range(RESUME_LOOKUPS):
+            db.get_last_block_number(ADDRESS, NT_TYPE, NET, TRANSACTION.NORMAL)
+
+    return RESUME_LOOKUPS / _timed(lookups)
+
+
+def bench_query(db: ScanDataBase, size: int) -> float:
+    """
+    Read a whole history from the database, return the transactions per second
+    """
+    _fill_database(db, TRANSACTION.NORMAL, size)
+    return size / _timed(lambda: db.get_transactions(ADDRESS, NT_TYPE, NET, TRANSACTION.NORMAL))
+
+
+def bench_holdings(db: ScanDataBase, size: int) -> float:
+    """
+    Compute the erc20 holdings of an address, return the transactions per second
+    """
+    _fill_database(db, TRANSACTION.ERC20, size)
+    manager = ScanManager(ADDRESS, NT_TYPE, "BENCHMARK_KEY", NET)
+    manager.db = db
+    return size / _timed(manager.get_erc20_holdings)
+
+
+def bench_import() -> float:
+    """
+    Import ScanWatch and create a manager in fresh interpreters, return the imports per second (the startup time
+    of the interpreter is excluded). Fail if anything is written in the data folder by this startup.
+    """
+    code = ("from ScanWatch.ScanManager import ScanManager; from ScanWatch.utils.enums import NETWORK; "
+            "ScanManager('0x0', NETWORK.ETHER, 'BENCHMARK_KEY')")
+    root = Path(__file__).parent.parent
+    with tempfile.TemporaryDirectory() as data_home:
+        env = {**os.environ, 'XDG_DATA_HOME': data_home,
+               'PYTHONPATH': os.pathsep.join(filter(None, [str(root), os.environ.get('PYTHONPATH')]))}
+
+        def run_code(python_code: str) -> float:
+            return _timed(lambda: subprocess.run([sys.executable, '-c', python_code], env=env, check=True))
+
+        startup = min(run_code('pass') for _ in range(IMPORT_RUNS))
+        duration = min(run_code(code) for _ in range(IMPORT_RUNS))
+        if len(os.listdir(data_home)):
+            raise RuntimeError(f"the startup of ScanWatch wrote in the data folder: {os.listdir(data_home)}")
+    return 1 / max(duration - startup, 1e-6)
+
+
+CASES = ['fetch', 'insert', 'resume', 'query', 'holdings', 'import']
+
+
+def run(sizes: List[int], cases: List[str], latency: float = 0., api_rate: Optional[float] = None) -> Dict[str, float]:
+    """
+    Run the benchmarks and return their throughput
+
+    :param sizes: sizes of the histories to benchmark
+    :type sizes: List[int]
+    :param cases: names of the benchmarks to run
+    :type cases: List[str]
+    :param latency: latency added to the stub API responses
+    :type latency: float
+    :param api_rate: rate limit of the stub API, also respected by the client
+    :type api_rate: Optional[float]
+    :return: throughput per benchmark name
+    :rtype: Dict[str, float]
+    """
+    results = {}
+    data_dir = tempfile.TemporaryDirectory()
+    db = ScanDataBase(DB_NAME)
+    db.save_path = Path(data_dir.name) / f"{DB_NAME}.db"  # before the first connection
+    try:
+        if 'import' in cases:
+            results['import'] = bench_import()
+            print(f"{'import':<24} {results['import']:>14,.1f} imports/s")
+        for size in sizes:
+            for case in cases:
+                if case == 'import':
+                    continue
+                if case == 'fetch':
+                    rate = bench_fetch(size, latency, api_rate)
+                else:
+                    rate = globals()[f"bench_{case}"](db, size)
+                name = f"{case}[{size}]"
+                results[name] = rate
+                unit = 'lookups/s' if case == 'resume' else 'rows/s'
+                print(f"{name:<24} {rate:>14,.1f} {unit}")
+    finally:
+        db.close()
+        data_dir.cleanup()
+    return results
+
+
+def compare(results: Dict[str, float], baselines: Dict[str, float], tolerance: float) -> List[str]:
+    """
+    Return the description of the benchmarks that are slower than their baseline by more than the tolerance
+    """
+    regressions = []
+    for name, rate in results.items():
+        baseline = baselines.get(name)
+        if baseline is not None and rate < baseline * (1 - tolerance):
+            regressions.append(f"{name}: {rate:,.1f} vs baseline {baseline:,.1f} ({rate / baseline - 1:+.0%})")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="ScanWatch benchmarks")
+    parser.add_argument('--sizes', default='1000,100000',
+                        help="comma separated sizes of the synthetic histories (from 1000 to 5000000)")
+    parser.add_argument('--cases', default=','.join(CASES), help=f"comma separated benchmarks among {CASES}")
+    parser.add_argument('--latency', type=float, default=0., help="latency in seconds of the stub API")
+    parser.add_argument('--api-rate', type=float, default=None, help="calls per second allowed by the stub API")
+    parser.add_argument('--tolerance', type=float, default=None,
+                        help="accepted slowdown against the baselines, the results are only compared if it is given")
+    parser.add_argument('--baselines', type=Path, default=BASELINES_PATH, help="path of the baselines file")
+    parser.add_argument('--save-baselines', action='store_true', help="save the results as the new baselines")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    cases = args.cases.split(',')
+    unknown_cases = set(cases) - set(CASES)
+    if len(unknown_cases):
+        parser.error(f"unknown benchmarks: {unknown_cases}")
+    if args.tolerance is not None and not args.save_baselines and not args.baselines.exists():
+        parser.error(f"no baselines to compare with in {args.baselines}, save them first with --save-baselines")
+    results = run(sizes, cases, args.latency, args.api_rate)
+
+    baselines = json.loads(args.baselines.read_text()) if args.baselines.exists() else {}
+    if args.save_baselines:
+        args.baselines.write_text(json.dumps({**baselines, **results}, indent=4, sort_keys=True))
+        print(f"baselines saved in {args.baselines}")
+        return 0
+    if args.tolerance is None:
+        return 0
+    missing = [name for name in results if name not in baselines]
+    if len(missing):
+        print(f"no baseline for {missing} in {args.baselines}")
+        return 1
+    regressions = compare(results, baselines, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if len(regressions) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
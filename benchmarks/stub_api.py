@@ -0,0 +1,178 @@
+"""
+Local HTTP server mimicking the ``account`` and ``proxy`` endpoints of the etherscan-like APIs, serving the
+synthetic histories of benchmarks.synthetic. It supports the pagination parameters, rate limit replies per api key
+and latency injection.
+"""
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+from ScanWatch.utils.enums import TRANSACTION
+from benchmarks import synthetic
+
+ACTIONS = {
+    'txlist': TRANSACTION.NORMAL,
+    'txlistinternal': TRANSACTION.INTERNAL,
+    'tokentx': TRANSACTION.ERC20,
+    'tokennfttx': TRANSACTION.ERC721,
+}
+
+
+class StubScanAPI:
+    """
+    Stand-in for a scan API, running in a background thread
+
+    .. code-block:: python
+
+        with StubScanAPI(histories={'0xabc': 10000}, latency=0.05) as api:
+            client.BASE_URLS = {nt_type: {'main': api.url}}
+
+    """
+
+    def __init__(self, histories: Optional[Dict[str, int]] = None, latency: float = 0.,
+                 calls_per_second: Optional[float] = None, result_window: Optional[int] = None):
+        """
+        Initialise the stub
+
+        :param histories: number of transactions of each address, for every transaction type
+        :type histories: Optional[Dict[str, int]]
+        :param latency: time in seconds added to each response
+        :type latency: float
+        :param calls_per_second: rate limit of each api key, None for no limit
+        :type calls_per_second: Optional[float]
+        :param result_window: maximum of page * offset accepted, as the real APIs do (10000), None for no limit
+        :type result_window: Optional[int]
+        """
+        self.histories = histories or {}
+        self.latency = latency
+        self.calls_per_second = calls_per_second
+        self.result_window = result_window
+        self.calls = 0
+        self.rate_limited = 0
+        self._calls_times = defaultdict(deque)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._get_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/api"
+
+    @property
+    def block_number(self) -> int:
+        return synthetic.get_block_number(max(self.histories.values(), default=0)) + 100
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _is_rate_limited(self, api_key: str) -> bool:
+        if self.calls_per_second is None:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            calls_times = self._calls_times[api_key]
+            while len(calls_times) and now - calls_times[0] > 1:
+                calls_times.popleft()
+            if len(calls_times) >= self.calls_per_second:
+                self.rate_limited += 1
+                return True
+            calls_times.append(now)
+            return False
+
+    def reply(self, params: Dict[str, str]) -> Dict:
+        """
+        Compute the JSON reply of a request
+
+        :param params: parameters of the request
+        :type params: Dict[str, str]
+        :return: JSON reply
+        :rtype: Dict
+        """
+        with self._lock:
+            self.calls += 1
+        if self._is_rate_limited(params.get('apikey', '')):
+            return {'status': '0', 'message': 'NOTOK', 'result': 'Max rate limit reached'}
+        module, action = params.get('module'), params.get('action')
+        if module == 'proxy' and action == 'eth_blockNumber':
+            return {'jsonrpc': '2.0', 'id': 83, 'result': hex(self.block_number)}
+        if module != 'account':
+            return {'status': '0', 'message': 'NOTOK', 'result': 'Error! Missing Or invalid Module name'}
+        if action == 'balance':
+            return {'status': '1', 'message': 'OK', 'result': str(10 ** 18)}
+        if action == 'balancemulti':
+            accounts = params.get('address', '').split(',')
+            return {'status': '1', 'message': 'OK',
+                    'result': [{'account': a, 'balance': str(10 ** 18 + i)} for i, a in enumerate(accounts)]}
+        if action not in ACTIONS:
+            return {'status': '0', 'message': 'NOTOK', 'result': 'Error! Missing Or invalid Action name'}
+        return self._reply_transactions(ACTIONS[action], params)
+
+    def _reply_transactions(self, tr_type: TRANSACTION, params: Dict[str, str]) -> Dict:
+        address = params.get('address', '').lower()
+        page = int(params.get('page') or 1)
+        offset = int(params.get('offset') or 10000)
+        if self.result_window is not None and page * offset > self.result_window:
+            return {'status': '0', 'message': 'NOTOK',
+                    'result': 'Result window is too large, PageNo x Offset size must be less than or equal to 10000'}
+
+        def to_int(value: Optional[str], default: int) -> int:
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                return default
+
+        n_rows = self.histories.get(address, 0)
+        last_block = self.block_number
+        start_index = synthetic.get_first_index(to_int(params.get('startblock'), 0))
+        end_index = min(n_rows, synthetic.get_first_index(to_int(params.get('endblock'), last_block) + 1))
+        contract_address = params.get('contractaddress', '').lower()
+        if contract_address:  # token transfers of a single contract, the whole range is filtered then paginated
+            result = [synthetic.get_transaction(address, tr_type, i, last_block) for i in range(start_index, end_index)]
+            result = [tx for tx in result if tx['contractAddress'] == contract_address]
+            result = result[(page - 1) * offset:page * offset]
+        else:
+            first = start_index + (page - 1) * offset
+            last = min(end_index, first + offset)
+            result = [synthetic.get_transaction(address, tr_type, i, last_block) for i in range(first, last)]
+        if not len(result):
+            return {'status': '0', 'message': 'No transactions found', 'result': []}
+        return {'status': '1', 'message': 'OK', 'result': result}
+
+    def _get_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                params = dict(parse_qsl(urlsplit(self.path).query, keep_blank_values=True))
+                body = json.dumps(stub.reply(params)).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
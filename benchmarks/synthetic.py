@@ -0,0 +1,123 @@
+"""
+Deterministic generator of synthetic address histories, shaped like the results of the scan APIs.
+The i-th transaction of a history is computed from its index only, so that histories of millions of rows can be
+served page by page or streamed to the database without being held in memory.
+"""
+import hashlib
+from typing import Dict, Iterator
+
+from ScanWatch.utils.enums import TRANSACTION
+
+START_BLOCK = 1000000
+TRANSACTIONS_PER_BLOCK = 3
+TOKENS = [
+    ('0x' + hashlib.sha1(f"token{i}".encode()).hexdigest(), f"Token {i}", f"TK{i}", str(6 + 6 * (i % 3)))
+    for i in range(20)
+]
+
+
+def _hex(seed: str, n_bytes: int) -> str:
+    digest = b''
+    counter = 0
+    while len(digest) < n_bytes:
+        digest += hashlib.sha256(f"{seed}:{counter}".encode()).digest()
+        counter += 1
+    return '0x' + digest[:n_bytes].hex()
+
+
+def get_block_number(index: int) -> int:
+    """
+    Return the block of the index-th transaction of a history
+    """
+    return START_BLOCK + index // TRANSACTIONS_PER_BLOCK
+
+
+def get_first_index(block_number: int) -> int:
+    """
+    Return the index of the first transaction at or after a block
+    """
+    return max(0, (block_number - START_BLOCK) * TRANSACTIONS_PER_BLOCK)
+
+
+def get_transaction(address: str, tr_type: TRANSACTION, index: int, last_block: int) -> Dict:
+    """
+    Return the index-th transaction of the history of an address
+
+    :param address: address of the history
+    :type address: str
+    :param tr_type: type of the transactions
+    :type tr_type: TRANSACTION
+    :param index: index of the transaction in the history
+    :type index: int
+    :param last_block: current block of the chain, used for the confirmations
+    :type last_block: int
+    :return: transaction as returned by the API
+    :rtype: Dict
+    """
+    seed = f"{address}:{tr_type.name}:{index}"
+    block_number = get_block_number(index)
+    counterparty = _hex(f"cp{index % 50}", 20)
+    incoming = index % 3 != 0 or index < 20
+    sender, receiver = (counterparty, address) if incoming else (address, counterparty)
+    common = {
+        'blockNumber': str(block_number),
+        'timeStamp': str(1500000000 + 13 * (block_number - START_BLOCK)),
+        'hash': _hex(seed, 32),
+        'from': sender,
+        'to': receiver,
+    }
+    if tr_type == TRANSACTION.INTERNAL:
+        return {**common,
+                'value': str(10 ** 15 * (index % 97 + 1)),
+                'contractAddress': '',
+                'input': '',
+                'type': 'call',
+                'gas': '2300',
+                'gasUsed': '0',
+                'traceId': f"0_{index % 4}",
+                'isError': '0',
+                'errCode': ''}
+    common.update({
+        'nonce': str(index),
+        'blockHash': _hex(f"block{block_number}", 32),
+        'transactionIndex': str(index % 200),
+        'gas': '200000',
+        'gasPrice': '30000000000',
+        'gasUsed': '51481',
+        'cumulativeGasUsed': '1491504',
+        'confirmations': str(max(0, last_block - block_number)),
+    })
+    if tr_type == TRANSACTION.NORMAL:
+        return {**common,
+                'value': str(10 ** 16 * (index % 89 + 1)),
+                'isError': '0',
+                'txreceipt_status': '1',
+                'input': '0xa9059cbb' + _hex(seed + 'input', 64)[2:],
+                'contractAddress': ''}
+    contract, name, symbol, decimal = TOKENS[index % len(TOKENS)]
+    token = {'contractAddress': contract, 'tokenName': name, 'tokenSymbol': symbol, 'tokenDecimal': decimal,
+             'input': 'deprecated'}
+    if tr_type == TRANSACTION.ERC20:
+        return {**common, **token, 'value': str(10 ** int(decimal) * (index % 13 + 1))}
+    # every nft is received only once, so they are all incoming
+    return {**common, **token, 'from': counterparty, 'to': address, 'tokenDecimal': '0', 'tokenID': str(index)}
+
+
+def generate_history(address: str, tr_type: TRANSACTION, n_rows: int, start_index: int = 0) -> Iterator[Dict]:
+    """
+    Yield the transactions of a synthetic history
+
+    :param address: address of the history
+    :type address: str
+    :param tr_type: type of the transactions
+    :type tr_type: TRANSACTION
+    :param n_rows: total number of transactions of the history
+    :type n_rows: int
+    :param start_index: index of the first transaction to yield
+    :type start_index: int
+    :return: transactions as returned by the API
+    :rtype: Iterator[Dict]
+    """
+    last_block = get_block_number(n_rows) + 100
+    for index in range(start_index, n_rows):
+        yield get_transaction(address, tr_type, index, last_block)
@@ -26,6 +26,9 @@ setup(
     long_description=long_description,
     long_description_content_type='text/x-rst',
     install_requires=requirements,
+    extras_require={
+        'archive': ['pyarrow>=7.0.0'],
+    },
     keywords='eth bsc polygon wallet save tracking history ethereum matic bnb tracker binance smartchain smart chain',
     classifiers=[
         'Intended Audience :: Developers',